@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from logistics.projection import ChampsDynamiquesMixin
+from logistics.live_positions import get_store
 from .models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     profile_photo_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -12,6 +14,21 @@ class UserSerializer(serializers.ModelSerializer):
             'current_lat', 'current_long'
         ]
         read_only_fields = ['id']
+        # Colonnes lues par les champs calculés (?fields= / ?exclude=, logistics/projection.py)
+        colonnes_champs = {'profile_photo_url': ('profile_photo',)}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'current_lat' not in data and 'current_long' not in data:
+            return data
+        # La position en base peut avoir jusqu'à un flush de retard sur la table live
+        position = get_store().read(instance.pk)
+        if position is not None:
+            for field, value in (('current_lat', position.lat), ('current_long', position.lng)):
+                if field in data:
+                    data[field] = self.fields[field].to_representation(round(value, 6))
+        return data
+
     def get_profile_photo_url(self, obj):
         
             if obj.profile_photo:
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # <-- DOIT ÊTRE EN PREMIER
     'django.middleware.security.SecurityMiddleware',
     'logistics.middleware.CleanUrlMiddleware',
+    'logistics.middleware.QueryBudgetMiddleware',  # actif en DEBUG (QUERY_BUDGET_ACTIF)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,6 +100,11 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Pagination par curseur des listes (logistics/pagination.py) : taille par défaut,
+# et pagination aussi des appels sans ?limit ni ?cursor (une fois les applis migrées)
+PAGINATION_TAILLE_PAGE = 50
+PAGINATION_PAR_DEFAUT = False
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -141,4 +147,87 @@ CORS_ALLOWED_ORIGINS = [
 
 # OPTIONAL: If you are in early development and want to allow EVERYTHING (React, Flutter, Mobile, etc):
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Positions live des livreurs (table mmap partagée entre les workers).
+# Par défaut à côté de la base : chaque base a sa propre table live.
+LIVE_POSITIONS_PATH = os.environ.get(
+    'LIVE_POSITIONS_PATH',
+    f"{DATABASES['default']['NAME']}.live_positions",
+)
+LIVE_POSITIONS_CAPACITY = 65536      # ids livreur couverts (les autres passent par la base)
+LIVE_POSITIONS_FLUSH_SECONDS = 30    # recopie write-behind vers User.current_lat/current_long
+
+# Flux SSE des positions (carte admin) : période d'envoi des deltas, en secondes
+LIVE_STREAM_INTERVALLE = 1.0
+LIVE_STREAM_INTERVALLE_MIN = 0.5
+
+# Tracking public en long-poll (?wait=) : désactivé par défaut, chaque attente occupant
+# un worker WSGI. Activé : attente maximale, période de vérification, débit par IP
+# et nombre d'attentes simultanées par worker.
+TRACKING_LONG_POLL_ACTIF = False
+TRACKING_LONG_POLL_MAX = 30
+TRACKING_LONG_POLL_PAS = 1.0
+TRACKING_LONG_POLL_DEBIT = '30/min'
+TRACKING_LONG_POLL_SIMULTANES = 4
+
+# Zone de service (lat_min, lng_min, lat_max, lng_max) : Rabat, Salé, Témara
+ZONE_BBOX = (33.85, -7.00, 34.10, -6.70)
+GRILLE_CELLULE_METRES = 500              # côté des cellules de l'index des livreurs
+GRILLE_RAFRAICHISSEMENT_SECONDES = 30    # reconstruction depuis la base + table live
+
+# Détection d'arrivée : rayon autour de l'adresse de livraison, durée de vie de l'index par livreur
+GEOFENCE_RAYON_METRES = 75
+GEOFENCE_CACHE_SECONDES = 60
+
+# Compaction des trajets (Douglas-Peucker, 0 = garder tous les points)
+TRAJET_TOLERANCE_METRES = 5.0
+# Fenêtre maximale d'une demande de trajectoire (admin), en heures
+TRAJET_FENETRE_MAX_HEURES = 7 * 24
+
+# Dispatch automatique : nombre maximal de commandes actives par livreur
+DISPATCH_CAPACITE_LIVREUR = 10
+DISPATCH_CRITERE = 'distance'    # ou 'duree' (profils de vitesse des ETA)
+DISPATCH_PASSES = 5              # réaffectations des colis écartés faute de place dans le véhicule
+# Dispatch lancé depuis l'API : hors de la requête (thread), sur les N commandes les plus
+# anciennes, un seul à la fois (verrou dans le cache, libéré au plus tard après DUREE_MAX s)
+DISPATCH_ARRIERE_PLAN = True
+DISPATCH_COMMANDES_MAX = 1000
+DISPATCH_DUREE_MAX = 600
+
+# Zones de vagues (k-means à capacité sur les commandes en attente)
+VAGUES_TAILLE_ZONE = 25           # commandes maximum par zone
+VAGUES_ITERATIONS = 30            # calcul depuis zéro
+VAGUES_ITERATIONS_INCREMENTALES = 3  # mise à jour depuis les zones enregistrées
+
+# tracking_id : compteur permuté par une clé (défaut : dérivée de SECRET_KEY), réservé par blocs
+# TRACKING_ID_CLE = os.environ.get('TRACKING_ID_CLE')
+TRACKING_ID_BLOC = 100
+# Connexion à part pour réserver le compteur hors de la transaction de l'appelant
+# (PostgreSQL, MySQL ; pas SQLite) : DATABASES['identifiants'] = dict(DATABASES['default'])
+# puis TRACKING_ID_BASE = 'identifiants'
+TRACKING_ID_BASE = None
+
+# Import / export de commandes (CSV / NDJSON)
+IMPORT_TAILLE_LOT = 500          # lignes validées par bulk_create
+IMPORT_ERREURS_MAX = 200         # erreurs détaillées dans le rapport
+EXPORT_TAILLE_LOT = 2000         # lignes lues par lot du curseur, et par morceau de la réponse
+
+# Budget de requêtes SQL par appel d'API (attribut query_budget des vues)
+QUERY_BUDGET_ACTIF = DEBUG
+QUERY_BUDGET_DEFAUT = 30
+QUERY_BUDGET_STRICT = False      # True : dépassement = exception (tests), sinon journalisé
+
+# Matrices de distances : mémoire de travail par bloc, cache LRU par worker
+DISTANCES_BLOC_OCTETS = 32 * 1024 * 1024
+DISTANCES_CACHE_OCTETS = 256 * 1024 * 1024
+
+# ETA : profils de vitesse par heure x zone (manage.py calculer_profils_vitesse)
+ETA_ZONE_METRES = 1000              # côté des zones de profil
+ETA_HISTORIQUE_JOURS = 28           # trajets pris en compte pour l'apprentissage
+ETA_SEGMENT_MAX_SECONDES = 600      # au-delà : trou de signal, segment ignoré
+ETA_LISSAGE_SECONDES = 600          # poids de la moyenne de l'heure pour les zones peu observées
+ETA_VITESSE_DEFAUT = 5.5            # m/s (~20 km/h) sans historique
+ETA_FACTEUR_DETOUR = 1.3            # distance routière / distance à vol d'oiseau
+ETA_ARRET_SECONDES = 180            # temps passé à chaque arrêt intermédiaire
+ETA_RAFRAICHISSEMENT_SECONDES = 300
\ No newline at end of file
@@ -52,7 +52,8 @@ from logistics.views_admin import (
     AdminCommandeViewSet
 )
 # Vos Vues (Logistics)
-from logistics.views import CommandeViewSet, PublicTrackingView, DriverLocationView
+from logistics.views import CommandeViewSet, PublicTrackingView, DriverLocationView, DriverLocationBatchView
+from logistics.views_stream import flux_positions_livreurs
 
 # Vos Vues (Authentication) - ATTENTION : Doivent exister dans authentication/views.py
 from authentication.views import TeamViewSet, UserProfileView
@@ -96,9 +97,16 @@ urlpatterns = [
     # 2. FEATURES SPÉCIFIQUES (Flutter/Public)
     # Mise à jour GPS (Livreur -> Serveur)
     path('api/driver/location/', DriverLocationView.as_view(), name='driver_location'),
+    # Mise à jour GPS par lot (points bufferisés par le téléphone)
+    path('api/driver/location/batch/', DriverLocationBatchView.as_view(), name='driver_location_batch'),
     # Tracking public (Client -> Serveur) - Pas besoin de login
     path('api/track/<str:tracking_id>/', PublicTrackingView.as_view(), name='public_tracking'),
 
+    # Flux SSE des positions pour la carte admin (avant le router : 'flux' n'est pas un id)
+    path('api/admin/livreurs/flux/', flux_positions_livreurs, name='admin-livreurs-flux'),
+    # Calendrier des livraisons (avant le router : 'calendar' n'est pas un id de commande)
+    path('api/commandes/calendar/', CalendarView.as_view(), name='calendar'),
+
     # 3. API PRINCIPALE (Router)
     # Inclut /api/commandes/ et /api/equipe/
     path('api/', include(router.urls)),
@@ -110,8 +118,6 @@ urlpatterns = [
     path('api/auth/change-password/', ChangePasswordView.as_view(), name='change_password'),
     path('api/auth/profile/photo/', ProfilePhotoView.as_view(), name='profile_photo'),
     path('api/driver/availability/', UpdateDriverAvailabilityView.as_view(), name='driver_availability'),
-    path('api/commandes/calendar/', CalendarView.as_view(), name='calendar'),
-    path('api/commandes/calendar/', CalendarView.as_view(), name='calendar'),
 # Modifie la ligne 99 comme ceci :
     path('api/admin/dashboard/stats/', AdminDashboardStatsView.as_view(), name='admin-stats'),
     path('api', include(router.urls)),
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Commande, Livreur
+from .recherche import filtrer, termes
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -11,7 +12,7 @@ class CommandeAdmin(admin.ModelAdmin):
     
     list_display = ('tracking_id', 'client_name', 'livreur', 'statut', 'date_livraison', 'date_creation')
     list_filter = ('statut', 'date_creation')
-    search_fields = ('tracking_id', 'client_name', 'client_phone')
+    search_fields = ('tracking_id', 'client_name', 'client_phone', 'adresse_text')
 
     fields = (
         'tracking_id', # Added to see it (read-only)
@@ -29,6 +30,13 @@ class CommandeAdmin(admin.ModelAdmin):
         'date_livraison', 'notes'
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Index plein texte (logistics/recherche.py) plutôt qu'un icontains par colonne ;
+        # search_fields ne sert plus qu'aux recherches de moins de 3 caractères
+        if not termes(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return filtrer(queryset, search_term), False
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "livreur":
             # ✅ FIX: Use 'role__iexact' to match 'LIVREUR', 'Livreur', or 'livreur'
@@ -0,0 +1,135 @@
+"""
+Assignation et réassignation de commandes en masse.
+
+Quel que soit le nombre de commandes, la validation coûte trois lectures
+(livreurs, commandes verrouillées, charge des véhicules) et l'application un bulk_update, un
+INSERT groupé de notifications et le reséquencement groupé des tournées
+concernées, le tout dans une seule transaction.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .capacite import surcharges
+from .geofence import invalider
+from .models import Commande
+from .tournees import optimiser_tournees
+from .utils import notify_drivers_assignment_bulk
+
+User = get_user_model()
+
+# Commandes qu'on peut encore (ré)assigner
+STATUTS_OUVERTS = (Commande.StatutChoices.EN_ATTENTE,) + Commande.STATUTS_ACTIFS
+
+
+class AffectationInvalide(Exception):
+    """ Au moins une affectation est refusée : rien n'a été modifié """
+
+    def __init__(self, erreurs):
+        super().__init__(erreurs)
+        self.erreurs = erreurs
+
+
+def appliquer_affectations(commandes, livreur_de):
+    """
+    Enregistre les nouvelles affectations des commandes (déjà chargées, et
+    verrouillées par l'appelant). Une commande en attente passe en 'Assignée',
+    les autres gardent leur statut ; l'arrivée éventuellement détectée pour
+    l'ancien livreur est effacée.
+
+    Returns:
+        Les commandes dont le livreur a effectivement changé
+    """
+    maintenant = timezone.now()
+    modifiees = []
+    livreurs = set()
+    for commande in commandes:
+        nouveau = livreur_de[commande.pk]
+        if commande.livreur_id == nouveau:
+            continue
+        livreurs.update((commande.livreur_id, nouveau))
+        commande.livreur_id = nouveau
+        if commande.statut == Commande.StatutChoices.EN_ATTENTE:
+            commande.statut = Commande.StatutChoices.ASSIGNEE
+        commande.ordre_tournee = 0
+        commande.date_arrivee = None
+        commande.date_modification = maintenant
+        modifiees.append(commande)
+
+    Commande.objects.bulk_update(
+        modifiees, ['livreur', 'statut', 'ordre_tournee', 'date_arrivee', 'date_modification'], batch_size=500
+    )
+    notify_drivers_assignment_bulk(modifiees)
+    livreurs.discard(None)
+    for livreur_id in livreurs:
+        invalider(livreur_id)
+    optimiser_tournees(livreurs)
+    return modifiees
+
+
+def _verifier_livreurs(livreur_ids):
+    """ (erreurs, {livreur_id: vehicle_info}) en une requête """
+    lignes = User.objects.filter(pk__in=livreur_ids).values_list('id', 'role', 'vehicle_info')
+    roles = {livreur_id: role for livreur_id, role, _ in lignes}
+    vehicules = {livreur_id: vehicule for livreur_id, _, vehicule in lignes}
+    erreurs = []
+    for livreur_id in livreur_ids:
+        if livreur_id not in roles:
+            erreurs.append({'livreur_id': livreur_id, 'error': 'Livreur introuvable'})
+        elif roles[livreur_id] != 'LIVREUR':
+            erreurs.append({'livreur_id': livreur_id, 'error': "Cet utilisateur n'est pas un livreur"})
+    return erreurs, vehicules
+
+
+def _verifier_capacite(commandes, livreur_de, vehicules):
+    """ Surcharges des véhicules si les commandes changent de livreur (une requête) """
+    ajouts = {}
+    for commande in commandes:
+        if commande.livreur_id != livreur_de[commande.pk]:
+            ajouts.setdefault(livreur_de[commande.pk], []).append(commande)
+    if not ajouts:
+        return []
+    deplacees = [commande.pk for liste in ajouts.values() for commande in liste]
+    return surcharges(vehicules, ajouts, exclure=deplacees)
+
+
+@transaction.atomic
+def assigner_commandes(livreur_de, forcer=False):
+    """
+    Applique {commande_id: livreur_id}. Tout ou rien : lève AffectationInvalide
+    si un livreur ou une commande est introuvable, si une commande est close
+    ou, sauf `forcer`, si un véhicule serait surchargé.
+    """
+    erreurs, vehicules = _verifier_livreurs(set(livreur_de.values()))
+    commandes = {
+        commande.pk: commande
+        for commande in Commande.objects.select_for_update().filter(pk__in=list(livreur_de))
+    }
+    for commande_id in livreur_de:
+        commande = commandes.get(commande_id)
+        if commande is None:
+            erreurs.append({'commande_id': commande_id, 'error': 'Commande introuvable'})
+        elif commande.statut not in STATUTS_OUVERTS:
+            erreurs.append({'commande_id': commande_id, 'error': f'Commande close ({commande.statut})'})
+    if not erreurs and not forcer:
+        erreurs = _verifier_capacite(commandes.values(), livreur_de, vehicules)
+    if erreurs:
+        raise AffectationInvalide(erreurs)
+    return appliquer_affectations(commandes.values(), livreur_de)
+
+
+@transaction.atomic
+def transferer_commandes(depuis_livreur_id, vers_livreur_id, forcer=False):
+    """ Transfère toutes les commandes ouvertes d'un livreur à un autre """
+    erreurs, vehicules = _verifier_livreurs({vers_livreur_id})
+    if erreurs:
+        raise AffectationInvalide(erreurs)
+    commandes = list(
+        Commande.objects.select_for_update().filter(livreur_id=depuis_livreur_id, statut__in=STATUTS_OUVERTS)
+    )
+    livreur_de = {commande.pk: vers_livreur_id for commande in commandes}
+    if not forcer:
+        erreurs = _verifier_capacite(commandes, livreur_de, vehicules)
+        if erreurs:
+            raise AffectationInvalide(erreurs)
+    return appliquer_affectations(commandes, livreur_de)
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def reparer_recherche(sender, using, **kwargs):
+    """
+    Triggers de l'index de recherche perdus quand une migration reconstruit la
+    table (SQLite) ; la présence de l'index, mise en cache, a pu changer
+    (migrate ou retour arrière avant 0022).
+    """
+    from .recherche import index_disponible, reparer_index
+    index_disponible.cache_clear()
+    reparer_index(using)
 
 
 class LogisticsConfig(AppConfig):
     name = 'logistics'
+
+    def ready(self):
+        post_migrate.connect(reparer_recherche, sender=self)
@@ -0,0 +1,191 @@
+"""
+Capacité des véhicules et chargement des livreurs.
+
+Chaque commande porte sa charge pré-calculée à l'enregistrement
+(Commande.charge_poids en kg, Commande.charge_volume en litres, tirés de
+`poids`, `dimensions` et `est_fragile`) ; chaque livreur a un profil de
+véhicule déduit des mots du texte libre `vehicle_info`. Vérifier qu'une commande
+rentre dans le véhicule d'un candidat revient à deux additions et deux
+comparaisons, la charge courante de tous les livreurs se lisant en une
+requête agrégée.
+
+Quand la charge dépasse le véhicule, `repartir` découpe les colis en
+voyages successifs (first-fit decreasing à deux dimensions).
+
+Les profils peuvent être redéfinis dans settings.VEHICULE_PROFILS.
+"""
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q, Sum
+
+from .models import Commande
+
+User = get_user_model()
+
+
+@dataclass(frozen=True)
+class ProfilVehicule:
+    nom: str
+    poids_max: float    # kg
+    volume_max: float   # litres
+
+
+# (mots de vehicle_info, profil) : le premier profil dont un mot figure dans le texte
+# l'emporte. Mots entiers seulement : 'motorbike' n'est pas 'bike', 'avant' pas 'van'.
+PROFILS_VEHICULES = [
+    (('vélo', 'velo', 'bike', 'bicyclette'), ProfilVehicule('velo', 10, 40)),
+    (('dokker', 'kangoo', 'partner', 'berlingo', 'camionnette', 'fourgon', 'van', 'utilitaire'),
+     ProfilVehicule('utilitaire', 600, 3000)),
+    (('voiture', 'auto', 'dacia', 'renault', 'peugeot'), ProfilVehicule('voiture', 250, 800)),
+    (('scooter', 'vespa', 'piaggio', 'moto', 'motorbike', 'yamaha', 'honda', 'suzuki', 'kawasaki'),
+     ProfilVehicule('moto', 30, 120)),
+]
+PROFIL_DEFAUT = ProfilVehicule('moto', 30, 120)
+
+# Volume (litres) des classes de colis saisies dans `dimensions`
+VOLUMES_CLASSES = {
+    'petit': 5.0,
+    'standard': 12.0,
+    'moyen': 20.0,
+    'grand': 50.0,
+    'xl': 100.0,
+}
+VOLUME_DEFAUT = VOLUMES_CLASSES['standard']
+POIDS_DEFAUT = 1.0
+# Un colis fragile ne supporte rien par-dessus : il occupe plus de place
+FACTEUR_FRAGILE = 1.5
+
+_NOMBRE = re.compile(r'\d+(?:[.,]\d+)?')
+_MOT = re.compile(r'\w+')
+
+
+def profil_vehicule(vehicle_info):
+    mots_texte = set(_MOT.findall((vehicle_info or '').lower()))
+    for mots, profil in getattr(settings, 'VEHICULE_PROFILS', PROFILS_VEHICULES):
+        if not mots_texte.isdisjoint(mots):
+            return profil
+    return PROFIL_DEFAUT
+
+
+def _poids_kg(poids):
+    if poids is None or poids == '':
+        return POIDS_DEFAUT
+    if isinstance(poids, (int, float, Decimal)):
+        return float(poids)
+    # Texte libre : '2 kg', '500 g', '1,5'
+    texte = str(poids).lower()
+    nombre = _NOMBRE.search(texte)
+    if nombre is None:
+        return POIDS_DEFAUT
+    valeur = float(nombre.group().replace(',', '.'))
+    return valeur / 1000 if re.search(r'\d\s*g\b', texte) else valeur
+
+
+def _volume_litres(dimensions):
+    texte = (dimensions or '').strip().lower()
+    if not texte:
+        return VOLUME_DEFAUT
+    if texte in VOLUMES_CLASSES:
+        return VOLUMES_CLASSES[texte]
+    # Dimensions explicites en cm : '40x30x20'
+    cotes = [float(n.replace(',', '.')) for n in _NOMBRE.findall(texte)]
+    if len(cotes) == 3:
+        return cotes[0] * cotes[1] * cotes[2] / 1000
+    for classe, volume in VOLUMES_CLASSES.items():
+        if classe in texte.split():
+            return volume
+    return VOLUME_DEFAUT
+
+
+def charge_colis(poids, dimensions, est_fragile=False):
+    """ (kg, litres) d'un colis à partir des champs saisis """
+    volume = _volume_litres(dimensions)
+    if est_fragile:
+        volume *= FACTEUR_FRAGILE
+    return round(_poids_kg(poids), 3), round(volume, 3)
+
+
+def charges_actives(livreur_ids, exclure=()):
+    """
+    {livreur_id: (kg, litres)} des commandes actives de chaque livreur,
+    en une requête agrégée (sans les commandes `exclure`).
+    """
+    actives = Q(commande__statut__in=Commande.STATUTS_ACTIFS)
+    if exclure:
+        actives &= ~Q(commande__pk__in=list(exclure))
+    lignes = User.objects.filter(pk__in=list(livreur_ids)).annotate(
+        kg=Sum('commande__charge_poids', filter=actives),
+        litres=Sum('commande__charge_volume', filter=actives),
+    ).values_list('id', 'kg', 'litres')
+    return {livreur_id: (kg or 0.0, litres or 0.0) for livreur_id, kg, litres in lignes}
+
+
+def rentre(profil, charge, ajout):
+    """ La charge + l'ajout tiennent-ils dans le véhicule ? (O(1)) """
+    return charge[0] + ajout[0] <= profil.poids_max and charge[1] + ajout[1] <= profil.volume_max
+
+
+def repartir(profil, colis):
+    """
+    Répartit des colis [(kg, litres)] en voyages (first-fit decreasing,
+    trié par la plus grande des deux dimensions relatives au véhicule).
+
+    Returns:
+        Liste de voyages, chacun liste d'indices dans `colis`. Un colis plus
+        gros que le véhicule forme un voyage à lui seul.
+    """
+    ordre = sorted(
+        range(len(colis)),
+        key=lambda i: max(colis[i][0] / profil.poids_max, colis[i][1] / profil.volume_max),
+        reverse=True,
+    )
+    voyages, charges = [], []
+    for i in ordre:
+        for v, charge in enumerate(charges):
+            if rentre(profil, charge, colis[i]):
+                voyages[v].append(i)
+                charges[v] = (charge[0] + colis[i][0], charge[1] + colis[i][1])
+                break
+        else:
+            voyages.append([i])
+            charges.append(colis[i])
+    return voyages
+
+
+def surcharges(livreurs, ajouts, exclure=()):
+    """
+    Vérifie qu'on peut ajouter des commandes aux véhicules des livreurs.
+
+    Args:
+        livreurs: {livreur_id: vehicle_info}
+        ajouts: {livreur_id: [Commande ou (kg, litres)]}
+        exclure: commandes déjà comptées chez leur livreur actuel et déplacées
+
+    Returns:
+        Liste d'erreurs (vide si tout rentre), une par livreur surchargé
+    """
+    charges = charges_actives(ajouts, exclure)
+    erreurs = []
+    for livreur_id, commandes in ajouts.items():
+        profil = profil_vehicule(livreurs.get(livreur_id))
+        colis = [
+            c if isinstance(c, tuple) else (c.charge_poids, c.charge_volume)
+            for c in commandes
+        ]
+        charge = charges.get(livreur_id, (0.0, 0.0))
+        total = (sum(kg for kg, _ in colis), sum(litres for _, litres in colis))
+        if not rentre(profil, charge, total):
+            deja = [charge] if charge != (0.0, 0.0) else []
+            erreurs.append({
+                'livreur_id': livreur_id,
+                'error': f'Capacité du véhicule dépassée ({profil.nom} : '
+                         f'{profil.poids_max:g} kg / {profil.volume_max:g} L)',
+                'charge_kg': round(charge[0] + total[0], 2),
+                'charge_litres': round(charge[1] + total[1], 2),
+                'voyages_necessaires': len(repartir(profil, deja + colis)),
+            })
+    return erreurs
@@ -0,0 +1,257 @@
+"""
+Dispatch automatique des commandes en attente.
+
+Toutes les commandes 'En attente' non assignées sont réparties d'un coup sur
+les livreurs disponibles en minimisant la distance totale livreur -> adresse.
+Chaque livreur offre DISPATCH_CAPACITE_LIVREUR places (moins ses commandes
+actives) : ses places sont des colonnes identiques de la matrice de coût, et
+l'affectation de coût minimal est résolue par scipy.optimize.linear_sum_assignment.
+Le coût est la distance, ou avec DISPATCH_CRITERE = 'duree' le temps de trajet
+estimé par les profils de vitesse des ETA (heure courante, zone de l'adresse).
+Le poids et le volume des colis sont ensuite confrontés au véhicule de chaque
+livreur (logistics/capacite.py).
+
+Le plan est appliqué dans une seule transaction (bulk_update), les livreurs
+sont notifiés en un seul INSERT et leurs tournées sont reséquencées en lot.
+
+Depuis l'API (lancer_dispatch), le dispatch tourne hors de la requête et porte
+sur les DISPATCH_COMMANDES_MAX commandes les plus anciennes ; son état est
+gardé dans le cache (partagé entre les workers si le cache l'est).
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from scipy.optimize import linear_sum_assignment
+
+from .affectations import appliquer_affectations
+from .distances import matrice_distances
+from .eta import matrice_durees
+from .capacite import profil_vehicule
+from .live_positions import get_store
+from .models import Commande
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+CLE_ETAT = 'logistics:dispatch:etat'
+CLE_VERROU = 'logistics:dispatch:verrou'
+
+
+@dataclass
+class PlanDispatch:
+    affectations: list = field(default_factory=list)  # (commande_id, livreur_id, distance_m)
+    non_assignees: list = field(default_factory=list)  # commande_id sans place disponible
+    duree_calcul: float = 0.0
+
+    @property
+    def distance_totale(self):
+        return sum(distance for _, _, distance in self.affectations)
+
+    def as_dict(self):
+        return {
+            'assignees': len(self.affectations),
+            'non_assignees': len(self.non_assignees),
+            'distance_totale_m': round(self.distance_totale),
+            'duree_calcul_s': round(self.duree_calcul, 3),
+            'plan': [
+                {'commande_id': c, 'livreur_id': l, 'distance_m': round(d)}
+                for c, l, d in self.affectations
+            ],
+            'commandes_non_assignees': self.non_assignees,
+        }
+
+
+def commandes_en_attente(limite=None):
+    """
+    (ids, lat, lng, kg, litres) des commandes à dispatcher, en une requête
+    (les `limite` plus anciennes si donné)
+    """
+    commandes = Commande.objects.filter(
+        statut=Commande.StatutChoices.EN_ATTENTE,
+        livreur__isnull=True,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude', 'charge_poids', 'charge_volume')
+    if limite is not None:
+        commandes = commandes.order_by('date_creation', 'id')[:limite]
+    lignes = list(commandes)
+    if not lignes:
+        vide = np.empty(0)
+        return np.empty(0, dtype=np.int64), vide, vide, vide, vide
+    ids, lat, lng, kg, litres = zip(*lignes)
+    return np.array(ids, dtype=np.int64), np.array(lat), np.array(lng), np.array(kg), np.array(litres)
+
+
+def livreurs_disponibles(capacite=None):
+    """
+    (ids, lat, lng, places, reste_kg, reste_litres) des livreurs disponibles
+    et localisés : places = commandes encore acceptables, reste = capacité
+    libre du véhicule. La position live prime sur celle de la base.
+    """
+    capacite = capacite or getattr(settings, 'DISPATCH_CAPACITE_LIVREUR', 10)
+    actives = Q(commande__statut__in=Commande.STATUTS_ACTIFS)
+    lignes = User.objects.filter(role='LIVREUR', is_available=True).annotate(
+        actives=Count('commande', filter=actives),
+        kg=Sum('commande__charge_poids', filter=actives),
+        litres=Sum('commande__charge_volume', filter=actives),
+    ).values_list('id', 'current_lat', 'current_long', 'actives', 'vehicle_info', 'kg', 'litres')
+
+    store = get_store()
+    ids, lat, lng, places, reste_kg, reste_litres = [], [], [], [], [], []
+    for livreur_id, db_lat, db_lng, actives, vehicule, kg, litres in lignes:
+        live = store.read(livreur_id)
+        if live is not None:
+            position = (live.lat, live.lng)
+        elif db_lat is not None and db_lng is not None:
+            position = (float(db_lat), float(db_lng))
+        else:
+            continue
+        if capacite - actives <= 0:
+            continue
+        profil = profil_vehicule(vehicule)
+        ids.append(livreur_id)
+        lat.append(position[0])
+        lng.append(position[1])
+        places.append(capacite - actives)
+        reste_kg.append(profil.poids_max - (kg or 0))
+        reste_litres.append(profil.volume_max - (litres or 0))
+    return (np.array(ids, dtype=np.int64), np.array(lat), np.array(lng),
+            np.array(places, dtype=np.int64), np.array(reste_kg), np.array(reste_litres))
+
+
+def calculer_plan(commandes, livreurs, critere='distance'):
+    """
+    Affectation globale de coût minimal.
+
+    Les places ne tiennent pas compte du poids ni du volume : chaque passe
+    tronque le plan véhicule par véhicule (commandes les moins coûteuses
+    d'abord), puis les commandes écartées sont réaffectées aux places et à
+    la capacité restantes, au plus DISPATCH_PASSES fois. Ce qui ne rentre
+    nulle part reste en attente.
+
+    Args:
+        commandes: (ids, lat, lng, kg, litres)
+        livreurs: (ids, lat, lng, places, reste_kg, reste_litres)
+        critere: 'distance' ou 'duree'
+    """
+    debut = time.perf_counter()
+    c_ids, c_lat, c_lng, c_kg, c_litres = commandes
+    l_ids, l_lat, l_lng, places, reste_kg, reste_litres = livreurs
+    plan = PlanDispatch()
+    if len(c_ids) == 0 or len(l_ids) == 0 or places.sum() == 0:
+        plan.non_assignees = c_ids.tolist()
+        plan.duree_calcul = time.perf_counter() - debut
+        return plan
+
+    distances = matrice_distances(c_lat, c_lng, l_lat, l_lng)
+    couts = matrice_durees(c_lat, c_lng, l_lat, l_lng) if critere == 'duree' else distances
+    # Coût prohibitif d'un colis qui ne rentre plus dans le véhicule
+    interdit = np.float32(couts.max() + 1) * len(c_ids)
+    places, kg, litres = places.copy(), reste_kg.copy(), reste_litres.copy()
+    assignees = np.zeros(len(c_ids), dtype=bool)
+
+    for _ in range(getattr(settings, 'DISPATCH_PASSES', 5)):
+        restantes = np.flatnonzero(~assignees)
+        if len(restantes) == 0 or places.sum() == 0:
+            break
+        cout = couts[restantes]
+        rentre = (c_kg[restantes, None] <= kg) & (c_litres[restantes, None] <= litres)
+        cout = np.where(rentre, cout, interdit)
+        # Une colonne par place : la colonne k appartient au livreur proprietaire[k]
+        proprietaire = np.repeat(np.arange(len(l_ids)), places)
+        lignes, colonnes = linear_sum_assignment(cout[:, proprietaire])
+
+        livreur_idx = proprietaire[colonnes]
+        progres = False
+        for k in np.lexsort((cout[lignes, livreur_idx], livreur_idx)).tolist():
+            i, j = restantes[lignes[k]], livreur_idx[k]
+            if c_kg[i] <= kg[j] and c_litres[i] <= litres[j]:
+                kg[j] -= c_kg[i]
+                litres[j] -= c_litres[i]
+                places[j] -= 1
+                assignees[i] = progres = True
+                plan.affectations.append((int(c_ids[i]), int(l_ids[j]), float(distances[i, j])))
+        if not progres:
+            break
+
+    plan.non_assignees = c_ids[~assignees].tolist()
+    plan.duree_calcul = time.perf_counter() - debut
+    return plan
+
+
+@transaction.atomic
+def appliquer_plan(plan):
+    """
+    Enregistre le plan en une transaction. Les commandes assignées ou modifiées
+    entre le calcul et l'application sont ignorées. Renvoie le nombre appliqué.
+    """
+    livreur_de = {commande_id: livreur_id for commande_id, livreur_id, _ in plan.affectations}
+    commandes = list(
+        Commande.objects.select_for_update().filter(
+            pk__in=list(livreur_de),
+            statut=Commande.StatutChoices.EN_ATTENTE,
+            livreur__isnull=True,
+        )
+    )
+    return len(appliquer_affectations(commandes, livreur_de))
+
+
+def dispatcher(appliquer=True, capacite=None, critere=None, limite=None):
+    """ Calcule (et applique) le plan de dispatch courant, sur `limite` commandes au plus """
+    critere = critere or getattr(settings, 'DISPATCH_CRITERE', 'distance')
+    plan = calculer_plan(commandes_en_attente(limite), livreurs_disponibles(capacite), critere)
+    if appliquer and plan.affectations:
+        appliquer_plan(plan)
+    return plan
+
+
+def etat_dispatch():
+    """ État du dernier dispatch lancé par lancer_dispatch (None : aucun) """
+    return cache.get(CLE_ETAT)
+
+
+def lancer_dispatch(critere=None):
+    """
+    Lance un dispatch réel hors de la requête : dans un thread du worker, ou
+    sur place si DISPATCH_ARRIERE_PLAN est faux (tests). Renvoie False si un
+    dispatch est déjà en cours.
+    """
+    if not cache.add(CLE_VERROU, True, getattr(settings, 'DISPATCH_DUREE_MAX', 600)):
+        return False
+    cache.set(CLE_ETAT, {'etat': 'en cours', 'debut': timezone.now().isoformat()}, None)
+    if getattr(settings, 'DISPATCH_ARRIERE_PLAN', True):
+        threading.Thread(target=_dispatch_thread, args=(critere,), name='dispatch-auto', daemon=True).start()
+    else:
+        _executer_dispatch(critere)
+    return True
+
+
+def _dispatch_thread(critere):
+    try:
+        _executer_dispatch(critere)
+    finally:
+        # Connexions ouvertes par ce thread
+        connections.close_all()
+
+
+def _executer_dispatch(critere):
+    etat = cache.get(CLE_ETAT) or {}
+    try:
+        plan = dispatcher(critere=critere, limite=getattr(settings, 'DISPATCH_COMMANDES_MAX', 1000))
+        etat.update({'etat': 'terminé', **plan.as_dict()})
+    except Exception as e:
+        logger.exception('Dispatch automatique en échec')
+        etat.update({'etat': 'erreur', 'erreur': str(e)})
+    finally:
+        etat['fin'] = timezone.now().isoformat()
+        cache.set(CLE_ETAT, etat, None)
+        cache.delete(CLE_VERROU)
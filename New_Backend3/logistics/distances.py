@@ -0,0 +1,184 @@
+"""
+Matrices de distances haversine (mètres) pour le dispatch, les tournées,
+les ETA et le clustering.
+
+Calcul vectorisé NumPy en float32 par défaut, par blocs de lignes : la
+mémoire de travail est bornée par DISTANCES_BLOC_OCTETS quelle que soit la
+taille des entrées (seule la matrice résultat est allouée en entier).
+Les angles sont centrés sur une référence commune avant le passage en
+float32 : les différences restent précises au centimètre à l'échelle d'une
+ville, au lieu de ~0,4 m avec des radians absolus.
+
+Les matrices des ensembles de points stables (adresses du jour, arrêts d'une
+tournée) sont gardées dans un cache LRU par worker, borné en octets
+(DISTANCES_CACHE_OCTETS) et indexé par l'empreinte des coordonnées.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .geo import RAYON_TERRE_METRES
+
+
+def _bloc_octets():
+    return getattr(settings, 'DISTANCES_BLOC_OCTETS', 32 * 1024 * 1024)
+
+
+def _angles(lat, lng, reference, dtype):
+    """ (phi - phi_ref, lambda - lambda_ref, cos phi) dans le dtype de calcul """
+    phi = np.radians(np.asarray(lat, dtype=np.float64).ravel())
+    lam = np.radians(np.asarray(lng, dtype=np.float64).ravel())
+    return (phi - reference[0]).astype(dtype), (lam - reference[1]).astype(dtype), np.cos(phi).astype(dtype)
+
+
+def blocs_distances(lat1, lng1, lat2=None, lng2=None, dtype=np.float32, taille_bloc=None):
+    """
+    Génère (debut, bloc) : bloc = distances des lignes debut..debut+len(bloc)
+    de la matrice (len(lat1), len(lat2)). Le tampon est réutilisé d'un bloc
+    à l'autre : le copier pour le conserver.
+
+    Permet les réductions (min, argmin, comptage sous un rayon) sans jamais
+    matérialiser la matrice complète.
+    """
+    if lat2 is None:
+        lat2, lng2 = lat1, lng1
+    lat1 = np.asarray(lat1, dtype=np.float64).ravel()
+    lng1 = np.asarray(lng1, dtype=np.float64).ravel()
+    n = len(lat1)
+    m = len(np.asarray(lat2).ravel())
+    if n == 0 or m == 0:
+        return
+
+    reference = (np.radians(np.mean(lat1)), np.radians(np.mean(lng1)))
+    phi1, lam1, cos1 = _angles(lat1, lng1, reference, dtype)
+    phi2, lam2, cos2 = _angles(lat2, lng2, reference, dtype)
+    itemsize = np.dtype(dtype).itemsize
+    if taille_bloc is None:
+        # Deux tampons (bloc, m) : le résultat et un terme intermédiaire
+        taille_bloc = max(1, _bloc_octets() // (2 * m * itemsize))
+    taille_bloc = min(taille_bloc, n)
+
+    bloc = np.empty((taille_bloc, m), dtype=dtype)
+    tampon = np.empty((taille_bloc, m), dtype=dtype)
+    demi = dtype(0.5)
+    deux_r = dtype(2 * RAYON_TERRE_METRES)
+    for debut in range(0, n, taille_bloc):
+        fin = min(debut + taille_bloc, n)
+        a, t = bloc[:fin - debut], tampon[:fin - debut]
+        # a = sin²(dphi/2)
+        np.subtract(phi2[None, :], phi1[debut:fin, None], out=a)
+        a *= demi
+        np.sin(a, out=a)
+        np.square(a, out=a)
+        # t = cos phi1 . cos phi2 . sin²(dlambda/2)
+        np.subtract(lam2[None, :], lam1[debut:fin, None], out=t)
+        t *= demi
+        np.sin(t, out=t)
+        np.square(t, out=t)
+        t *= cos1[debut:fin, None]
+        t *= cos2[None, :]
+        a += t
+        np.clip(a, 0, 1, out=a)
+        np.sqrt(a, out=a)
+        np.arcsin(a, out=a)
+        a *= deux_r
+        yield debut, a
+
+
+def matrice_distances(lat1, lng1, lat2=None, lng2=None, dtype=np.float32, taille_bloc=None):
+    """
+    Matrice des distances (mètres) de forme (len(lat1), len(lat2)).
+    Sans second ensemble : distances entre les points du premier.
+    """
+    n = len(np.asarray(lat1).ravel())
+    m = n if lat2 is None else len(np.asarray(lat2).ravel())
+    out = np.empty((n, m), dtype=dtype)
+    for debut, bloc in blocs_distances(lat1, lng1, lat2, lng2, dtype=dtype, taille_bloc=taille_bloc):
+        out[debut:debut + len(bloc)] = bloc
+    return out
+
+
+class CacheMatrices:
+    """ LRU de matrices en lecture seule, borné en octets """
+
+    def __init__(self, capacite_octets):
+        self.capacite_octets = capacite_octets
+        self.octets = 0
+        self.hits = 0
+        self.misses = 0
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entrees)
+
+    @staticmethod
+    def cle(*tableaux, dtype=np.float32):
+        """ Empreinte des coordonnées (et de leur forme) + dtype du résultat """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(np.dtype(dtype).str.encode())
+        for tableau in tableaux:
+            tableau = np.ascontiguousarray(tableau, dtype=np.float64)
+            h.update(np.int64(tableau.size).tobytes())
+            h.update(tableau.tobytes())
+        return h.hexdigest()
+
+    def get(self, cle):
+        with self._lock:
+            matrice = self._entrees.get(cle)
+            if matrice is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return matrice
+
+    def put(self, cle, matrice):
+        matrice.setflags(write=False)
+        if matrice.nbytes > self.capacite_octets:
+            return
+        with self._lock:
+            ancienne = self._entrees.pop(cle, None)
+            if ancienne is not None:
+                self.octets -= ancienne.nbytes
+            self._entrees[cle] = matrice
+            self.octets += matrice.nbytes
+            while self.octets > self.capacite_octets:
+                _, evincee = self._entrees.popitem(last=False)
+                self.octets -= evincee.nbytes
+
+    def vider(self):
+        with self._lock:
+            self._entrees.clear()
+            self.octets = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CacheMatrices(getattr(settings, 'DISTANCES_CACHE_OCTETS', 256 * 1024 * 1024))
+    return _cache
+
+
+def matrice_cachee(lat1, lng1, lat2=None, lng2=None, dtype=np.float32):
+    """
+    Comme matrice_distances, via le cache LRU. La matrice renvoyée est en
+    lecture seule (partagée entre appelants) : la copier pour la modifier.
+    """
+    cache = get_cache()
+    tableaux = (lat1, lng1) if lat2 is None else (lat1, lng1, lat2, lng2)
+    cle = cache.cle(*tableaux, dtype=dtype)
+    matrice = cache.get(cle)
+    if matrice is None:
+        matrice = matrice_distances(lat1, lng1, lat2, lng2, dtype=dtype)
+        cache.put(cle, matrice)
+    return matrice
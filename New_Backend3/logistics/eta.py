@@ -0,0 +1,261 @@
+"""
+Estimation de l'heure d'arrivée (ETA) des commandes.
+
+Temps restant = somme, le long de la tournée du livreur (position courante
+puis arrêts dans l'ordre ordre_tournee jusqu'à la commande), de
+distance haversine x ETA_FACTEUR_DETOUR / vitesse(heure, zone), plus
+ETA_ARRET_SECONDES par arrêt intermédiaire.
+
+Les vitesses viennent de ProfilVitesse, table (heure de la journée x zone)
+apprise sur les trajets GPS des livreurs (points bruts et trajets compactés)
+par `manage.py calculer_profils_vitesse`. Une zone peu observée est lissée
+vers la moyenne de son heure, elle-même lissée vers la moyenne globale.
+La table est chargée en mémoire par chaque worker : une ETA coûte une
+requête (les arrêts du livreur) et quelques opérations par arrêt.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .distances import matrice_distances
+from .geo import METRES_PAR_DEGRE, RAYON_TERRE_METRES, haversine_m
+from .models import Commande, PositionLivreur, ProfilVitesse, TrajetCompresse
+from .trajets import decoder
+
+HEURES = 24
+
+
+class Zones:
+    """ Découpage de la zone de service en cellules ; indice `nb` = hors zone """
+
+    def __init__(self, bbox, cellule_metres):
+        self.lat_min, self.lng_min, self.lat_max, self.lng_max = bbox
+        cos_lat = math.cos(math.radians((self.lat_min + self.lat_max) / 2))
+        self.dlat = cellule_metres / METRES_PAR_DEGRE
+        self.dlng = cellule_metres / (METRES_PAR_DEGRE * cos_lat)
+        self.nlat = max(1, math.ceil((self.lat_max - self.lat_min) / self.dlat))
+        self.nlng = max(1, math.ceil((self.lng_max - self.lng_min) / self.dlng))
+        self.nb = self.nlat * self.nlng
+
+    def zone(self, lat, lng):
+        i = int((lat - self.lat_min) // self.dlat)
+        j = int((lng - self.lng_min) // self.dlng)
+        if 0 <= i < self.nlat and 0 <= j < self.nlng:
+            return i * self.nlng + j
+        return self.nb
+
+    def zones(self, lat, lng):
+        """ Version vectorisée de zone() """
+        i = np.floor((np.asarray(lat) - self.lat_min) / self.dlat).astype(np.int64)
+        j = np.floor((np.asarray(lng) - self.lng_min) / self.dlng).astype(np.int64)
+        dedans = (i >= 0) & (i < self.nlat) & (j >= 0) & (j < self.nlng)
+        return np.where(dedans, i * self.nlng + j, self.nb)
+
+
+def get_zones():
+    return Zones(settings.ZONE_BBOX, getattr(settings, 'ETA_ZONE_METRES', 1000))
+
+
+# --- Apprentissage des profils ---
+
+def _cumuler(t_s, lat, lng, zones, distance, duree):
+    """
+    Ajoute les segments consécutifs d'un trajet (triés par temps) aux cumuls
+    distance/durée par (heure, zone du milieu du segment).
+    """
+    if len(t_s) < 2:
+        return
+    phi = np.radians(lat)
+    s_phi = np.sin(np.diff(phi) / 2)
+    s_lam = np.sin(np.diff(np.radians(lng)) / 2)
+    a = s_phi ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * s_lam ** 2
+    d = 2 * RAYON_TERRE_METRES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    dt = np.diff(t_s)
+
+    # Trous (perte de signal) et longs arrêts (livraison, pause) ne sont pas du roulage
+    gardes = (dt > 0) & (dt <= getattr(settings, 'ETA_SEGMENT_MAX_SECONDES', 600))
+    gardes &= ~((dt > 60) & (d < dt * 0.5))
+    if not gardes.any():
+        return
+
+    # Décalage horaire constant sur la journée
+    decalage = timezone.localtime(datetime.fromtimestamp(t_s[0], tz=dt_timezone.utc)).utcoffset()
+    heure = ((t_s[:-1] + decalage.total_seconds()) // 3600 % HEURES).astype(np.int64)
+    zone = zones.zones((lat[:-1] + lat[1:]) / 2, (lng[:-1] + lng[1:]) / 2)
+    indices = (heure * (zones.nb + 1) + zone)[gardes]
+    taille = HEURES * (zones.nb + 1)
+    distance += np.bincount(indices, weights=d[gardes], minlength=taille)
+    duree += np.bincount(indices, weights=dt[gardes], minlength=taille)
+
+
+def calculer_profils(depuis=None):
+    """
+    Vitesses (HEURES x nb+1, m/s) et secondes observées par (heure, zone),
+    sur les trajets bruts et compactés depuis `depuis`
+    (défaut : ETA_HISTORIQUE_JOURS jours).
+    """
+    if depuis is None:
+        depuis = timezone.now() - timedelta(days=getattr(settings, 'ETA_HISTORIQUE_JOURS', 28))
+    zones = get_zones()
+    distance = np.zeros(HEURES * (zones.nb + 1))
+    duree = np.zeros(HEURES * (zones.nb + 1))
+
+    lignes = (
+        PositionLivreur.objects.filter(timestamp__gte=depuis)
+        .order_by('livreur_id', 'timestamp')
+        .values_list('livreur_id', 'jour', 'timestamp', 'latitude', 'longitude')
+        .iterator(chunk_size=10_000)
+    )
+    for _, points in groupby(lignes, key=lambda ligne: (ligne[0], ligne[1])):
+        points = list(points)
+        t_s = np.array([p[2].timestamp() for p in points])
+        lat = np.array([p[3] for p in points], dtype=np.float64)
+        lng = np.array([p[4] for p in points], dtype=np.float64)
+        _cumuler(t_s, lat, lng, zones, distance, duree)
+
+    blobs = (
+        TrajetCompresse.objects.filter(fin__gte=depuis)
+        .values_list('donnees', flat=True)
+        .iterator(chunk_size=100)
+    )
+    for blob in blobs:
+        t_ms, lat, lng = decoder(blob)
+        _cumuler(t_ms / 1000, lat, lng, zones, distance, duree)
+
+    distance = distance.reshape(HEURES, zones.nb + 1)
+    duree = duree.reshape(HEURES, zones.nb + 1)
+    lissage = getattr(settings, 'ETA_LISSAGE_SECONDES', 600)
+    defaut = getattr(settings, 'ETA_VITESSE_DEFAUT', 5.5)
+    total = duree.sum()
+    globale = (distance.sum() + lissage * defaut) / (total + lissage)
+    par_heure = (distance.sum(axis=1) + lissage * globale) / (duree.sum(axis=1) + lissage)
+    vitesse = (distance + lissage * par_heure[:, None]) / (duree + lissage)
+    return vitesse, duree
+
+
+@transaction.atomic
+def enregistrer_profils(vitesse, secondes):
+    ProfilVitesse.objects.all().delete()
+    ProfilVitesse.objects.bulk_create([
+        ProfilVitesse(heure=heure, zone=zone, vitesse=float(vitesse[heure, zone]),
+                      secondes_observees=float(secondes[heure, zone]))
+        for heure in range(vitesse.shape[0])
+        for zone in range(vitesse.shape[1])
+    ], batch_size=1000)
+    invalider_profils()
+
+
+# --- Table de lookup ---
+
+_table = None
+_table_date = 0.0
+_table_lock = threading.Lock()
+
+
+def charger_table(zones):
+    """ Table (HEURES, nb+1) des vitesses ; vitesse par défaut sans profils calculés """
+    table = np.full((HEURES, zones.nb + 1), getattr(settings, 'ETA_VITESSE_DEFAUT', 5.5))
+    lignes = list(ProfilVitesse.objects.values_list('heure', 'zone', 'vitesse'))
+    # Profils calculés avec un autre découpage (réglages modifiés) : ignorés
+    if lignes and max(zone for _, zone, _ in lignes) == zones.nb:
+        heures, zs, vitesses = (np.array(colonne) for colonne in zip(*lignes))
+        table[heures, zs] = vitesses
+    return table
+
+
+def get_table():
+    global _table, _table_date
+    delai = getattr(settings, 'ETA_RAFRAICHISSEMENT_SECONDES', 300)
+    if _table is None or time.monotonic() - _table_date > delai:
+        with _table_lock:
+            if _table is None or time.monotonic() - _table_date > delai:
+                zones = get_zones()
+                _table = (zones, charger_table(zones))
+                _table_date = time.monotonic()
+    return _table
+
+
+def invalider_profils():
+    global _table
+    _table = None
+
+
+def vitesse_attendue(lat, lng, moment):
+    """ Vitesse (m/s) attendue au point à l'instant `moment` """
+    zones, table = get_table()
+    return table[timezone.localtime(moment).hour, zones.zone(lat, lng)]
+
+
+def duree_trajet(lat1, lng1, lat2, lng2, moment):
+    """ Secondes estimées pour aller du point 1 au point 2 en partant à `moment` """
+    distance = haversine_m(lat1, lng1, lat2, lng2) * getattr(settings, 'ETA_FACTEUR_DETOUR', 1.3)
+    return distance / vitesse_attendue((lat1 + lat2) / 2, (lng1 + lng2) / 2, moment)
+
+
+def matrice_durees(lat1, lng1, lat2, lng2, moment=None):
+    """
+    Durées de trajet (s) entre deux séries de points, forme (len(lat1), len(lat2)),
+    à la vitesse de la zone des points de la première série (les destinations).
+    """
+    zones, table = get_table()
+    heure = timezone.localtime(moment or timezone.now()).hour
+    vitesses = table[heure, zones.zones(lat1, lng1)].astype(np.float32)
+    durees = matrice_distances(lat1, lng1, lat2, lng2)
+    durees *= np.float32(getattr(settings, 'ETA_FACTEUR_DETOUR', 1.3))
+    durees /= vitesses[:, None]
+    return durees
+
+
+def eta_commande(commande, position, maintenant=None):
+    """
+    ETA d'une commande active, le long de la tournée de son livreur.
+
+    Args:
+        commande: Commande (livreur_id, statut, coordonnées, date_arrivee)
+        position: (lat, lng) courante du livreur
+
+    Returns:
+        dict { eta, secondes, distance_m, arrets_avant } ou None si non estimable
+    """
+    from .tournees import commandes_tournee
+
+    if (commande.statut not in Commande.STATUTS_ACTIFS or not commande.livreur_id
+            or commande.latitude is None or commande.longitude is None
+            or position is None or position[0] is None or position[1] is None):
+        return None
+    maintenant = maintenant or timezone.now()
+    if commande.date_arrivee is not None:
+        return {'eta': maintenant, 'secondes': 0, 'distance_m': 0, 'arrets_avant': 0}
+
+    arrets = list(commandes_tournee(commande.livreur_id).filter(
+        date_arrivee__isnull=True, latitude__isnull=False, longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude'))
+    ids = [commande_id for commande_id, _, _ in arrets]
+    # Arrêts intermédiaires, puis la commande elle-même
+    etapes = arrets[:ids.index(commande.pk)] if commande.pk in ids else []
+    etapes.append((commande.pk, commande.latitude, commande.longitude))
+
+    pause = getattr(settings, 'ETA_ARRET_SECONDES', 180)
+    detour = getattr(settings, 'ETA_FACTEUR_DETOUR', 1.3)
+    lat0, lng0 = float(position[0]), float(position[1])
+    moment = maintenant
+    distance = 0.0
+    for rang, (_, lat, lng) in enumerate(etapes):
+        if rang:
+            moment += timedelta(seconds=pause)
+        moment += timedelta(seconds=duree_trajet(lat0, lng0, lat, lng, moment))
+        distance += haversine_m(lat0, lng0, lat, lng) * detour
+        lat0, lng0 = lat, lng
+    return {
+        'eta': moment,
+        'secondes': round((moment - maintenant).total_seconds()),
+        'distance_m': round(distance),
+        'arrets_avant': len(etapes) - 1,
+    }
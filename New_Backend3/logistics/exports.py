@@ -0,0 +1,106 @@
+"""
+Export en flux des commandes (CSV ou NDJSON), pour la comptabilité.
+
+Les lignes passent par le chemin rapide des listes (logistics/listes.py :
+values_list, nom du livreur en SQL, mêmes champs et mêmes formats que l'API)
+et sont lues avec .iterator(chunk_size=EXPORT_TAILLE_LOT) : le curseur est
+parcouru par lots, rien n'est gardé d'un lot à l'autre, et chaque lot devient
+un morceau de la StreamingHttpResponse. La mémoire ne dépend donc pas du
+nombre de commandes. L'en-tête CSV part avant l'exécution de la requête :
+le premier octet arrive tout de suite, même sur une très grosse table.
+
+CSV : séparateur ',', BOM UTF-8 (accents lisibles dans Excel, relu tel quel
+par l'import), cellule vide pour une valeur nulle.
+NDJSON : un objet JSON par ligne, les mêmes que dans la liste de l'API.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.utils.text import compress_sequence
+
+from .imports import FormatInvalide
+from .listes import commandes_rapides
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def format_export(sortie):
+    if sortie not in FORMATS:
+        raise FormatInvalide(f"Format inconnu : {sortie} (csv ou ndjson)")
+    return sortie
+
+
+def _par_lots(objets, taille, premier=100):
+    """ Lots de `taille` objets ; le premier est petit pour que le premier octet parte vite """
+    lot, limite = [], min(premier, taille)
+    for objet in objets:
+        lot.append(objet)
+        if len(lot) >= limite:
+            yield lot
+            lot, limite = [], taille
+    if lot:
+        yield lot
+
+
+def morceaux_csv(objets, cles, taille):
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    writer.writerow(cles)
+    yield '\ufeff' + tampon.getvalue()
+    for lot in _par_lots(objets, taille):
+        tampon.seek(0)
+        tampon.truncate()
+        writer.writerows([['' if valeur is None else valeur for valeur in objet.values()] for objet in lot])
+        yield tampon.getvalue()
+
+
+def morceaux_ndjson(objets, taille):
+    for lot in _par_lots(objets, taille):
+        yield ''.join(json.dumps(objet, ensure_ascii=False) + '\n' for objet in lot)
+
+
+def accepte_gzip(accept_encoding):
+    """
+    L'en-tête Accept-Encoding autorise-t-il gzip ? Chaque codage a sa qualité
+    (q, 1 par défaut) : 'gzip;q=0' le refuse, '*' le couvre s'il n'est pas cité.
+    """
+    qualites = {}
+    for element in (accept_encoding or '').split(','):
+        codage, _, params = element.partition(';')
+        codage = codage.strip().lower()
+        if not codage:
+            continue
+        qualite = 1.0
+        for param in params.split(';'):
+            nom, _, valeur = param.partition('=')
+            if nom.strip().lower() == 'q':
+                try:
+                    qualite = float(valeur)
+                except ValueError:
+                    qualite = 0.0
+        qualites[codage] = qualite
+    for codage in ('gzip', 'x-gzip', '*'):
+        if codage in qualites:
+            return qualites[codage] > 0
+    return False
+
+
+def exporter_commandes(queryset, sortie, champs=None, gzip=False):
+    """
+    Corps de l'export (générateur d'octets) des commandes du queryset,
+    restreintes aux `champs` (?fields= / ?exclude=) si donnés.
+    """
+    taille = getattr(settings, 'EXPORT_TAILLE_LOT', 2000)
+    lignes = commandes_rapides.lignes(queryset, champs).iterator(chunk_size=taille)
+    objets = commandes_rapides.iterer(lignes, champs)
+    if sortie == 'csv':
+        morceaux = morceaux_csv(objets, commandes_rapides.cles(champs), taille)
+    else:
+        morceaux = morceaux_ndjson(objets, taille)
+    octets = (morceau.encode() for morceau in morceaux)
+    return compress_sequence(octets) if gzip else octets
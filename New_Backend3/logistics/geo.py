@@ -0,0 +1,16 @@
+"""
+Outils géographiques partagés (distances, zone de service).
+"""
+from math import asin, cos, radians, sin, sqrt
+
+RAYON_TERRE_METRES = 6_371_000.0
+METRES_PAR_DEGRE = 111_320.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """ Distance orthodromique en mètres entre deux points (degrés) """
+    phi1, phi2 = radians(lat1), radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = radians(lng2 - lng1)
+    a = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlmb / 2) ** 2
+    return 2 * RAYON_TERRE_METRES * asin(sqrt(a))
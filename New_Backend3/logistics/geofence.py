@@ -0,0 +1,126 @@
+"""
+Détection automatique d'arrivée par geofence.
+
+Chaque commande active d'un livreur (Assignée / En cours / En livraison,
+avec coordonnées) est entourée d'un cercle de GEOFENCE_RAYON_METRES. Chaque
+point GPS reçu n'est testé que contre les arrêts de CE livreur, tenus dans
+un index en mémoire par worker : le test coûte quelques microsecondes et
+aucune requête, sauf au (re)chargement de l'index du livreur
+(toutes les GEOFENCE_CACHE_SECONDES au plus, ou après modification d'une
+de ses commandes par ce worker).
+
+A l'entrée dans le cercle, Commande.date_arrivee est renseignée et le signal
+`livreur_arrive` est émis.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .geo import RAYON_TERRE_METRES
+
+# Arguments : commande_id, livreur_id, timestamp
+livreur_arrive = Signal()
+
+_arrets = {}   # livreur_id -> (expiration, [(commande_id, phi, lambda, cos phi)])
+_lock = threading.Lock()
+
+
+def _seuil(rayon_metres):
+    """ Terme de haversine correspondant au rayon (comparaison sans asin/sqrt) """
+    return math.sin(rayon_metres / (2 * RAYON_TERRE_METRES)) ** 2
+
+
+def _charger(livreur_id):
+    from .models import Commande
+
+    lignes = Commande.objects.filter(
+        livreur_id=livreur_id,
+        statut__in=Commande.STATUTS_ACTIFS,
+        date_arrivee__isnull=True,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude')
+    arrets = []
+    for commande_id, lat, lng in lignes:
+        phi = math.radians(lat)
+        arrets.append((commande_id, phi, math.radians(lng), math.cos(phi)))
+    return arrets
+
+
+def arrets_livreur(livreur_id):
+    """ Arrêts actifs du livreur (index du worker, rechargé à expiration) """
+    entree = _arrets.get(livreur_id)
+    if entree is None or entree[0] < time.monotonic():
+        arrets = _charger(livreur_id)
+        delai = getattr(settings, 'GEOFENCE_CACHE_SECONDES', 60)
+        with _lock:
+            _arrets[livreur_id] = (time.monotonic() + delai, arrets)
+        return arrets
+    return entree[1]
+
+
+def invalider(livreur_id):
+    """ A appeler quand les commandes d'un livreur changent """
+    if livreur_id is not None:
+        with _lock:
+            _arrets.pop(livreur_id, None)
+
+
+def verifier_arrivees(livreur_id, fixes):
+    """
+    Teste les points (triés ou non) d'un livreur contre ses arrêts actifs.
+    Renvoie la liste des commande_id dont l'arrivée vient d'être enregistrée.
+    """
+    arrets = arrets_livreur(livreur_id)
+    if not arrets:
+        return []
+
+    seuil = _seuil(getattr(settings, 'GEOFENCE_RAYON_METRES', 75))
+    sin, cos, radians = math.sin, math.cos, math.radians
+    arrivees = {}
+    for fix in sorted(fixes, key=lambda f: f['timestamp']):
+        phi1 = radians(fix['lat'])
+        lam1 = radians(fix['lng'])
+        cos1 = cos(phi1)
+        for commande_id, phi2, lam2, cos2 in arrets:
+            if commande_id in arrivees:
+                continue
+            s_phi = sin((phi2 - phi1) * 0.5)
+            s_lam = sin((lam2 - lam1) * 0.5)
+            if s_phi * s_phi + cos1 * cos2 * s_lam * s_lam <= seuil:
+                arrivees[commande_id] = fix['timestamp']
+
+    if arrivees:
+        return _enregistrer(livreur_id, arrivees)
+    return []
+
+
+def _enregistrer(livreur_id, arrivees):
+    from .models import Commande
+
+    with _lock:
+        entree = _arrets.get(livreur_id)
+        if entree is not None:
+            restants = [a for a in entree[1] if a[0] not in arrivees]
+            _arrets[livreur_id] = (entree[0], restants)
+
+    maintenant = timezone.now()
+    marquees = []
+    for commande_id, timestamp in arrivees.items():
+        # La base fait foi : l'index du worker peut avoir jusqu'à GEOFENCE_CACHE_SECONDES de retard
+        marquee = Commande.objects.filter(
+            pk=commande_id,
+            livreur_id=livreur_id,
+            statut__in=Commande.STATUTS_ACTIFS,
+            date_arrivee__isnull=True,
+        ).update(date_arrivee=timestamp, date_modification=maintenant)
+        if marquee:
+            marquees.append(commande_id)
+            livreur_arrive.send(
+                sender=Commande, commande_id=commande_id, livreur_id=livreur_id, timestamp=timestamp
+            )
+    return marquees
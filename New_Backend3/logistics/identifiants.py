@@ -0,0 +1,174 @@
+"""
+Allocation des tracking_id des commandes (format LIV-ABC12345).
+
+Chaque identifiant est l'image d'un compteur par une permutation secrète
+de l'espace des 26^3 x 10^5 identifiants : réseau de Feistel à clé sur
+32 bits, ramené à l'espace par cycle-walking (on réapplique la permutation
+tant que le résultat sort de l'espace). Deux compteurs distincts donnent
+deux identifiants distincts : aucune vérification en base n'est nécessaire,
+et sans la clé les identifiants ne se devinent pas les uns des autres.
+
+Le compteur vit en base (CompteurIdentifiant) et se réserve par blocs :
+chaque worker prend TRACKING_ID_BLOC valeurs d'un coup pour ses save(),
+un bulk_create réserve exactement ce qu'il lui faut. Une requête par bloc
+au lieu d'un exists() par identifiant.
+
+La réservation verrouille la ligne du compteur. Faite dans la transaction de
+l'appelant, elle garde ce verrou jusqu'à son COMMIT (les créations de
+commandes passent alors une à une) et peut être annulée avec elle : un bloc
+n'est gardé que s'il a été réservé hors transaction. Avec TRACKING_ID_BASE
+(alias d'une connexion à part vers la même base), la réservation est validée
+aussitôt sur cette connexion : verrou tenu le temps d'un UPDATE, et blocs
+gardés même dans une transaction. Inutile sous SQLite, qui n'admet qu'une
+écriture à la fois par fichier (une seconde connexion attendrait le COMMIT).
+
+Les fonctions de tour sont des tables de 2^16 valeurs tirées de
+blake2b(clé) : la permutation d'un lot entier est vectorisée avec numpy.
+La clé vient de TRACKING_ID_CLE, à défaut de SECRET_KEY ; la changer change
+tous les identifiants à venir (pas les existants).
+"""
+import hashlib
+import string
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+PREFIXE = 'LIV-'
+LETTRES = string.ascii_uppercase
+CHIFFRES = 10 ** 5
+TAILLE_ESPACE = len(LETTRES) ** 3 * CHIFFRES   # 1 757 600 000 < 2^32
+
+TOURS = 6
+DEMI_BITS = 16
+MASQUE = (1 << DEMI_BITS) - 1
+
+
+class EspaceEpuise(Exception):
+    pass
+
+
+class Permutation:
+    """ Permutation à clé de [0, TAILLE_ESPACE) (Feistel 2 x 16 bits + cycle-walking) """
+
+    def __init__(self, cle):
+        # TOURS tables de 2^16 entrées de 16 bits, flux blake2b(clé, compteur)
+        nb_blocs = TOURS * (1 << DEMI_BITS) * 2 // 64
+        flux = b''.join(
+            hashlib.blake2b(i.to_bytes(4, 'big'), key=cle, digest_size=64).digest()
+            for i in range(nb_blocs)
+        )
+        self.tables = np.frombuffer(flux, dtype='>u2').astype(np.uint32).reshape(TOURS, 1 << DEMI_BITS)
+        self._listes = self.tables.tolist()
+
+    def _feistel(self, x):
+        gauche, droite = x >> DEMI_BITS, x & MASQUE
+        for tour in range(TOURS):
+            gauche, droite = droite, gauche ^ self.tables[tour, droite]
+        return (gauche << DEMI_BITS) | droite
+
+    def permuter_un(self, valeur):
+        """ permuter() pour une seule valeur, sans le coût fixe de numpy """
+        while True:
+            gauche, droite = valeur >> DEMI_BITS, valeur & MASQUE
+            for table in self._listes:
+                gauche, droite = droite, gauche ^ table[droite]
+            valeur = (gauche << DEMI_BITS) | droite
+            if valeur < TAILLE_ESPACE:
+                return valeur
+
+    def permuter(self, valeurs):
+        """ Images d'un tableau de valeurs de [0, TAILLE_ESPACE) """
+        resultat = np.asarray(valeurs, dtype=np.uint32).copy()
+        restants = np.arange(len(resultat))
+        while len(restants):
+            resultat[restants] = self._feistel(resultat[restants])
+            restants = restants[resultat[restants] >= TAILLE_ESPACE]
+        return resultat
+
+
+def formater(valeurs):
+    """ Indices de l'espace -> 'LIV-ABC12345' """
+    lettres, chiffres = np.divmod(np.asarray(valeurs, dtype=np.int64), CHIFFRES)
+    a, reste = np.divmod(lettres, len(LETTRES) ** 2)
+    b, c = np.divmod(reste, len(LETTRES))
+    return [
+        f'{PREFIXE}{LETTRES[i]}{LETTRES[j]}{LETTRES[k]}{n:05d}'
+        for i, j, k, n in zip(a.tolist(), b.tolist(), c.tolist(), chiffres.tolist())
+    ]
+
+
+def base_dediee():
+    """ Alias de la connexion réservée au compteur (TRACKING_ID_BASE), ou None """
+    return getattr(settings, 'TRACKING_ID_BASE', None)
+
+
+def reserver(n, nom='tracking'):
+    """ Réserve n valeurs consécutives du compteur (une transaction, deux requêtes) """
+    from .models import CompteurIdentifiant
+
+    using = base_dediee() or DEFAULT_DB_ALIAS
+    with transaction.atomic(using=using):
+        compteur, _ = CompteurIdentifiant.objects.using(using).select_for_update().get_or_create(nom=nom)
+        debut = compteur.valeur
+        if debut + n > TAILLE_ESPACE:
+            raise EspaceEpuise(f'Plus que {TAILLE_ESPACE - debut} identifiants disponibles')
+        compteur.valeur = debut + n
+        compteur.save(update_fields=['valeur'])
+    return range(debut, debut + n)
+
+
+class Allocateur:
+    """ Distribue les identifiants d'un bloc réservé, par worker """
+
+    def __init__(self, cle, taille_bloc):
+        self.permutation = Permutation(cle)
+        self.taille_bloc = taille_bloc
+        self._bloc = iter(())
+        self._lock = threading.Lock()
+
+    def suivant(self):
+        with self._lock:
+            valeur = next(self._bloc, None)
+            if valeur is None:
+                if base_dediee() is None and transaction.get_connection().in_atomic_block:
+                    # Réservation annulable avec la transaction de l'appelant : pas de bloc gardé
+                    valeur = reserver(1)[0]
+                else:
+                    self._bloc = iter(reserver(self.taille_bloc))
+                    valeur = next(self._bloc)
+        return formater([self.permutation.permuter_un(valeur)])[0]
+
+    def lot(self, n):
+        """ n identifiants d'un coup (une réservation), pour bulk_create """
+        if n <= 0:
+            return []
+        valeurs = reserver(n)
+        return formater(self.permutation.permuter(np.arange(valeurs.start, valeurs.stop)))
+
+
+_allocateur = None
+_allocateur_lock = threading.Lock()
+
+
+def cle_par_defaut():
+    secret = getattr(settings, 'TRACKING_ID_CLE', None) or settings.SECRET_KEY
+    return hashlib.blake2b(secret.encode(), digest_size=32, person=b'tracking_id').digest()
+
+
+def get_allocateur():
+    global _allocateur
+    if _allocateur is None:
+        with _allocateur_lock:
+            if _allocateur is None:
+                _allocateur = Allocateur(cle_par_defaut(), getattr(settings, 'TRACKING_ID_BLOC', 100))
+    return _allocateur
+
+
+def nouvel_identifiant():
+    return get_allocateur().suivant()
+
+
+def nouveaux_identifiants(n):
+    return get_allocateur().lot(n)
@@ -0,0 +1,147 @@
+"""
+Import en masse de commandes depuis un fichier CSV ou NDJSON.
+
+Le fichier est lu ligne à ligne (par morceaux de 64 Ko, jamais en entier) ;
+chaque ligne est validée par CommandeImportSerializer, une seule instance
+réutilisée pour tout le fichier. Les commandes valides sont insérées par lots
+de IMPORT_TAILLE_LOT avec Commande.objects.bulk_create (tracking_id réservés
+en une requête par lot, charge pré-calculée), chaque lot dans sa transaction.
+Une ligne invalide n'empêche pas l'import des autres : elle est signalée
+dans le rapport, limité à IMPORT_ERREURS_MAX erreurs détaillées.
+
+La mémoire dépend donc de la taille d'un lot, pas de celle du fichier.
+
+CSV : première ligne = en-têtes (noms des champs du modèle), séparateur
+',' ou ';' (Excel) détecté sur l'en-tête, cellule vide = valeur par défaut.
+NDJSON : un objet JSON par ligne.
+"""
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Commande
+from .serializers import CommandeImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'ndjson'}
+
+
+class FormatInvalide(Exception):
+    pass
+
+
+@dataclass
+class RapportImport:
+    lignes: int = 0
+    importees: int = 0
+    erreurs: list = field(default_factory=list)   # { ligne, erreurs }, IMPORT_ERREURS_MAX au plus
+    rejetees: int = 0
+    duree: float = 0.0
+    dry_run: bool = False
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'lignes': self.lignes,
+            'importees': self.importees,
+            'rejetees': self.rejetees,
+            'erreurs': self.erreurs,
+            'erreurs_tronquees': self.rejetees > len(self.erreurs),
+            'duree_s': round(self.duree, 3),
+            'lignes_par_seconde': round(self.lignes / self.duree) if self.duree else None,
+        }
+
+
+def format_du_fichier(nom, format_fichier=None):
+    if format_fichier:
+        if format_fichier not in FORMATS:
+            raise FormatInvalide(f"Format inconnu : {format_fichier} (csv ou ndjson)")
+        return format_fichier
+    for extension, nom_format in EXTENSIONS.items():
+        if (nom or '').lower().endswith(extension):
+            return nom_format
+    raise FormatInvalide("Format non reconnu : préciser format_fichier (csv ou ndjson)")
+
+
+def lignes_csv(texte):
+    """
+    (numéro de ligne, données, erreur) ; texte = itérable de lignes.
+    Le numéro est celui de la ligne du fichier où commence l'enregistrement :
+    une cellule entre guillemets sur plusieurs lignes ne décale pas la suite.
+    """
+    texte = iter(texte)
+    entete = next(texte, '')
+    separateur = ';' if entete.count(';') > entete.count(',') else ','
+    colonnes = [nom.strip() for nom in next(csv.reader([entete], delimiter=separateur), [])]
+    lecteur = csv.reader(texte, delimiter=separateur)
+    lues = 1  # l'en-tête
+    for cellules in lecteur:
+        numero, lues = lues + 1, 1 + lecteur.line_num
+        if not any(cellule.strip() for cellule in cellules):
+            continue
+        if len(cellules) > len(colonnes):
+            yield numero, None, {'non_field_errors': ['Plus de cellules que de colonnes']}
+            continue
+        yield numero, {nom: valeur.strip() for nom, valeur in zip(colonnes, cellules) if valeur.strip()}, None
+
+
+def lignes_ndjson(texte):
+    for numero, brute in enumerate(texte, start=1):
+        if not brute.strip():
+            continue
+        try:
+            donnees = json.loads(brute)
+        except ValueError as e:
+            yield numero, None, {'non_field_errors': [f'JSON invalide : {e}']}
+            continue
+        if not isinstance(donnees, dict):
+            yield numero, None, {'non_field_errors': ['Un objet JSON par ligne attendu']}
+            continue
+        yield numero, donnees, None
+
+
+def importer_commandes(fichier, format_fichier, dry_run=False):
+    """
+    Importe les commandes d'un fichier (itérable de lignes en octets, ex. UploadedFile).
+
+    Returns:
+        RapportImport
+    """
+    debut = time.perf_counter()
+    taille_lot = getattr(settings, 'IMPORT_TAILLE_LOT', 500)
+    erreurs_max = getattr(settings, 'IMPORT_ERREURS_MAX', 200)
+    texte = codecs.iterdecode(fichier, 'utf-8-sig', errors='replace')
+    lignes = lignes_csv(texte) if format_fichier == 'csv' else lignes_ndjson(texte)
+
+    rapport = RapportImport(dry_run=dry_run)
+    validateur = CommandeImportSerializer()
+    lot = []
+
+    def inserer():
+        if not dry_run:
+            Commande.objects.bulk_create(lot)
+        rapport.importees += len(lot)
+        lot.clear()
+
+    for numero, donnees, erreur in lignes:
+        rapport.lignes += 1
+        if erreur is None:
+            try:
+                lot.append(Commande(**validateur.run_validation(donnees)))
+            except serializers.ValidationError as e:
+                erreur = e.detail
+        if erreur is not None:
+            rapport.rejetees += 1
+            if len(rapport.erreurs) < erreurs_max:
+                rapport.erreurs.append({'ligne': numero, 'erreurs': erreur})
+        if len(lot) >= taille_lot:
+            inserer()
+    inserer()
+
+    rapport.duree = time.perf_counter() - debut
+    return rapport
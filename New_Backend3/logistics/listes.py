@@ -0,0 +1,127 @@
+"""
+Chemin de lecture rapide des listes de commandes.
+
+CommandeSerializer instancie une Commande (et son livreur) par ligne puis
+passe chaque champ par la mécanique DRF (get_attribute, SerializerMethodField...).
+Pour les listes en lecture seule, les lignes sont lues en tuples
+(values_list) et le nom du livreur est calculé en SQL : pas d'instance de
+modèle, pas de jointure côté Python. Le JSON produit est le même : mêmes
+clés, dans le même ordre, et les champs dont le type JSON diffère de la
+valeur lue en base (dates, décimaux) passent par le to_representation du
+champ du serializer, donc par les mêmes réglages (formats, COERCE_DECIMAL_TO_STRING).
+
+Avec ?fields= / ?exclude= (logistics/projection.py), seules les colonnes des
+champs demandés sont lues.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import CharField, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .projection import ProjectionMixin
+from .serializers import CommandeSerializer
+
+# Champs dont la valeur lue en base est déjà celle du JSON
+PASSANTS = (
+    serializers.CharField, serializers.IntegerField, serializers.FloatField,
+    serializers.BooleanField, serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+)
+
+
+def nom_livreur_sql(prefixe='livreur__'):
+    """ get_livreur_name en SQL : "Prénom Nom", à défaut le username, NULL sans livreur """
+    complet = Trim(Concat(
+        f'{prefixe}first_name', Value(' '), f'{prefixe}last_name', output_field=CharField()
+    ))
+    return Coalesce(NullIf(complet, Value('')), f'{prefixe}username', output_field=CharField())
+
+
+class ListeRapide:
+    """
+    Sérialise un queryset comme `serializer_class(many=True)`, à partir de tuples.
+
+    `calcules` donne l'expression SQL des champs sans colonne (SerializerMethodField...).
+    """
+
+    def __init__(self, serializer_class, calcules):
+        self.serializer_class = serializer_class
+        self.calcules = calcules
+        self._plans = {}
+
+    def _plan(self, champs):
+        """ (colonnes lues, [(clé JSON, indice de colonne, convertisseur ou None)]) """
+        cle_plan = None if champs is None else tuple(champs)
+        if cle_plan not in self._plans:
+            if len(self._plans) >= 64:   # combinaisons de ?fields= venues des clients : cache borné
+                self._plans.clear()
+            self._plans[cle_plan] = self._construire_plan(champs)
+        return self._plans[cle_plan]
+
+    def _construire_plan(self, champs):
+        serializer = self.serializer_class() if champs is None else self.serializer_class(champs=champs)
+        colonnes, sorties = [], []
+        for cle, champ in serializer.fields.items():
+            if champ.write_only:
+                continue
+            if cle in self.calcules:
+                colonne, convertir = cle, None
+            elif champ.source == '*' or '.' in champ.source:
+                raise ImproperlyConfigured(f'{cle} : champ sans colonne, à fournir dans `calcules`')
+            else:
+                colonne = champ.source
+                convertir = None if isinstance(champ, PASSANTS) else champ.to_representation
+            if colonne not in colonnes:
+                colonnes.append(colonne)
+            sorties.append((cle, colonnes.index(colonne), convertir))
+        return colonnes, sorties
+
+    def lignes(self, queryset, champs=None, toujours=()):
+        """
+        Queryset de tuples nommés des colonnes des `champs`, plus `toujours`
+        (champs de tri de la pagination) en fin de tuple.
+        """
+        colonnes, _ = self._plan(champs)
+        colonnes = colonnes + [nom for nom in toujours if nom not in colonnes]
+        calcules = {nom: expression for nom, expression in self.calcules.items() if nom in colonnes}
+        return queryset.annotate(**calcules).values_list(*colonnes, named=True)
+
+    def cles(self, champs=None):
+        """ Clés des objets produits, dans l'ordre """
+        return [cle for cle, _, _ in self._plan(champs)[1]]
+
+    def iterer(self, lignes, champs=None):
+        """ Objets JSON des lignes, un par un (pour les exports en flux) """
+        _, sorties = self._plan(champs)
+        for ligne in lignes:
+            objet = {}
+            for cle, i, convertir in sorties:
+                valeur = ligne[i]
+                objet[cle] = valeur if convertir is None or valeur is None else convertir(valeur)
+            yield objet
+
+    def serialiser(self, lignes, champs=None):
+        return list(self.iterer(lignes, champs))
+
+
+commandes_rapides = ListeRapide(CommandeSerializer, {'livreur_name': nom_livreur_sql()})
+
+
+class ListeRapideMixin(ProjectionMixin):
+    """
+    `list` des ViewSets de commandes par ListeRapide : filtres, tri,
+    projection et pagination inchangés. `liste_rapide = None` revient au serializer.
+    """
+    liste_rapide = commandes_rapides
+
+    def list(self, request, *args, **kwargs):
+        if self.liste_rapide is None:
+            return super().list(request, *args, **kwargs)
+        champs = self.champs_demandes()
+        lignes = self.liste_rapide.lignes(
+            self.filter_queryset(self.get_queryset()), champs, toujours=self.colonnes_tri()
+        )
+        page = self.paginate_queryset(lignes)
+        if page is not None:
+            return self.get_paginated_response(self.liste_rapide.serialiser(page, champs))
+        return Response(self.liste_rapide.serialiser(lignes, champs))
@@ -0,0 +1,246 @@
+"""
+Table des positions live des livreurs, partagée entre tous les workers.
+
+Un fichier de taille fixe est projeté en mémoire (mmap, MAP_SHARED) : chaque
+livreur possède un slot indexé par son id. Les workers gunicorn/uvicorn y
+écrivent les points GPS et y lisent les positions sans toucher la base.
+Les positions sont recopiées périodiquement dans User.current_lat/current_long
+(write-behind) : le premier worker qui constate que le délai est écoulé lance
+la recopie dans un thread, hors du chemin de la requête. À la main :
+`python manage.py flush_positions`.
+
+Format d'un slot :
+    seq      uint32  compteur seqlock (impair = écriture en cours)
+    version  uint32  incrémentée à chaque nouvelle position
+    flushed  uint32  dernière version recopiée en base (écrit par le flush,
+                     sous le même seqlock que les positions)
+    reserve  uint32
+    lat, lng, timestamp  float64
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrous POSIX, on s'en passe
+    fcntl = None
+
+MAGIC = b'LIVEPOS1'
+HEADER = struct.Struct('<8sId')      # magic, capacité, dernier flush (epoch)
+HEADER_SIZE = 64
+SLOT = struct.Struct('<IIIIddd')
+SEQ = struct.Struct('<I')
+FLUSHED_OFFSET = 8
+
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u4'), ('version', '<u4'), ('flushed', '<u4'), ('reserve', '<u4'),
+    ('lat', '<f8'), ('lng', '<f8'), ('timestamp', '<f8'),
+])
+
+Position = namedtuple('Position', ['lat', 'lng', 'timestamp', 'version'])
+
+
+class LivePositionStore:
+    def __init__(self, path, capacity):
+        self.path = str(path)
+        self.capacity = capacity
+        self.size = HEADER_SIZE + capacity * SLOT.size
+        # fcntl verrouille entre processus, pas entre threads d'un même worker
+        self._write_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock(0, HEADER_SIZE)
+        try:
+            if os.fstat(self.fd).st_size < self.size:
+                os.ftruncate(self.fd, self.size)
+            self.mm = mmap.mmap(self.fd, self.size)
+            magic, stored_capacity, _ = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC:
+                HEADER.pack_into(self.mm, 0, MAGIC, capacity, time.time())
+            elif stored_capacity != capacity:
+                raise ValueError(
+                    f"{self.path} a été créé avec une capacité de {stored_capacity} slots"
+                )
+        finally:
+            self._unlock(0, HEADER_SIZE)
+
+        self.slots = np.frombuffer(self.mm, dtype=SLOT_DTYPE, count=capacity, offset=HEADER_SIZE)
+
+    # --- Verrous inter-processus (fcntl) ---
+
+    def _lock(self, offset, length, blocking=True):
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.lockf(self.fd, flags, length, offset)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(self, offset, length):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset)
+
+    def _offset(self, driver_id):
+        return HEADER_SIZE + driver_id * SLOT.size
+
+    # --- Lecture / écriture ---
+
+    def write(self, driver_id, lat, lng, timestamp):
+        """
+        Enregistre la position d'un livreur.
+        Renvoie la nouvelle version, ou None si l'id dépasse la capacité
+        (l'appelant doit alors écrire en base directement).
+        """
+        if not 0 < driver_id < self.capacity:
+            return None
+        offset = self._offset(driver_id)
+        with self._write_lock:
+            return self._write_slot(offset, lat, lng, timestamp)
+
+    def _write_slot(self, offset, lat, lng, timestamp):
+        self._lock(offset, SLOT.size)
+        try:
+            seq, version, flushed, reserve, _, _, old_ts = SLOT.unpack_from(self.mm, offset)
+            seq += seq % 2  # un writer interrompu a pu laisser un compteur impair
+            if version and timestamp < old_ts:
+                # Point plus ancien que la position connue : on l'ignore
+                return version
+            SEQ.pack_into(self.mm, offset, seq + 1)
+            SLOT.pack_into(self.mm, offset, seq + 1, version + 1, flushed, reserve, lat, lng, timestamp)
+            SEQ.pack_into(self.mm, offset, seq + 2)
+            return version + 1
+        finally:
+            self._unlock(offset, SLOT.size)
+
+    def _mark_flushed(self, driver_id, version):
+        """ Note `version` comme recopiée, sous le seqlock du slot (comme une écriture) """
+        offset = self._offset(driver_id)
+        with self._write_lock:
+            self._lock(offset, SLOT.size)
+            try:
+                seq = SEQ.unpack_from(self.mm, offset)[0]
+                seq += seq % 2
+                SEQ.pack_into(self.mm, offset, seq + 1)
+                SEQ.pack_into(self.mm, offset + FLUSHED_OFFSET, version)
+                SEQ.pack_into(self.mm, offset, seq + 2)
+            finally:
+                self._unlock(offset, SLOT.size)
+
+    def read(self, driver_id):
+        """
+        Position live d'un livreur, ou None si inconnue, ou illisible faute
+        d'une lecture cohérente en 100 essais (écriture en cours, writer
+        interrompu) : l'appelant se rabat alors sur la base.
+        """
+        if not driver_id or not 0 < driver_id < self.capacity:
+            return None
+        offset = self._offset(driver_id)
+        for _ in range(100):
+            record = SLOT.unpack_from(self.mm, offset)
+            seq = record[0]
+            if seq % 2 == 0 and SEQ.unpack_from(self.mm, offset)[0] == seq:
+                break
+        else:
+            return None
+        _, version, _, _, lat, lng, timestamp = record
+        if not version:
+            return None
+        return Position(lat, lng, timestamp, version)
+
+    # --- Write-behind vers la base ---
+
+    def last_flush(self):
+        return HEADER.unpack_from(self.mm, 0)[2]
+
+    def flush_due(self):
+        interval = getattr(settings, 'LIVE_POSITIONS_FLUSH_SECONDS', 30)
+        return time.time() - self.last_flush() >= interval
+
+    def flush_in_background(self):
+        """
+        Lance flush() dans un thread si le délai est écoulé, pour ne pas faire
+        attendre la requête qui le constate. Renvoie le thread, ou None.
+        """
+        if not self.flush_due() or self._flush_lock.locked():
+            return None
+        thread = threading.Thread(target=self._flush_thread, name='live-positions-flush', daemon=True)
+        thread.start()
+        return thread
+
+    def _flush_thread(self):
+        from django.db import connections
+        try:
+            self.flush()
+        finally:
+            # Connexions ouvertes par ce thread
+            connections.close_all()
+
+    def flush(self, force=False):
+        """
+        Recopie en base les positions modifiées depuis le dernier flush.
+        Un seul worker flushe à la fois ; les autres repartent immédiatement.
+        Renvoie le nombre de livreurs mis à jour.
+        """
+        if not force and not self.flush_due():
+            return 0
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        if not self._lock(0, HEADER_SIZE, blocking=False):
+            self._flush_lock.release()
+            return 0
+        try:
+            if not force and not self.flush_due():
+                return 0
+            HEADER.pack_into(self.mm, 0, MAGIC, self.capacity, time.time())
+
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+
+            dirty = np.flatnonzero(self.slots['version'] != self.slots['flushed'])
+            users, versions = [], []
+            for driver_id in dirty.tolist():
+                position = self.read(driver_id)
+                if position is None:
+                    continue
+                users.append(User(pk=driver_id, current_lat=round(position.lat, 6),
+                                  current_long=round(position.lng, 6)))
+                versions.append((driver_id, position.version))
+
+            if users:
+                User.objects.bulk_update(users, ['current_lat', 'current_long'], batch_size=500)
+                for driver_id, version in versions:
+                    self._mark_flushed(driver_id, version)
+            return len(users)
+        finally:
+            self._unlock(0, HEADER_SIZE)
+            self._flush_lock.release()
+
+
+_store = None
+_store_key = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """ Store du processus courant (ré-ouvert après un fork ou un changement de LIVE_POSITIONS_PATH) """
+    global _store, _store_key
+    key = (os.getpid(), str(settings.LIVE_POSITIONS_PATH))
+    if _store is None or _store_key != key:
+        with _store_lock:
+            if _store is None or _store_key != key:
+                _store = LivePositionStore(
+                    settings.LIVE_POSITIONS_PATH,
+                    getattr(settings, 'LIVE_POSITIONS_CAPACITY', 65536),
+                )
+                _store_key = key
+    return _store
@@ -0,0 +1,394 @@
+"""
+Micro-benchmarks des briques de performance de l'app logistics.
+
+Usage: python manage.py benchmark trajets [--points 5760] [--repetitions 20]
+       python manage.py benchmark positions [--points 12]
+       python manage.py benchmark distances [--points 10000]
+       python manage.py benchmark identifiants [--points 100000]
+       python manage.py benchmark import [--points 20000]
+       python manage.py benchmark liste [--points 5000]
+       python manage.py benchmark export [--points 50000]
+       python manage.py benchmark recherche [--points 1000000]
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+
+def chrono(fonction, repetitions):
+    """ Meilleur temps (s) sur plusieurs exécutions """
+    meilleur = float('inf')
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+
+def trajet_synthetique(n, seed=0):
+    """ Trajet urbain plausible : un point toutes les 5 s, ~30 km/h, virages occasionnels """
+    rng = np.random.default_rng(seed)
+    t_ms = 1_770_000_000_000 + np.arange(n, dtype=np.int64) * 5000 + rng.integers(-300, 300, n)
+    cap = np.cumsum(np.where(rng.random(n) < 0.05, rng.normal(0, 1.2, n), rng.normal(0, 0.02, n)))
+    pas = 42.0 + rng.normal(0, 6, n)  # mètres parcourus en 5 s
+    lat = 34.0209 + np.cumsum(pas * np.cos(cap)) / 111_320.0 + rng.normal(0, 3e-5, n)
+    lng = -6.8416 + np.cumsum(pas * np.sin(cap)) / (111_320.0 * 0.829) + rng.normal(0, 3e-5, n)
+    return t_ms, lat, lng
+
+
+def csv_synthetique(n, seed=0):
+    """ Fichier d'import CSV (lignes en octets, séparateur ';'), ~1 % de lignes invalides """
+    rng = np.random.default_rng(seed)
+    yield b'client_name;client_phone;adresse_text;latitude;longitude;montant;est_fragile;poids;dimensions\n'
+    for i in range(n):
+        montant = 'abc' if i % 100 == 99 else f'{rng.uniform(50, 900):.2f}'
+        yield (
+            f'Client {i};06{rng.integers(10**7, 10**8)};{i} rue de Rabat;'
+            f'{33.95 + rng.normal() * 0.03:.6f};{-6.85 + rng.normal() * 0.04:.6f};{montant};'
+            f'{"true" if i % 7 == 0 else "false"};{rng.uniform(0.2, 8):.2f};{("petit", "standard", "grand")[i % 3]}\n'
+        ).encode()
+
+
+# Taille par défaut de chaque cible (--points) : son sens dépend de la cible
+POINTS_PAR_DEFAUT = {
+    'trajets': 5760,          # points par trajet (8h à 5 s)
+    'positions': 12,          # points par lot (60 s bufferisées à 5 s)
+    'distances': 10_000,      # points de chaque côté (matrice n x n)
+    'identifiants': 100_000,  # identifiants générés
+    'import': 20_000,         # lignes du fichier
+    'liste': 5000,            # commandes listées
+    'export': 50_000,         # commandes exportées
+    'recherche': 1_000_000,   # commandes indexées
+}
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks (trajets, positions, distances, identifiants, import, liste, export, recherche)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cible', choices=list(POINTS_PAR_DEFAUT))
+        parser.add_argument('--points', type=int, default=None, help='Taille du jeu de données (défaut : propre à la cible)')
+        parser.add_argument('--repetitions', type=int, default=20)
+
+    def handle(self, *args, **options):
+        handler = getattr(self, f"bench_{options['cible']}", None)
+        if handler is None:
+            raise CommandError(f"Cible inconnue : {options['cible']}")
+        if options['points'] is None:
+            options['points'] = POINTS_PAR_DEFAUT[options['cible']]
+        handler(options)
+
+    def bench_trajets(self, options):
+        from logistics.trajets import OCTETS_POINT_BRUT, decoder, douglas_peucker, encoder
+
+        n, repetitions = options['points'], options['repetitions']
+        t_ms, lat, lng = trajet_synthetique(n)
+        self.stdout.write(f'Trajet synthétique : {n} points ({n * OCTETS_POINT_BRUT} o en binaire brut)')
+
+        for tolerance in (0, 2, 5, 10):
+            garder = douglas_peucker(lat, lng, tolerance)
+            blob = encoder(t_ms[garder], lat[garder], lng[garder])
+            duree_dp = chrono(lambda: douglas_peucker(lat, lng, tolerance), max(1, repetitions // 4))
+            duree_dec = chrono(lambda: decoder(blob), repetitions)
+            self.stdout.write(
+                f'  tolérance {tolerance:>2} m : {int(garder.sum()):>5} points, {len(blob):>6} o '
+                f'({n * OCTETS_POINT_BRUT / len(blob):5.1f}x, {len(blob) / n:5.2f} o/point brut) | '
+                f'simplification {duree_dp * 1000:6.1f} ms | '
+                f'décodage {garder.sum() / duree_dec / 1e6:6.1f} M points/s'
+            )
+
+    def bench_positions(self, options):
+        import io
+        import json
+        from datetime import datetime, timezone as dt_timezone
+
+        from rest_framework.parsers import JSONParser
+        from logistics.parsers import PositionBinaireParser, encoder_positions
+        from logistics.serializers import PositionBatchSerializer
+
+        # --points est ici la taille d'un lot (12 points = 60 s bufferisées à 5 s)
+        n = options['points']
+        repetitions = max(options['repetitions'], 200)
+        t_ms, lat, lng = trajet_synthetique(n)
+        fixes = [
+            {
+                'lat': round(float(a), 6), 'lng': round(float(b), 6),
+                'timestamp': datetime.fromtimestamp(t / 1000, tz=dt_timezone.utc),
+                'precision': 8, 'vitesse': 30,
+            }
+            for t, a, b in zip(t_ms.tolist(), lat.tolist(), lng.tolist())
+        ]
+        corps_json = json.dumps({'fixes': [
+            {'lat': f['lat'], 'lng': f['lng'], 'timestamp': f['timestamp'].isoformat()} for f in fixes
+        ]}).encode()
+        formats = [
+            ('JSON', corps_json, JSONParser()),
+            ('binaire', encoder_positions(fixes), PositionBinaireParser()),
+            ('binaire + précision/vitesse', encoder_positions(fixes, precision=True, vitesse=True),
+             PositionBinaireParser()),
+        ]
+        def parse_et_valide(parser, corps):
+            serializer = PositionBatchSerializer(data=parser.parse(io.BytesIO(corps)))
+            serializer.is_valid(raise_exception=True)
+
+        self.stdout.write(f'Lot de {n} points')
+        for nom, corps, parser in formats:
+            duree = chrono(lambda: parser.parse(io.BytesIO(corps)), repetitions)
+            total = chrono(lambda: parse_et_valide(parser, corps), max(1, repetitions // 10))
+            self.stdout.write(
+                f'  {nom:<28} {len(corps):>6} o ({len(corps) / n:5.1f} o/point) | '
+                f'parse {duree * 1e6:7.1f} µs/lot ({duree / n * 1e6:5.2f} µs/point) | '
+                f'parse + validation {total * 1e6:7.1f} µs/lot'
+            )
+
+    def bench_distances(self, options):
+        import tracemalloc
+
+        from logistics.distances import CacheMatrices, matrice_distances
+        from logistics.geo import haversine_m
+
+        # --points est ici le nombre de points de chaque côté (matrice n x n)
+        n = options['points']
+        repetitions = max(1, min(options['repetitions'], 3))
+        rng = np.random.default_rng(0)
+        lat1, lat2 = 33.90 + rng.random(n) * 0.15, 33.90 + rng.random(n) * 0.15
+        lng1, lng2 = -6.95 + rng.random(n) * 0.20, -6.95 + rng.random(n) * 0.20
+        self.stdout.write(f'Matrice {n} x {n} ({n * n / 1e6:.0f} M paires)')
+
+        # Référence : boucle Python paire par paire, extrapolée depuis un échantillon
+        k = min(n, 300)
+        duree = chrono(lambda: [haversine_m(a, b, c, d) for a, b in zip(lat1[:k], lng1[:k])
+                                for c, d in zip(lat2[:k], lng2[:k])], 1)
+        self.stdout.write(f'  boucle Python          ~{duree * (n / k) ** 2:8.2f} s (extrapolé depuis {k} x {k})')
+
+        reference = None
+        for nom, dtype in (('NumPy float64 par blocs', np.float64), ('NumPy float32 par blocs', np.float32)):
+            tracemalloc.start()
+            duree = chrono(lambda: matrice_distances(lat1, lng1, lat2, lng2, dtype=dtype), repetitions)
+            _, pic = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultat = matrice_distances(lat1, lng1, lat2, lng2, dtype=dtype)
+            ecart = ''
+            if reference is None:
+                reference = resultat
+            else:
+                ecart = f' | écart max {np.abs(resultat - reference).max():.3f} m'
+            self.stdout.write(
+                f'  {nom:<23} {duree:8.2f} s | {n * n / duree / 1e6:6.1f} M paires/s | '
+                f'pic mémoire {pic / 2**20:6.0f} Mo (résultat {resultat.nbytes / 2**20:.0f} Mo){ecart}'
+            )
+            del resultat
+        del reference
+
+        cache = CacheMatrices(capacite_octets=n * n * 4 * 2)
+        cle = cache.cle(lat1, lng1, lat2, lng2)
+        cache.put(cle, matrice_distances(lat1, lng1, lat2, lng2))
+        duree = chrono(lambda: cache.get(cache.cle(lat1, lng1, lat2, lng2)), max(repetitions, 20))
+        self.stdout.write(f'  cache LRU (hit)        {duree * 1000:8.2f} ms (empreinte des coordonnées comprise)')
+
+    def bench_identifiants(self, options):
+        from logistics.identifiants import Permutation, TAILLE_ESPACE, cle_par_defaut, formater
+
+        # --points est ici le nombre d'identifiants (un import massif)
+        n = options['points']
+        repetitions = max(1, min(options['repetitions'], 5))
+        duree = chrono(lambda: Permutation(cle_par_defaut()), 1)
+        self.stdout.write(f'Tables de la permutation : {duree * 1000:.0f} ms (une fois par worker)')
+
+        permutation = Permutation(cle_par_defaut())
+        debut = np.random.default_rng(0).integers(0, TAILLE_ESPACE - n)
+        valeurs = np.arange(debut, debut + n)
+        duree = chrono(lambda: formater(permutation.permuter(valeurs)), repetitions)
+        identifiants = formater(permutation.permuter(valeurs))
+        self.stdout.write(
+            f'  lot de {n} identifiants  {duree * 1000:8.1f} ms | {n / duree / 1e6:.2f} M/s | '
+            f'{len(set(identifiants))} distincts | ex. {identifiants[0]}, {identifiants[1]}'
+        )
+        duree = chrono(lambda: [formater([permutation.permuter_un(v)]) for v in valeurs[:1000].tolist()], repetitions)
+        self.stdout.write(f'  un par un                {duree * 1000:8.1f} µs / identifiant')
+
+    def bench_import(self, options):
+        import tracemalloc
+
+        from logistics.imports import importer_commandes
+        from logistics.serializers import CommandeSerializer
+
+        # --points est ici le nombre de lignes ; tout est annulé en fin de mesure
+        n = options['points']
+        self.stdout.write(f'Import CSV de {n} lignes (transaction annulée en fin de mesure)')
+
+        # Référence : une commande à la fois (serializer + save), extrapolée
+        k = min(n, 200)
+        with transaction.atomic():
+            lignes = list(csv_synthetique(k))[1:]
+            debut = time.perf_counter()
+            for ligne in lignes:
+                valeurs = ligne.decode().strip().split(';')
+                donnees = dict(zip(['client_name', 'client_phone', 'adresse_text', 'latitude', 'longitude',
+                                    'montant', 'est_fragile', 'poids', 'dimensions'], valeurs))
+                serializer = CommandeSerializer(data=donnees)
+                if serializer.is_valid():
+                    serializer.save()
+            duree = time.perf_counter() - debut
+            transaction.set_rollback(True)
+        self.stdout.write(f'  une par une            {k / duree:8.0f} lignes/s (~{duree * n / k:.1f} s pour {n})')
+
+        with transaction.atomic():
+            rapport = importer_commandes(csv_synthetique(n), 'csv')
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f'  import par lots        {rapport.lignes / rapport.duree:8.0f} lignes/s | '
+            f'{rapport.importees} importées, {rapport.rejetees} rejetées'
+        )
+
+        # Mémoire (mesure séparée, tracemalloc ralentit l'import) : doit rester plate
+        for taille in (n // 10, n):
+            with transaction.atomic():
+                tracemalloc.start()
+                importer_commandes(csv_synthetique(taille), 'csv')
+                _, pic = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                transaction.set_rollback(True)
+            self.stdout.write(f'  pic mémoire {taille:>7} lignes {pic / 2**20:6.1f} Mo')
+
+    def bench_liste(self, options):
+        from django.contrib.auth import get_user_model
+
+        from logistics.imports import importer_commandes
+        from logistics.listes import commandes_rapides
+        from logistics.models import Commande
+        from logistics.serializers import CommandeSerializer
+
+        # --points est ici le nombre de commandes listées ; tout est annulé en fin de mesure
+        n = options['points']
+        repetitions = max(1, min(options['repetitions'], 5))
+        self.stdout.write(f'Liste de {n} commandes (transaction annulée en fin de mesure)')
+
+        with transaction.atomic():
+            User = get_user_model()
+            livreurs = [
+                User.objects.create_user(f'bench_liste_{i}', role='LIVREUR', first_name='Livreur', last_name=str(i))
+                for i in range(20)
+            ]
+            importer_commandes(csv_synthetique(n), 'csv')
+            commandes = list(Commande.objects.only('id'))
+            for i, commande in enumerate(commandes):
+                commande.livreur = livreurs[i % len(livreurs)]
+            Commande.objects.bulk_update(commandes, ['livreur'], batch_size=500)
+            queryset = Commande.objects.select_related('livreur').order_by('-date_creation')
+            nb = queryset.count()
+
+            mesures = [
+                ('CommandeSerializer', lambda: CommandeSerializer(queryset.all(), many=True).data),
+                ('values_list + SQL', lambda: commandes_rapides.serialiser(commandes_rapides.lignes(queryset.all()))),
+            ]
+            reference = None
+            for nom, fonction in mesures:
+                duree = chrono(fonction, repetitions)
+                if reference is None:
+                    reference = duree
+                self.stdout.write(
+                    f'  {nom:<20} {duree * 1000:8.1f} ms | {nb / duree:8.0f} lignes/s | x{reference / duree:.1f}'
+                )
+            identiques = [dict(ligne) for ligne in mesures[0][1]()] == mesures[1][1]()
+            self.stdout.write(f'  JSON identique : {"oui" if identiques else "NON"}')
+            transaction.set_rollback(True)
+
+    def bench_export(self, options):
+        import tracemalloc
+
+        from logistics.exports import exporter_commandes
+        from logistics.imports import importer_commandes
+        from logistics.models import Commande
+
+        # --points est ici le nombre de commandes exportées ; tout est annulé en fin de mesure
+        n = options['points']
+        self.stdout.write(f'Export de {n} commandes (transaction annulée en fin de mesure)')
+
+        with transaction.atomic():
+            importer_commandes(csv_synthetique(n), 'csv')
+            queryset = Commande.objects.order_by('-date_creation')
+            for sortie, gzip in (('csv', False), ('ndjson', False), ('csv', True)):
+                debut = time.perf_counter()
+                corps = exporter_commandes(queryset, sortie, gzip=gzip)
+                premier = next(corps)
+                premier_octet = time.perf_counter() - debut
+                taille = len(premier) + sum(len(morceau) for morceau in corps)
+                duree = time.perf_counter() - debut
+                self.stdout.write(
+                    f'  {sortie + (" gzip" if gzip else ""):<12} {n / duree:8.0f} lignes/s | '
+                    f'{taille / 2**20:6.1f} Mo | premier octet {premier_octet * 1000:5.1f} ms'
+                )
+
+            # Mémoire (mesure séparée) : doit rester plate quel que soit le nombre de lignes
+            for limite in (n // 10, n):
+                tracemalloc.start()
+                for _ in exporter_commandes(queryset[:limite], 'csv'):
+                    pass
+                _, pic = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(f'  pic mémoire {limite:>7} lignes {pic / 2**20:6.1f} Mo')
+
+            # Référence : la liste JSON complète, chargée en mémoire
+            from logistics.serializers import CommandeSerializer
+            tracemalloc.start()
+            debut = time.perf_counter()
+            CommandeSerializer(queryset.select_related('livreur'), many=True).data
+            duree = time.perf_counter() - debut
+            _, pic = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(f'  liste JSON (référence) {n / duree:8.0f} lignes/s | pic mémoire {pic / 2**20:6.1f} Mo')
+            transaction.set_rollback(True)
+
+    def bench_recherche(self, options):
+        from logistics.models import Commande
+        from logistics.recherche import index_disponible, rechercher
+
+        # --points est ici le nombre de commandes ; tout est annulé en fin de mesure
+        n = options['points']
+        repetitions = max(1, min(options['repetitions'], 5))
+        rng = np.random.default_rng(0)
+        prenoms = ['Ahmed', 'Fatima', 'Youssef', 'Khadija', 'Omar', 'Salma', 'Karim', 'Imane', 'Hamza', 'Nadia']
+        noms = ['Benali', 'El Idrissi', 'Alaoui', 'Bennani', 'Tazi', 'Chraibi', 'Berrada', 'Fassi', 'Amrani', 'Lahlou']
+        rues = ['rue de Fès', 'avenue Hassan II', 'boulevard Zerktouni', 'rue Oued Ziz', 'avenue Mohammed V']
+        self.stdout.write(f'Recherche dans {n} commandes (index plein texte : {"oui" if index_disponible() else "non"})')
+
+        with transaction.atomic():
+            debut = time.perf_counter()
+            for depart in range(0, n, 10_000):
+                taille = min(10_000, n - depart)
+                Commande.objects.bulk_create([
+                    Commande(
+                        client_name=f'{prenoms[a]} {noms[b]}', client_phone=f'06{t:08d}',
+                        adresse_text=f'{numero} {rues[r]}, Rabat', montant=100,
+                    )
+                    for a, b, t, numero, r in zip(
+                        rng.integers(0, 10, taille).tolist(), rng.integers(0, 10, taille).tolist(),
+                        rng.integers(0, 10**8, taille).tolist(), rng.integers(1, 300, taille).tolist(),
+                        rng.integers(0, len(rues), taille).tolist(),
+                    )
+                ], batch_size=2000)
+            self.stdout.write(f'  insertion (triggers compris) {n / (time.perf_counter() - debut):8.0f} lignes/s')
+
+            exemple = Commande.objects.order_by('id').values('tracking_id', 'client_phone')[n // 2]
+            recherches = [
+                ('tracking_id partiel', exemple['tracking_id'][4:10].lower()),
+                ('téléphone partiel', exemple['client_phone'][2:8]),
+                ('nom + prénom', 'youssef tazi'),
+                ('terme très courant', 'rabat'),
+                ('sans résultat', 'zzzz'),
+            ]
+            queryset = Commande.objects.all()
+            for nom, texte in recherches:
+                duree = chrono(lambda: list(rechercher(queryset, texte, 20).values_list('id', flat=True)[:20]), repetitions)
+                condition = Q()
+                for champ in ('tracking_id', 'client_name', 'client_phone', 'adresse_text'):
+                    condition |= Q(**{f'{champ}__icontains': texte.split()[0]})
+                reference = chrono(lambda: list(queryset.filter(condition).order_by('-id').values_list('id', flat=True)[:20]), 1)
+                self.stdout.write(
+                    f'  {nom:<20} {texte!r:<16} index {duree * 1000:7.2f} ms | icontains {reference * 1000:8.1f} ms'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from logistics.eta import calculer_profils, enregistrer_profils
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les profils de vitesse (heure x zone) utilisés par les ETA'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jours', type=int, default=None,
+            help='Historique pris en compte en jours (défaut : ETA_HISTORIQUE_JOURS)'
+        )
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        depuis = timezone.now() - timedelta(days=options['jours']) if options['jours'] else None
+        vitesse, secondes = calculer_profils(depuis)
+        enregistrer_profils(vitesse, secondes)
+        duree = time.perf_counter() - debut
+
+        observees = secondes.sum(axis=0) > 0
+        moyenne = (vitesse * secondes).sum() / max(secondes.sum(), 1)
+        self.stdout.write(self.style.SUCCESS(
+            f"{vitesse.size} profils enregistrés en {duree:.2f}s\n"
+            f"- roulage observé : {secondes.sum() / 3600:.1f} h sur {int(observees.sum())} zone(s)\n"
+            f"- vitesse moyenne : {moyenne * 3.6:.1f} km/h"
+        ))
@@ -0,0 +1,30 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from logistics.vagues import mettre_a_jour_zones
+
+
+class Command(BaseCommand):
+    help = 'Met à jour les zones de vagues des commandes en attente (k-means à capacité)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depuis-zero', action='store_true',
+            help='Réinitialiser les zones au lieu de partir des zones enregistrées'
+        )
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        zonage = mettre_a_jour_zones(depuis_zero=options['depuis_zero'])
+        duree = time.perf_counter() - debut
+
+        if len(zonage.centres) == 0:
+            self.stdout.write('Aucune commande en attente')
+            return
+        effectifs = np.bincount(zonage.zones, minlength=len(zonage.centres))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(zonage.centres)} zone(s) pour {len(zonage.ids)} commande(s) en {duree:.2f}s\n"
+            f"- commandes par zone : {effectifs.min()} à {effectifs.max()}"
+        ))
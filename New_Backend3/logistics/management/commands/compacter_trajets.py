@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from logistics.trajets import OCTETS_POINT_BRUT, compacter_trajets
+
+
+class Command(BaseCommand):
+    help = 'Compacte les journées GPS terminées en trajets compressés'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--avant', type=parse_date, default=None,
+            help='Compacter les journées strictement antérieures (YYYY-MM-DD, défaut : aujourd\'hui)'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=None,
+            help='Tolérance Douglas-Peucker en mètres (défaut : TRAJET_TOLERANCE_METRES)'
+        )
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        stats = compacter_trajets(avant=options['avant'], tolerance_metres=options['tolerance'])
+        duree = time.perf_counter() - debut
+
+        if not stats['journees']:
+            self.stdout.write('Aucune journée à compacter')
+            return
+
+        octets_bruts = stats['points_bruts'] * OCTETS_POINT_BRUT
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['journees']} journée(s) compactée(s) en {duree:.2f}s\n"
+            f"- points : {stats['points_bruts']} -> {stats['points_conserves']}\n"
+            f"- octets : {octets_bruts} (binaire brut) -> {stats['octets']} "
+            f"({octets_bruts / max(stats['octets'], 1):.1f}x, "
+            f"{stats['octets'] / max(stats['points_conserves'], 1):.2f} o/point)"
+        ))
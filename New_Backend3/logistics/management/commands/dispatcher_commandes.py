@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from logistics.dispatch import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Assigne les commandes en attente aux livreurs disponibles (distance totale minimale)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Calculer et afficher le plan sans rien enregistrer'
+        )
+        parser.add_argument(
+            '--critere', choices=['distance', 'duree'], default=None,
+            help='Coût minimisé (défaut : DISPATCH_CRITERE)'
+        )
+        parser.add_argument(
+            '--capacite', type=int, default=None,
+            help='Commandes actives maximum par livreur (défaut : DISPATCH_CAPACITE_LIVREUR)'
+        )
+
+    def handle(self, *args, **options):
+        plan = dispatcher(
+            appliquer=not options['dry_run'], capacite=options['capacite'], critere=options['critere']
+        )
+
+        if not plan.affectations:
+            self.stdout.write(f'Aucune commande assignée ({len(plan.non_assignees)} en attente)')
+            return
+
+        nb = len(plan.affectations)
+        self.stdout.write(self.style.SUCCESS(
+            f"{nb} commande(s) {'à assigner' if options['dry_run'] else 'assignée(s)'} "
+            f"en {plan.duree_calcul:.2f}s\n"
+            f"- distance totale : {plan.distance_totale / 1000:.1f} km "
+            f"(moyenne {plan.distance_totale / nb:.0f} m)\n"
+            f"- sans livreur : {len(plan.non_assignees)}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from logistics.live_positions import get_store
+
+
+class Command(BaseCommand):
+    help = 'Recopie les positions live des livreurs dans User.current_lat/current_long'
+
+    def handle(self, *args, **options):
+        count = get_store().flush(force=True)
+        self.stdout.write(self.style.SUCCESS(f'{count} position(s) recopiée(s) en base'))
@@ -1,6 +1,14 @@
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.http import HttpResponsePermanentRedirect
 from urllib.parse import unquote
 
+logger = logging.getLogger(__name__)
+
 class CleanUrlMiddleware:
     """
     Middleware to automatically strip invisible unicode characters 
@@ -40,4 +48,93 @@ class CleanUrlMiddleware:
                 
                 return HttpResponsePermanentRedirect(clean_path)
 
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+class BudgetRequetesDepasse(AssertionError):
+    pass
+
+
+class CompteurRequetes:
+    """
+    Compte les requêtes SQL exécutées dans le bloc, sur toutes les bases
+    (connection.execute_wrapper : fonctionne aussi avec DEBUG = False).
+    """
+
+    def __init__(self):
+        self.requetes = []
+        self._pile = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.requetes.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._pile = ExitStack()
+        for connexion in connections.all():
+            self._pile.enter_context(connexion.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._pile.close()
+
+    def __len__(self):
+        return len(self.requetes)
+
+
+@contextmanager
+def budget_requetes(maximum, libelle='bloc'):
+    """
+    Pour les tests : échoue si le bloc exécute plus de `maximum` requêtes.
+
+        with budget_requetes(3):
+            client.get('/api/commandes/')
+    """
+    with CompteurRequetes() as compteur:
+        yield compteur
+    if len(compteur) > maximum:
+        raise BudgetRequetesDepasse(_message_budget(libelle, compteur, maximum))
+
+
+def _message_budget(libelle, compteur, maximum):
+    detail = '\n'.join(f'  {i}. {sql[:200]}' for i, sql in enumerate(compteur.requetes, start=1))
+    return f'{libelle} : {len(compteur)} requêtes pour un budget de {maximum}\n{detail}'
+
+
+class QueryBudgetMiddleware:
+    """
+    Vérifie le nombre de requêtes SQL de chaque vue contre son budget :
+    attribut `query_budget` de la vue (classe APIView/ViewSet, fonction, ou
+    @action(..., query_budget=n) si la classe déclare l'attribut), à défaut
+    QUERY_BUDGET_DEFAUT.
+
+    Actif en DEBUG ou avec QUERY_BUDGET_ACTIF. Un dépassement lève
+    BudgetRequetesDepasse si QUERY_BUDGET_STRICT (tests), sinon il est
+    journalisé. Le nombre de requêtes est renvoyé dans l'en-tête X-Query-Count.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ACTIF', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with CompteurRequetes() as compteur:
+            response = self.get_response(request)
+        budget = getattr(request, '_query_budget', None)
+        response['X-Query-Count'] = str(len(compteur))
+        if budget is not None and len(compteur) > budget:
+            message = _message_budget(f'{request.method} {request.path}', compteur, budget)
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise BudgetRequetesDepasse(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # query_budget = None : pas de budget (ex. import proportionnel au fichier)
+        initkwargs = getattr(view_func, 'initkwargs', {})
+        if 'query_budget' in initkwargs:
+            request._query_budget = initkwargs['query_budget']
+        else:
+            request._query_budget = getattr(
+                getattr(view_func, 'cls', view_func), 'query_budget', getattr(settings, 'QUERY_BUDGET_DEFAUT', None)
+            )
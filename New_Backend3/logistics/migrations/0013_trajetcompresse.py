@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0012_positionlivreur'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrajetCompresse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('debut', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('nb_points', models.IntegerField()),
+                ('nb_points_bruts', models.IntegerField()),
+                ('tolerance_metres', models.FloatField(default=0)),
+                ('donnees', models.BinaryField()),
+                ('livreur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['livreur', 'debut'], name='logistics_t_livreur_fba37b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('livreur', 'jour'), name='unique_trajet_livreur_jour')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0013_trajetcompresse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0014_commande_date_modification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='date_arrivee',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
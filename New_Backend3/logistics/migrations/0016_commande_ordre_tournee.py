@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0015_commande_date_arrivee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='ordre_tournee',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0016_commande_ordre_tournee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilVitesse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('heure', models.PositiveSmallIntegerField()),
+                ('zone', models.IntegerField()),
+                ('vitesse', models.FloatField()),
+                ('secondes_observees', models.FloatField(default=0)),
+                ('date_calcul', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('heure', 'zone'), name='unique_profil_heure_zone')],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:21
+
+import re
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Copie figée de logistics.capacite.charge_colis à la date de la migration :
+# une évolution du calcul ne doit pas changer ce que fait cette migration.
+VOLUMES_CLASSES = {'petit': 5.0, 'standard': 12.0, 'moyen': 20.0, 'grand': 50.0, 'xl': 100.0}
+VOLUME_DEFAUT = 12.0
+POIDS_DEFAUT = 1.0
+FACTEUR_FRAGILE = 1.5
+NOMBRE = re.compile(r'\d+(?:[.,]\d+)?')
+TAILLE_LOT = 500
+
+
+def poids_kg(poids):
+    if poids is None or poids == '':
+        return POIDS_DEFAUT
+    if isinstance(poids, (int, float, Decimal)):
+        return float(poids)
+    texte = str(poids).lower()
+    nombre = NOMBRE.search(texte)
+    if nombre is None:
+        return POIDS_DEFAUT
+    valeur = float(nombre.group().replace(',', '.'))
+    return valeur / 1000 if re.search(r'\d\s*g\b', texte) else valeur
+
+
+def volume_litres(dimensions):
+    texte = (dimensions or '').strip().lower()
+    if not texte:
+        return VOLUME_DEFAUT
+    if texte in VOLUMES_CLASSES:
+        return VOLUMES_CLASSES[texte]
+    cotes = [float(n.replace(',', '.')) for n in NOMBRE.findall(texte)]
+    if len(cotes) == 3:
+        return cotes[0] * cotes[1] * cotes[2] / 1000
+    for classe, volume in VOLUMES_CLASSES.items():
+        if classe in texte.split():
+            return volume
+    return VOLUME_DEFAUT
+
+
+def charge_colis(poids, dimensions, est_fragile=False):
+    volume = volume_litres(dimensions)
+    if est_fragile:
+        volume *= FACTEUR_FRAGILE
+    return round(poids_kg(poids), 3), round(volume, 3)
+
+
+def calculer_charges(apps, schema_editor):
+    Commande = apps.get_model('logistics', 'Commande')
+    commandes = Commande.objects.only('poids', 'dimensions', 'est_fragile').iterator(chunk_size=TAILLE_LOT)
+    lot = []
+    for commande in commandes:
+        commande.charge_poids, commande.charge_volume = charge_colis(
+            commande.poids, commande.dimensions, commande.est_fragile
+        )
+        lot.append(commande)
+        if len(lot) >= TAILLE_LOT:
+            Commande.objects.bulk_update(lot, ['charge_poids', 'charge_volume'])
+            lot = []
+    if lot:
+        Commande.objects.bulk_update(lot, ['charge_poids', 'charge_volume'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0017_profilvitesse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='charge_poids',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='commande',
+            name='charge_volume',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(calculer_charges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0018_commande_charge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneVague',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(unique=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('nb_commandes', models.PositiveIntegerField(default=0)),
+                ('date_calcul', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['numero'],
+            },
+        ),
+    ]
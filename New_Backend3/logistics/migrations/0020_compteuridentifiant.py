@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0019_zonevague'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurIdentifiant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=30, unique=True)),
+                ('valeur', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0020_compteuridentifiant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['livreur', 'date_creation', 'id'], name='commande_livreur_creation'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_creation', 'id'], name='commande_creation'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['statut', 'date_creation'], name='commande_statut_creation'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['livreur', 'statut', 'date_livraison'], name='commande_livreur_statut'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_livraison', 'statut'], name='commande_livraison_statut'),
+        ),
+    ]
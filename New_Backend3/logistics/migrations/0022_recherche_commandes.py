@@ -0,0 +1,83 @@
+"""
+Index plein texte des commandes (logistics/recherche.py), SQLite uniquement :
+table FTS5 à tokenizer trigram en contenu externe sur logistics_commande,
+tenue à jour par triggers. Ailleurs, ou sans FTS5, rien n'est créé et la
+recherche se replie sur icontains.
+"""
+from django.db import OperationalError, migrations
+
+CREER = [
+    """
+    CREATE VIRTUAL TABLE logistics_commande_recherche USING fts5(
+        tracking_id, client_name, client_phone, adresse_text,
+        content='logistics_commande', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER logistics_commande_recherche_ai AFTER INSERT ON logistics_commande BEGIN
+        INSERT INTO logistics_commande_recherche(rowid, tracking_id, client_name, client_phone, adresse_text)
+        VALUES (new.id, new.tracking_id, new.client_name, new.client_phone, new.adresse_text);
+    END
+    """,
+    """
+    CREATE TRIGGER logistics_commande_recherche_ad AFTER DELETE ON logistics_commande BEGIN
+        INSERT INTO logistics_commande_recherche(logistics_commande_recherche, rowid, tracking_id, client_name, client_phone, adresse_text)
+        VALUES ('delete', old.id, old.tracking_id, old.client_name, old.client_phone, old.adresse_text);
+    END
+    """,
+    # save() réécrit toutes les colonnes : on ne réindexe que si l'une des quatre a changé
+    """
+    CREATE TRIGGER logistics_commande_recherche_au
+    AFTER UPDATE OF tracking_id, client_name, client_phone, adresse_text ON logistics_commande
+    WHEN old.tracking_id IS NOT new.tracking_id OR old.client_name IS NOT new.client_name
+      OR old.client_phone IS NOT new.client_phone OR old.adresse_text IS NOT new.adresse_text
+    BEGIN
+        INSERT INTO logistics_commande_recherche(logistics_commande_recherche, rowid, tracking_id, client_name, client_phone, adresse_text)
+        VALUES ('delete', old.id, old.tracking_id, old.client_name, old.client_phone, old.adresse_text);
+        INSERT INTO logistics_commande_recherche(rowid, tracking_id, client_name, client_phone, adresse_text)
+        VALUES (new.id, new.tracking_id, new.client_name, new.client_phone, new.adresse_text);
+    END
+    """,
+    # Commandes existantes
+    "INSERT INTO logistics_commande_recherche(logistics_commande_recherche) VALUES ('rebuild')",
+]
+
+SUPPRIMER = [
+    'DROP TRIGGER IF EXISTS logistics_commande_recherche_au',
+    'DROP TRIGGER IF EXISTS logistics_commande_recherche_ad',
+    'DROP TRIGGER IF EXISTS logistics_commande_recherche_ai',
+    'DROP TABLE IF EXISTS logistics_commande_recherche',
+]
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as curseur:
+        try:
+            curseur.execute("CREATE VIRTUAL TABLE temp.fts5_disponible USING fts5(x, tokenize='trigram')")
+            curseur.execute('DROP TABLE temp.fts5_disponible')
+        except OperationalError:
+            # SQLite sans FTS5 ou trop ancien pour trigram (< 3.34) : recherche par icontains
+            return
+        for sql in CREER:
+            curseur.execute(sql)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as curseur:
+        for sql in SUPPRIMER:
+            curseur.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0021_index_commandes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
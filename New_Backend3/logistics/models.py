@@ -1,6 +1,4 @@
-import random
-import string
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
@@ -32,6 +30,33 @@ class Livreur(models.Model):
 
 # --- 3. LA COMMANDE ---
 
+class CommandeManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create ne passe pas par save() : mêmes pré-calculs
+        from .identifiants import nouveaux_identifiants
+
+        objs = list(objs)
+        sans_id = [obj for obj in objs if not obj.tracking_id]
+        for obj, tracking_id in zip(sans_id, nouveaux_identifiants(len(sans_id))):
+            obj.tracking_id = tracking_id
+        for obj in objs:
+            obj.calculer_charge()
+        while True:
+            try:
+                with transaction.atomic(using=self.db):
+                    return super().bulk_create(objs, *args, **kwargs)
+            except IntegrityError:
+                # Collision avec un ancien identifiant aléatoire : on remplace ceux-là
+                generes = [obj.tracking_id for obj in sans_id]
+                pris = set()
+                for i in range(0, len(generes), 500):
+                    pris.update(self.filter(tracking_id__in=generes[i:i + 500]).values_list('tracking_id', flat=True))
+                collisions = [obj for obj in sans_id if obj.tracking_id in pris]
+                if not collisions:
+                    raise
+                for obj, tracking_id in zip(collisions, nouveaux_identifiants(len(collisions))):
+                    obj.tracking_id = tracking_id
+
 class Commande(models.Model):
     # ✅ FIX 1: set editable=False so it doesn't show in Admin form
     tracking_id = models.CharField(max_length=50, unique=True, editable=False)
@@ -54,14 +79,26 @@ class Commande(models.Model):
         ECHOUE = 'Échoué', 'Échoué'
         RETOUR = 'Retour', 'Retour'
 
+    # Commande confiée à un livreur et pas encore terminée (capacité, tournée, ETA, geofence)
+    STATUTS_ACTIFS = (StatutChoices.ASSIGNEE, StatutChoices.EN_COURS, StatutChoices.EN_LIVRAISON)
+
     statut = models.CharField(max_length=20, choices=StatutChoices.choices,  default=StatutChoices.EN_ATTENTE)
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Sert d'ETag/Last-Modified au tracking public : à renseigner aussi dans les update()/bulk_update()
+    date_modification = models.DateTimeField(auto_now=True)
+    # Renseignée automatiquement quand le livreur entre dans le geofence de l'adresse
+    date_arrivee = models.DateTimeField(null=True, blank=True)
+    # Rang de l'arrêt dans la tournée du livreur (1 = prochain arrêt, 0 = hors tournée)
+    ordre_tournee = models.IntegerField(default=0)
     date_livraison = models.DateTimeField(null=True, blank=True)
     montant = models.DecimalField(max_digits=10, decimal_places=2)
     
     est_fragile = models.BooleanField(default=False)
     poids = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     dimensions = models.CharField(max_length=50, null=True, blank=True)
+    # Charge pré-calculée depuis poids/dimensions/est_fragile (voir logistics/capacite.py)
+    charge_poids = models.FloatField(default=0, editable=False)    # kg
+    charge_volume = models.FloatField(default=0, editable=False)   # litres
     notes = models.TextField(null=True, blank=True)
     date_livraison = models.DateField(null=True, blank=True, verbose_name="Date de Livraison Prévue")
     livreur = models.ForeignKey(
@@ -74,25 +111,169 @@ class Commande(models.Model):
 
     # ✅ FIX 2: This method generates the ID
     def generate_tracking_id(self):
-        """Generate a short, unique tracking ID like: LIV-ABC12345"""
-        while True:
-            letters = ''.join(random.choices(string.ascii_uppercase, k=3))
-            numbers = ''.join(random.choices(string.digits, k=5))
-            new_id = f"LIV-{letters}{numbers}"
-            
-            # Ensure it is unique in the database
-            if not Commande.objects.filter(tracking_id=new_id).exists():
-                return new_id
+        """Generate a short, unique tracking ID like: LIV-ABC12345 (see logistics/identifiants.py)"""
+        from .identifiants import nouvel_identifiant
+        return nouvel_identifiant()
+
+    objects = CommandeManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Livreur au chargement : à invalider aussi dans le geofence si la commande change de main
+        instance._livreur_id_charge = instance.__dict__.get('livreur_id')
+        return instance
+
+    def calculer_charge(self):
+        from .capacite import charge_colis
+        self.charge_poids, self.charge_volume = charge_colis(self.poids, self.dimensions, self.est_fragile)
 
     # ✅ FIX 3: Override save() to ACTUALLY call the generator
     def save(self, *args, **kwargs):
-        if not self.tracking_id:
+        genere = not self.tracking_id
+        if genere:
             self.tracking_id = self.generate_tracking_id()
-        super().save(*args, **kwargs)
+        self.calculer_charge()
+        if not genere:
+            super().save(*args, **kwargs)
+        while genere:
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                break
+            except IntegrityError:
+                # Collision avec un ancien identifiant aléatoire : on en prend un autre
+                if not Commande.objects.filter(tracking_id=self.tracking_id).exists():
+                    raise
+                self.tracking_id = self.generate_tracking_id()
+        # Les arrêts surveillés par le geofence de ce livreur (et de l'ancien) ont pu changer
+        from .geofence import invalider
+        invalider(self.livreur_id)
+        ancien = getattr(self, '_livreur_id_charge', None)
+        if ancien != self.livreur_id:
+            invalider(ancien)
+            self._livreur_id_charge = self.livreur_id
+
+    class Meta:
+        # Un index par accès fréquent (voir PlansRequetesTests) :
+        indexes = [
+            # liste du livreur triée par date (pagination par curseur)
+            models.Index(fields=['livreur', 'date_creation', 'id'], name='commande_livreur_creation'),
+            # liste admin triée par date (pagination par curseur)
+            models.Index(fields=['date_creation', 'id'], name='commande_creation'),
+            # ?statut= trié par date, commandes en attente (dispatch, vagues)
+            models.Index(fields=['statut', 'date_creation'], name='commande_statut_creation'),
+            # commandes actives d'un livreur (tournée, geofence), historique trié par date de livraison
+            models.Index(fields=['livreur', 'statut', 'date_livraison'], name='commande_livreur_statut'),
+            # calendrier (plage de dates, comptage par statut sans lire la table), ?date_livraison=
+            models.Index(fields=['date_livraison', 'statut'], name='commande_livraison_statut'),
+        ]
 
     def __str__(self):
         return f"Commande {self.tracking_id}"
 
+class PositionLivreur(models.Model):
+    """
+    Historique append-only des points GPS des livreurs.
+    Partitionné logiquement par (livreur, jour) ; les trajets sont lus
+    par range scan sur l'index (livreur, timestamp).
+    """
+    livreur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='positions'
+    )
+    jour = models.DateField()
+    timestamp = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['livreur', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.livreur_id} @ {self.timestamp:%Y-%m-%d %H:%M:%S}"
+
+class TrajetCompresse(models.Model):
+    """
+    Journée terminée d'un livreur, compactée en blob binaire
+    (voir logistics/trajets.py pour le format).
+    """
+    livreur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='trajets'
+    )
+    jour = models.DateField()
+    debut = models.DateTimeField()
+    fin = models.DateTimeField()
+    nb_points = models.IntegerField()
+    nb_points_bruts = models.IntegerField()
+    tolerance_metres = models.FloatField(default=0)
+    donnees = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['livreur', 'jour'], name='unique_trajet_livreur_jour'),
+        ]
+        indexes = [
+            models.Index(fields=['livreur', 'debut']),
+        ]
+
+    def __str__(self):
+        return f"Trajet {self.livreur_id} du {self.jour} ({self.nb_points} points)"
+
+class ProfilVitesse(models.Model):
+    """
+    Vitesse moyenne observée des livreurs par heure de la journée et par zone
+    (cellule de ETA_ZONE_METRES sur ZONE_BBOX, zone = nb_zones pour hors zone).
+    Table de lookup des ETA, recalculée par `manage.py calculer_profils_vitesse`.
+    """
+    heure = models.PositiveSmallIntegerField()
+    zone = models.IntegerField()
+    vitesse = models.FloatField()  # m/s, lissée vers la moyenne de l'heure
+    secondes_observees = models.FloatField(default=0)
+    date_calcul = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['heure', 'zone'], name='unique_profil_heure_zone'),
+        ]
+
+    def __str__(self):
+        return f"{self.heure}h zone {self.zone} : {self.vitesse * 3.6:.1f} km/h"
+
+class CompteurIdentifiant(models.Model):
+    """
+    Compteur des identifiants générés (tracking_id), réservé par blocs.
+    Voir logistics/identifiants.py.
+    """
+    nom = models.CharField(max_length=30, unique=True)
+    valeur = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nom} : {self.valeur}"
+
+class ZoneVague(models.Model):
+    """
+    Centre d'une zone de livraison regroupant les commandes en attente pour
+    la planification des vagues (k-means à capacité, voir logistics/vagues.py).
+    Mis à jour incrémentalement par `manage.py calculer_zones`.
+    """
+    numero = models.PositiveIntegerField(unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    nb_commandes = models.PositiveIntegerField(default=0)
+    date_calcul = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['numero']
+
+    def __str__(self):
+        return f"Zone {self.numero} ({self.nb_commandes} commandes)"
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
         ('order_assigned', 'Nouvelle commande assignée'),
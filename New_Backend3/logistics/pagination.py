@@ -0,0 +1,159 @@
+"""
+Pagination par curseur (keyset) des listes d'API.
+
+Les lignes sont triées sur (date_creation, id) par défaut, ou sur
+`ordre_pagination` de la vue ; le curseur encode les valeurs de tri de la
+dernière (ou première) ligne servie, et la page suivante se lit par
+WHERE (date, id) < (date0, id0) ORDER BY date DESC, id DESC LIMIT n :
+une page profonde coûte autant que la première (pas d'OFFSET), et
+l'arrivée de nouvelles commandes ne décale pas les pages déjà parcourues.
+
+Paramètres : ?limit= (défaut PAGINATION_TAILLE_PAGE, max `max_page_size`), ?cursor=
+(liens next / previous de la réponse), ?count=1 pour le total (un COUNT
+en plus, donc sur demande). Les champs de tri doivent être non nuls et le
+dernier unique.
+
+Sans ?limit ni ?cursor, la liste reste complète et non enveloppée tant que
+PAGINATION_PAR_DEFAUT est faux : les applications mobiles attendent encore
+une liste JSON.
+
+Les lignes peuvent être des instances ou des dicts (querysets values()).
+"""
+import base64
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+SUIVANTE = 'n'
+PRECEDENTE = 'p'
+
+
+def _valeur(ligne, champ):
+    return ligne[champ] if isinstance(ligne, dict) else getattr(ligne, champ)
+
+
+def _apres(position, ordre):
+    """
+    Q des lignes strictement après `position` dans l'ordre `ordre`
+    (('-date_creation', '-id') par ex.), écrit pour que l'index sur le
+    premier champ serve de borne : f1 <= v1 AND (f1 < v1 OR (f1 = v1 AND ...)).
+    """
+    champs = [(nom.lstrip('-'), nom.startswith('-')) for nom in ordre]
+    strict = Q()
+    egal = Q()
+    for (champ, desc), valeur in zip(champs, position):
+        strict |= egal & Q(**{f"{champ}__{'lt' if desc else 'gt'}": valeur})
+        egal &= Q(**{champ: valeur})
+    premier, desc = champs[0]
+    borne = Q(**{f"{premier}__{'lte' if desc else 'gte'}": position[0]})
+    return borne & strict
+
+
+def _inverse(ordre):
+    return tuple(nom[1:] if nom.startswith('-') else f'-{nom}' for nom in ordre)
+
+
+class PaginationCurseur(BasePagination):
+    ordering = ('-date_creation', '-id')
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        brut = params.get(self.cursor_query_param)
+        if (brut is None and self.page_size_query_param not in params
+                and not getattr(settings, 'PAGINATION_PAR_DEFAUT', False)):
+            return None
+
+        self.request = request
+        self.ordre = tuple(getattr(view, 'ordre_pagination', self.ordering))
+        self.champs = [nom.lstrip('-') for nom in self.ordre]
+        self.taille = self.get_page_size(request)
+        self.total = None
+        if params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.total = queryset.count()
+
+        position, sens = self.decode_cursor(brut, queryset.model) if brut else (None, SUIVANTE)
+        ordre = self.ordre if sens == SUIVANTE else _inverse(self.ordre)
+        if position is not None:
+            queryset = queryset.filter(_apres(position, ordre))
+        lignes = list(queryset.order_by(*ordre)[:self.taille + 1])
+        encore = len(lignes) > self.taille
+        del lignes[self.taille:]
+
+        if sens == PRECEDENTE:
+            lignes.reverse()
+            a_suivante, a_precedente = position is not None, encore
+        else:
+            a_suivante, a_precedente = encore, position is not None
+        self.suivante = self._position(lignes[-1]) if a_suivante and lignes else None
+        self.precedente = self._position(lignes[0]) if a_precedente and lignes else None
+        return lignes
+
+    def get_page_size(self, request):
+        try:
+            taille = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return getattr(settings, 'PAGINATION_TAILLE_PAGE', 50)
+        return max(1, min(taille, self.max_page_size))
+
+    def _position(self, ligne):
+        return [_valeur(ligne, champ) for champ in self.champs]
+
+    # --- Curseurs ---
+
+    def encode_cursor(self, position, sens):
+        valeurs = [v.isoformat() if isinstance(v, date) else v for v in position]
+        brut = json.dumps([sens, valeurs], separators=(',', ':')).encode()
+        curseur = base64.urlsafe_b64encode(brut).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, curseur)
+
+    def decode_cursor(self, brut, modele):
+        try:
+            sens, valeurs = json.loads(base64.urlsafe_b64decode(brut + '=' * (-len(brut) % 4)))
+            if sens not in (SUIVANTE, PRECEDENTE) or len(valeurs) != len(self.champs):
+                raise ValueError
+            position = [modele._meta.get_field(champ).to_python(v) for champ, v in zip(self.champs, valeurs)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, sens
+
+    # --- Réponse ---
+
+    def get_next_link(self):
+        return self.encode_cursor(self.suivante, SUIVANTE) if self.suivante is not None else None
+
+    def get_previous_link(self):
+        if self.precedente is None:
+            return None
+        return self.encode_cursor(self.precedente, PRECEDENTE)
+
+    def get_pagination_data(self):
+        """ Métadonnées de la page (pour les vues qui composent leur propre réponse) """
+        data = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.total is not None:
+            data['count'] = self.total
+        return data
+
+    def get_paginated_response(self, data):
+        return Response({**self.get_pagination_data(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,93 @@
+"""
+Format binaire compact pour les points GPS envoyés par l'application livreur.
+
+Content-Type: application/x-livreur-positions
+
+    en-tête  '<BBI'   version (2), drapeaux, t0 (secondes epoch, uint32)
+    points   '<iii'   lat, lng (micro-degrés, int32), delta de temps depuis
+                      le point précédent (ou t0) en dixièmes de seconde (int32
+                      signé : un trou de plusieurs heures ou un point arrivé
+                      dans le désordre restent encodables)
+             + 'B'    précision en mètres (si drapeau PRECISION)
+             + 'B'    vitesse en km/h (si drapeau VITESSE)
+
+Soit 12 à 14 octets par point, contre ~90 en JSON. Le parser produit la même
+structure que le JSON ({"fixes": [...]}) : la validation reste celle des
+serializers, et les anciennes versions de l'app continuent d'envoyer du JSON.
+La précision et la vitesse sont décodées mais pas encore stockées.
+"""
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+VERSION = 2
+PRECISION = 0x01
+VITESSE = 0x02
+
+HEADER = struct.Struct('<BBI')
+POINT = struct.Struct('<iii')
+MICRO = 1_000_000
+
+
+def encoder_positions(fixes, precision=False, vitesse=False):
+    """
+    Encode une liste de points { 'lat', 'lng', 'timestamp', 'precision', 'vitesse' }
+    (référence du format pour les clients). ValueError si un point sort des
+    bornes du format (coordonnées, date avant 1970 ou écart de plus de 6 ans).
+    """
+    flags = (PRECISION if precision else 0) | (VITESSE if vitesse else 0)
+    t0 = int(fixes[0]['timestamp'].timestamp()) if fixes else 0
+    try:
+        morceaux = [HEADER.pack(VERSION, flags, t0)]
+        precedent = t0 * 10
+        for fix in fixes:
+            t = round(fix['timestamp'].timestamp() * 10)
+            morceaux.append(POINT.pack(round(fix['lat'] * MICRO), round(fix['lng'] * MICRO), t - precedent))
+            precedent = t
+            if precision:
+                morceaux.append(bytes([min(255, int(fix.get('precision') or 0))]))
+            if vitesse:
+                morceaux.append(bytes([min(255, int(fix.get('vitesse') or 0))]))
+    except struct.error as e:
+        raise ValueError(f'Point hors des bornes du format binaire : {e}') from e
+    return b''.join(morceaux)
+
+
+class PositionBinaireParser(BaseParser):
+    media_type = 'application/x-livreur-positions'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        data = stream.read() if stream is not None else b''
+        if len(data) < HEADER.size:
+            raise ParseError('Payload binaire tronqué')
+        version, flags, t0 = HEADER.unpack_from(data, 0)
+        if version != VERSION:
+            raise ParseError(f'Version de payload inconnue : {version}')
+
+        precision, vitesse = flags & PRECISION, flags & VITESSE
+        point = struct.Struct(POINT.format + 'B' * (bool(precision) + bool(vitesse)))
+        if (len(data) - HEADER.size) % point.size:
+            raise ParseError('Payload binaire tronqué')
+
+        origine = datetime.fromtimestamp(t0, tz=dt_timezone.utc)
+        dixiemes = 0
+        fixes = []
+        for valeurs in point.iter_unpack(memoryview(data)[HEADER.size:]):
+            dixiemes += valeurs[2]
+            try:
+                timestamp = origine + timedelta(microseconds=dixiemes * 100_000)
+            except OverflowError:
+                raise ParseError('Horodatage hors limites dans le payload binaire')
+            fix = {
+                'lat': valeurs[0] / MICRO,
+                'lng': valeurs[1] / MICRO,
+                'timestamp': timestamp,
+            }
+            if precision:
+                fix['precision'] = valeurs[3]
+            if vitesse:
+                fix['vitesse'] = valeurs[-1]
+            fixes.append(fix)
+        return {'fixes': fixes}
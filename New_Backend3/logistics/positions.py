@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .live_positions import get_store
+from .geofence import verifier_arrivees
+from .models import PositionLivreur
+from .spatial import signaler_livreur
+from .trajets import fusionner, points_compresses
+
+User = get_user_model()
+
+
+def enregistrer_positions(livreur, fixes):
+    """
+    Enregistre un lot de points GPS d'un livreur.
+
+    Tous les points sont ajoutés à l'historique en un seul INSERT groupé.
+    La position courante part dans la table live partagée entre les workers ;
+    User n'est mis à jour que par le flush périodique (write-behind).
+
+    Args:
+        livreur: User (role LIVREUR) qui envoie les points
+        fixes: liste de dicts validés { 'lat', 'lng', 'timestamp' (optionnel) }
+
+    Returns:
+        Le point le plus récent du lot (celui qui devient la position courante)
+    """
+    maintenant = timezone.now()
+    for fix in fixes:
+        fix.setdefault('timestamp', maintenant)
+
+    PositionLivreur.objects.bulk_create([
+        PositionLivreur(
+            livreur_id=livreur.pk,
+            jour=timezone.localtime(fix['timestamp']).date(),
+            timestamp=fix['timestamp'],
+            latitude=fix['lat'],
+            longitude=fix['lng'],
+        )
+        for fix in fixes
+    ])
+
+    # Le téléphone peut envoyer les points dans le désordre : seul le plus récent compte
+    dernier = max(fixes, key=lambda fix: fix['timestamp'])
+    lat = round(dernier['lat'], 6)
+    lng = round(dernier['lng'], 6)
+
+    store = get_store()
+    if store.write(livreur.pk, lat, lng, dernier['timestamp'].timestamp()) is None:
+        # Id hors de la table live : UPDATE ciblé sur deux colonnes
+        User.objects.filter(pk=livreur.pk).update(current_lat=lat, current_long=lng)
+    else:
+        # Recopie en base dans un thread si le délai est écoulé
+        store.flush_in_background()
+    livreur.current_lat = lat
+    livreur.current_long = lng
+    signaler_livreur(livreur, lat, lng)
+    verifier_arrivees(livreur.pk, fixes)
+    return dernier
+
+
+def position_livreur(livreur):
+    """
+    Position courante d'un livreur : table live si disponible,
+    sinon la dernière valeur flushée en base.
+    Renvoie (lat, lng), éventuellement (None, None).
+    """
+    if livreur is None:
+        return None, None
+    position = get_store().read(livreur.pk)
+    if position is not None:
+        return position.lat, position.lng
+    return livreur.current_lat, livreur.current_long
+
+
+def trajectoire(livreur_id, debut, fin):
+    """
+    Points GPS d'un livreur sur [debut, fin[, triés par horodatage.
+    Les journées compactées sont décodées depuis leur blob ; les points bruts
+    restants sont lus par range scan sur l'index (livreur, timestamp).
+    Renvoie une liste de tuples (timestamp, lat, lng).
+    """
+    bruts = list(
+        PositionLivreur.objects
+        .filter(livreur_id=livreur_id, timestamp__gte=debut, timestamp__lt=fin)
+        .order_by('timestamp')
+        .values_list('timestamp', 'latitude', 'longitude')
+    )
+    return fusionner(points_compresses(livreur_id, debut, fin), bruts)
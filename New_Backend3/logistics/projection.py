@@ -0,0 +1,123 @@
+"""
+Projection des réponses d'API : ?fields=a,b et/ou ?exclude=c.
+
+Le serializer (ChampsDynamiquesMixin) ne garde que les champs demandés, et
+la requête est restreinte aux colonnes qu'ils lisent (only()) : les colonnes
+non demandées ne sont ni lues en base, ni sérialisées, ni envoyées.
+
+Les champs sans colonne propre (SerializerMethodField, propriétés du modèle)
+déclarent les colonnes dont ils dépendent dans Meta.colonnes_champs ; à
+défaut, la requête n'est pas restreinte (la réponse reste projetée).
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+PARAM_CHAMPS = 'fields'
+PARAM_EXCLUS = 'exclude'
+
+
+class ChampsDynamiquesMixin:
+    """ Serializer limité aux champs `champs` (None : tous) """
+
+    def __init__(self, *args, champs=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if champs is not None:
+            for nom in [nom for nom in self.fields if nom not in champs]:
+                self.fields.pop(nom)
+
+
+def _liste(request, param):
+    valeur = request.query_params.get(param)
+    if valeur is None:
+        return None
+    return [nom.strip() for nom in valeur.split(',') if nom.strip()]
+
+
+def champs_demandes(request, serializer_class):
+    """
+    Champs à renvoyer d'après ?fields= / ?exclude= (None : pas de projection).
+    Un nom inconnu du serializer est une erreur 400.
+    """
+    inclus, exclus = _liste(request, PARAM_CHAMPS), _liste(request, PARAM_EXCLUS)
+    if inclus is None and exclus is None:
+        return None
+    disponibles = list(serializer_class().fields)
+    erreurs = {}
+    for param, noms in ((PARAM_CHAMPS, inclus), (PARAM_EXCLUS, exclus)):
+        inconnus = [nom for nom in noms or () if nom not in disponibles]
+        if inconnus:
+            erreurs[param] = [f"Champ inconnu : {', '.join(inconnus)}"]
+    if erreurs:
+        raise serializers.ValidationError(erreurs)
+    return [nom for nom in disponibles if (inclus is None or nom in inclus) and nom not in (exclus or ())]
+
+
+def colonnes(serializer):
+    """ Chemins only() lus par les champs du serializer (None : indéterminé) """
+    modele = serializer.Meta.model
+    dependances = getattr(serializer.Meta, 'colonnes_champs', {})
+    resultat = []
+    for nom, champ in serializer.fields.items():
+        if nom in dependances:
+            resultat.extend(dependances[nom])
+            continue
+        if champ.source == '*':
+            return None
+        try:
+            modele._meta.get_field(champ.source.split('.')[0])
+        except FieldDoesNotExist:
+            return None
+        resultat.append(champ.source.replace('.', '__'))
+    return resultat
+
+
+def projeter(queryset, serializer, toujours=()):
+    """
+    Restreint le queryset aux colonnes du serializer (+ `toujours`, ex. clés
+    de pagination) ; les select_related devenus inutiles sont retirés.
+    """
+    lues = colonnes(serializer)
+    if lues is None:
+        return queryset
+    lues = list(dict.fromkeys([*lues, *toujours]))
+    if queryset.query.select_related:
+        relations = {chemin.rsplit('__', 1)[0] for chemin in lues if '__' in chemin}
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+    return queryset.only(*lues)
+
+
+class ProjectionMixin:
+    """
+    ?fields= / ?exclude= sur les vues génériques DRF, pour les actions de
+    lecture `actions_projetees`. Le serializer doit accepter `champs`
+    (ChampsDynamiquesMixin).
+    """
+    actions_projetees = ('list', 'retrieve')
+
+    def champs_demandes(self):
+        if not hasattr(self, '_champs_demandes'):
+            projetee = getattr(self, 'action', None) in self.actions_projetees
+            self._champs_demandes = (
+                champs_demandes(self.request, self.get_serializer_class()) if projetee else None
+            )
+        return self._champs_demandes
+
+    def colonnes_tri(self):
+        """ Champs de tri de la pagination : toujours lus """
+        ordre = getattr(self, 'ordre_pagination', None) or getattr(self.pagination_class, 'ordering', None) or ()
+        return [nom.lstrip('-') for nom in ordre]
+
+    def get_serializer(self, *args, **kwargs):
+        champs = self.champs_demandes()
+        if champs is not None:
+            kwargs.setdefault('champs', champs)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        champs = self.champs_demandes()
+        if champs is None:
+            return queryset
+        return projeter(queryset, self.get_serializer_class()(champs=champs), toujours=self.colonnes_tri())
@@ -0,0 +1,137 @@
+"""
+Recherche des commandes par tracking_id, nom du client, téléphone et adresse.
+
+Sur SQLite, une table FTS5 à tokenizer trigram (migration 0022) indexe ces
+quatre colonnes ; des triggers la tiennent à jour à chaque INSERT, UPDATE
+ou DELETE de logistics_commande (save(), bulk_create, update(), import).
+Un terme de 3 caractères ou plus trouve les commandes qui le contiennent,
+sans tenir compte de la casse : 'ahm' trouve 'Ahmed', '0612' un téléphone,
+'abc12' un tracking_id. Plusieurs termes : les commandes qui les contiennent
+tous. Les termes plus courts n'ont pas de trigramme et sont ignorés.
+
+Les correspondances sont lues dans l'index par rowid décroissant : pour
+l'autocomplétion, seules les `limite` plus récentes sont lues, même quand
+le terme est très courant.
+
+Autre base, ou SQLite sans FTS5 : repli sur icontains (parcours de table).
+
+Sous SQLite, une migration qui modifie logistics_commande (AddField,
+AlterField...) reconstruit la table (copie, DROP, renommage) et perd ses
+triggers. Après chaque migrate, reparer_index() (signal post_migrate, apps.py)
+recrée ceux qui manquent et reconstruit l'index ; le même signal vide le
+cache de index_disponible().
+"""
+from functools import lru_cache, reduce
+from operator import or_
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABLE = 'logistics_commande_recherche'
+CHAMPS = ('tracking_id', 'client_name', 'client_phone', 'adresse_text')
+LONGUEUR_MIN = 3
+
+# Triggers de synchronisation (ceux de la migration 0022)
+TRIGGERS = {
+    f'{TABLE}_ai': f"""
+        CREATE TRIGGER {TABLE}_ai AFTER INSERT ON logistics_commande BEGIN
+            INSERT INTO {TABLE}(rowid, tracking_id, client_name, client_phone, adresse_text)
+            VALUES (new.id, new.tracking_id, new.client_name, new.client_phone, new.adresse_text);
+        END
+    """,
+    f'{TABLE}_ad': f"""
+        CREATE TRIGGER {TABLE}_ad AFTER DELETE ON logistics_commande BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, tracking_id, client_name, client_phone, adresse_text)
+            VALUES ('delete', old.id, old.tracking_id, old.client_name, old.client_phone, old.adresse_text);
+        END
+    """,
+    f'{TABLE}_au': f"""
+        CREATE TRIGGER {TABLE}_au
+        AFTER UPDATE OF tracking_id, client_name, client_phone, adresse_text ON logistics_commande
+        WHEN old.tracking_id IS NOT new.tracking_id OR old.client_name IS NOT new.client_name
+          OR old.client_phone IS NOT new.client_phone OR old.adresse_text IS NOT new.adresse_text
+        BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, tracking_id, client_name, client_phone, adresse_text)
+            VALUES ('delete', old.id, old.tracking_id, old.client_name, old.client_phone, old.adresse_text);
+            INSERT INTO {TABLE}(rowid, tracking_id, client_name, client_phone, adresse_text)
+            VALUES (new.id, new.tracking_id, new.client_name, new.client_phone, new.adresse_text);
+        END
+    """,
+}
+
+# Champs renvoyés par l'autocomplétion sans ?fields=
+CHAMPS_RESULTAT = ['id', 'tracking_id', 'client_name', 'client_phone', 'adresse_text', 'statut', 'livreur_name']
+
+
+def termes(texte):
+    return [terme for terme in (texte or '').split() if len(terme) >= LONGUEUR_MIN]
+
+
+def expression_fts(mots):
+    """ Une phrase FTS5 par terme (sous-chaîne exacte en trigram), toutes requises """
+    return ' AND '.join('"{}"'.format(mot.replace('"', '""')) for mot in mots)
+
+
+@lru_cache(maxsize=None)
+def index_disponible(alias='default'):
+    connexion = connections[alias]
+    return connexion.vendor == 'sqlite' and TABLE in connexion.introspection.table_names()
+
+
+def triggers_manquants(alias='default'):
+    """ Noms des triggers de l'index absents de la base (vide sans index) """
+    connexion = connections[alias]
+    if connexion.vendor != 'sqlite':
+        return []
+    with connexion.cursor() as curseur:
+        if TABLE not in connexion.introspection.table_names(curseur):
+            return []
+        curseur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'logistics_commande'"
+        )
+        presents = {nom for nom, in curseur.fetchall()}
+    return [nom for nom in TRIGGERS if nom not in presents]
+
+
+def reparer_index(alias='default'):
+    """
+    Recrée les triggers manquants puis reconstruit l'index (les écritures
+    faites sans eux n'y sont pas). Renvoie les triggers recréés.
+    """
+    manquants = triggers_manquants(alias)
+    if manquants:
+        with connections[alias].cursor() as curseur:
+            for nom in manquants:
+                curseur.execute(TRIGGERS[nom])
+            curseur.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+    return manquants
+
+
+def filtrer(queryset, texte, limite=None):
+    """
+    Commandes du queryset qui contiennent tous les termes de `texte`
+    (aucune sans terme exploitable). Avec `limite`, seules les `limite`
+    correspondances les plus récentes de l'index sont retenues.
+    """
+    mots = termes(texte)
+    if not mots:
+        return queryset.none()
+    if not index_disponible(queryset.db):
+        return queryset.filter(*[reduce(or_, (Q(**{f'{champ}__icontains': mot}) for champ in CHAMPS)) for mot in mots])
+    sql = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rowid DESC'
+    params = [expression_fts(mots)]
+    if limite is not None:
+        sql += ' LIMIT %s'
+        params.append(limite)
+    return queryset.filter(id__in=RawSQL(sql, params))
+
+
+def rechercher(queryset, texte, limite):
+    """
+    Autocomplétion : les commandes les plus récentes qui correspondent
+    (à trancher à `limite` par l'appelant). Sans autre filtre sur le queryset,
+    l'index ne lit que `limite` correspondances.
+    """
+    borne = limite if not queryset.query.where else None
+    return filtrer(queryset, texte, borne).order_by('-id')
@@ -1,8 +1,11 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
+from .projection import ChampsDynamiquesMixin
 from .models import Commande
 from .models import Notification
 
-class CommandeSerializer(serializers.ModelSerializer):
+class CommandeSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     # Affiche le nom du livreur au lieu de son ID
     livreur_name = serializers.SerializerMethodField()    
     # Mapping pour React : estFragile sera envoyé au frontend
@@ -11,6 +14,8 @@ class CommandeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Commande
         fields = '__all__' # Inclut tous les nouveaux champs (poids, notes, etc.)
+        # Colonnes lues par les champs calculés (?fields= / ?exclude=, logistics/projection.py)
+        colonnes_champs = {'livreur_name': ('livreur__first_name', 'livreur__last_name', 'livreur__username')}
     
     def get_livreur_name(self, obj):
         """
@@ -35,7 +40,24 @@ class CommandeSerializer(serializers.ModelSerializer):
         return None  # Or "En attente"
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class CommandeImportSerializer(serializers.ModelSerializer):
+    """
+    Une ligne d'import de commandes (CSV / NDJSON, voir logistics/imports.py).
+    Les commandes importées partent 'En attente', sans livreur.
+    """
+    class Meta:
+        model = Commande
+        fields = [
+            'client_name', 'client_phone', 'adresse_text', 'latitude', 'longitude',
+            'montant', 'est_fragile', 'poids', 'dimensions', 'notes', 'date_livraison',
+        ]
+        extra_kwargs = {
+            'latitude': {'min_value': -90, 'max_value': 90},
+            'longitude': {'min_value': -180, 'max_value': 180},
+        }
+
+
+class NotificationSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     time_ago = serializers.ReadOnlyField()
     tracking_id = serializers.SerializerMethodField()
     
@@ -52,9 +74,31 @@ class NotificationSerializer(serializers.ModelSerializer):
             'tracking_id',
         ]
         read_only_fields = ['created_at']
+        colonnes_champs = {'time_ago': ('created_at',), 'tracking_id': ('commande__tracking_id',)}
     
     def get_tracking_id(self, obj):
         """Return tracking ID if notification is linked to a commande"""
         if obj.commande:
             return obj.commande.tracking_id
-        return None
\ No newline at end of file
+        return None
+
+class PositionSerializer(serializers.Serializer):
+    """ Un point GPS envoyé par l'application livreur """
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    # Horodatage du point côté téléphone (par défaut : réception serveur)
+    timestamp = serializers.DateTimeField(required=False)
+
+    def validate_timestamp(self, value):
+        # L'historique est en append-only : on refuse les horloges de téléphone délirantes
+        if value > timezone.now() + timedelta(minutes=5):
+            raise serializers.ValidationError("Horodatage dans le futur")
+        return value
+
+
+class PositionBatchSerializer(serializers.Serializer):
+    """
+    Lot de points GPS bufferisés par le téléphone (30 à 60 s de trajet).
+    Body JSON attendu: { "fixes": [{ "lat": 33.97, "lng": -6.85, "timestamp": "..." }, ...] }
+    """
+    fixes = PositionSerializer(many=True, allow_empty=False, max_length=500)
@@ -0,0 +1,232 @@
+"""
+Index spatial en mémoire des livreurs disponibles.
+
+Grille uniforme sur la zone de service (ZONE_BBOX) : chaque cellule contient
+les ids des livreurs qui s'y trouvent. Les requêtes k plus proches / rayon
+ne regardent que les cellules voisines du point cherché.
+
+L'index est propre à chaque worker : il est mis à jour directement par les
+envois GPS et les changements de disponibilité traités par ce worker, et
+reconstruit depuis la base + la table live toutes les
+GRILLE_RAFRAICHISSEMENT_SECONDES pour rattraper ceux des autres workers.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .geo import METRES_PAR_DEGRE, RAYON_TERRE_METRES
+
+
+class GrilleLivreurs:
+    def __init__(self, bbox, cellule_metres):
+        self.lat_min, self.lng_min, self.lat_max, self.lng_max = bbox
+        cos_lat = math.cos(math.radians((self.lat_min + self.lat_max) / 2))
+        self.dlat = cellule_metres / METRES_PAR_DEGRE
+        self.dlng = cellule_metres / (METRES_PAR_DEGRE * cos_lat)
+        self.nlat = max(1, math.ceil((self.lat_max - self.lat_min) / self.dlat))
+        self.nlng = max(1, math.ceil((self.lng_max - self.lng_min) / self.dlng))
+        # Plus petit côté de cellule sur toute la zone (borne inférieure des distances)
+        cos_max = math.cos(math.radians(max(abs(self.lat_min), abs(self.lat_max))))
+        self.cote_min = min(cellule_metres, self.dlng * METRES_PAR_DEGRE * cos_max) * 0.999
+
+        # cellule -> {livreur_id: (phi, lambda, cos phi)} pré-calculés pour haversine
+        self.cellules = defaultdict(dict)
+        self.positions = {}     # livreur_id -> (lat, lng, cellule ou None)
+        self.hors_zone = {}     # livreurs hors de la bbox, toujours testés
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cellule(self, lat, lng):
+        i = int((lat - self.lat_min) // self.dlat)
+        j = int((lng - self.lng_min) // self.dlng)
+        if 0 <= i < self.nlat and 0 <= j < self.nlng:
+            return i, j
+        return None
+
+    # --- Mises à jour ---
+
+    def mettre_a_jour(self, livreur_id, lat, lng):
+        cellule = self._cellule(lat, lng)
+        phi = math.radians(lat)
+        radians = (phi, math.radians(lng), math.cos(phi))
+        with self.lock:
+            ancienne = self.positions.get(livreur_id)
+            if ancienne is not None and ancienne[2] != cellule:
+                self._detacher(livreur_id, ancienne[2])
+            if cellule is None:
+                self.hors_zone[livreur_id] = radians
+            else:
+                self.cellules[cellule][livreur_id] = radians
+            self.positions[livreur_id] = (lat, lng, cellule)
+
+    def retirer(self, livreur_id):
+        with self.lock:
+            ancienne = self.positions.pop(livreur_id, None)
+            if ancienne is not None:
+                self._detacher(livreur_id, ancienne[2])
+
+    def _detacher(self, livreur_id, cellule):
+        if cellule is None:
+            self.hors_zone.pop(livreur_id, None)
+            return
+        ids = self.cellules.get(cellule)
+        if ids is not None:
+            ids.pop(livreur_id, None)
+            if not ids:
+                del self.cellules[cellule]
+
+    # --- Requêtes ---
+
+    @staticmethod
+    def _scores(lat, lng, membres, out):
+        """
+        Ajoute à out les (a, livreur_id) où a est le terme de haversine :
+        croissant avec la distance, sans asin/sqrt par candidat.
+        """
+        phi1 = math.radians(lat)
+        lam1 = math.radians(lng)
+        cos1 = math.cos(phi1)
+        sin = math.sin
+        for livreur_id, (phi2, lam2, cos2) in membres.items():
+            s_phi = sin((phi2 - phi1) * 0.5)
+            s_lam = sin((lam2 - lam1) * 0.5)
+            out.append((s_phi * s_phi + cos1 * cos2 * s_lam * s_lam, livreur_id))
+
+    @staticmethod
+    def _metres(a):
+        return 2 * RAYON_TERRE_METRES * math.asin(math.sqrt(min(1.0, a)))
+
+    @staticmethod
+    def _score_max(metres):
+        return math.sin(min(math.pi / 2, metres / (2 * RAYON_TERRE_METRES))) ** 2
+
+    def proches(self, lat, lng, k=5, rayon_max=None):
+        """
+        Les k livreurs les plus proches du point, triés par distance.
+        Renvoie une liste de (livreur_id, distance_m).
+        """
+        with self.lock:
+            candidats = []
+            centre = self._cellule(lat, lng)
+            if centre is None:
+                # Point hors zone : rare, on teste tout le monde
+                for membres in list(self.cellules.values()) + [self.hors_zone]:
+                    self._scores(lat, lng, membres, candidats)
+            else:
+                self._scores(lat, lng, self.hors_zone, candidats)
+                ci, cj = centre
+                for r in range(max(self.nlat, self.nlng)):
+                    for cellule in self._anneau(ci, cj, r):
+                        membres = self.cellules.get(cellule)
+                        if membres:
+                            self._scores(lat, lng, membres, candidats)
+                    # Tout point de l'anneau r+1 est à au moins r côtés de cellule
+                    borne = r * self.cote_min
+                    if len(candidats) >= k:
+                        candidats = heapq.nsmallest(k, candidats)
+                        if candidats[-1][0] <= self._score_max(borne):
+                            break
+                    if rayon_max is not None and borne > rayon_max:
+                        break
+        meilleurs = [(livreur_id, self._metres(a)) for a, livreur_id in heapq.nsmallest(k, candidats)]
+        if rayon_max is not None:
+            meilleurs = [m for m in meilleurs if m[1] <= rayon_max]
+        return meilleurs
+
+    def dans_rayon(self, lat, lng, rayon_metres):
+        """ Livreurs à moins de rayon_metres, triés par distance """
+        di = math.ceil(rayon_metres / (self.dlat * METRES_PAR_DEGRE)) + 1
+        dj = math.ceil(rayon_metres / self.cote_min) + 1
+        i = int((lat - self.lat_min) // self.dlat)
+        j = int((lng - self.lng_min) // self.dlng)
+        seuil = self._score_max(rayon_metres)
+        candidats = []
+        with self.lock:
+            self._scores(lat, lng, self.hors_zone, candidats)
+            for a in range(max(0, i - di), min(self.nlat, i + di + 1)):
+                for b in range(max(0, j - dj), min(self.nlng, j + dj + 1)):
+                    membres = self.cellules.get((a, b))
+                    if membres:
+                        self._scores(lat, lng, membres, candidats)
+        resultats = sorted(c for c in candidats if c[0] <= seuil)
+        return [(livreur_id, self._metres(a)) for a, livreur_id in resultats]
+
+    def _anneau(self, ci, cj, r):
+        """ Cellules à distance de Chebyshev exactement r de (ci, cj) """
+        if r == 0:
+            yield ci, cj
+            return
+        for i in range(ci - r, ci + r + 1):
+            if not 0 <= i < self.nlat:
+                continue
+            if i in (ci - r, ci + r):
+                for j in range(max(0, cj - r), min(self.nlng, cj + r + 1)):
+                    yield i, j
+            else:
+                for j in (cj - r, cj + r):
+                    if 0 <= j < self.nlng:
+                        yield i, j
+
+
+_grille = None
+_grille_date = 0.0
+_grille_lock = threading.Lock()
+
+
+def construire_grille():
+    """ Grille des livreurs disponibles, position live prioritaire sur la base """
+    from django.contrib.auth import get_user_model
+    from .live_positions import get_store
+
+    User = get_user_model()
+    grille = GrilleLivreurs(settings.ZONE_BBOX, getattr(settings, 'GRILLE_CELLULE_METRES', 500))
+    store = get_store()
+    livreurs = User.objects.filter(role='LIVREUR', is_available=True).values_list(
+        'id', 'current_lat', 'current_long'
+    )
+    for livreur_id, lat, lng in livreurs:
+        live = store.read(livreur_id)
+        if live is not None:
+            grille.mettre_a_jour(livreur_id, live.lat, live.lng)
+        elif lat is not None and lng is not None:
+            grille.mettre_a_jour(livreur_id, float(lat), float(lng))
+    return grille
+
+
+def get_grille():
+    """ Grille du worker courant, reconstruite si elle est trop ancienne """
+    global _grille, _grille_date
+    delai = getattr(settings, 'GRILLE_RAFRAICHISSEMENT_SECONDES', 30)
+    if _grille is None or time.monotonic() - _grille_date > delai:
+        with _grille_lock:
+            if _grille is None or time.monotonic() - _grille_date > delai:
+                _grille = construire_grille()
+                _grille_date = time.monotonic()
+    return _grille
+
+
+def signaler_livreur(livreur, lat=None, lng=None):
+    """
+    Répercute une position ou un changement de disponibilité dans la grille
+    du worker courant (si elle est déjà construite).
+    """
+    if _grille is None:
+        return
+    if getattr(livreur, 'role', '') != 'LIVREUR' or not livreur.is_available:
+        _grille.retirer(livreur.pk)
+        return
+    if lat is None or lng is None:
+        from .live_positions import get_store
+        live = get_store().read(livreur.pk)
+        if live is not None:
+            lat, lng = live.lat, live.lng
+        else:
+            lat, lng = livreur.current_lat, livreur.current_long
+    if lat is not None and lng is not None:
+        _grille.mettre_a_jour(livreur.pk, float(lat), float(lng))
@@ -1,3 +1,1616 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models.signals import post_migrate
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .live_positions import SEQ, get_store
+from .affectations import assigner_commandes
+from .positions import position_livreur
+from .middleware import BudgetRequetesDepasse, budget_requetes
+from . import dispatch, distances, eta, geofence, imports, parsers, recherche, spatial, tournees, trajets, vagues, views_stream
+from .capacite import PROFIL_DEFAUT, ProfilVehicule, profil_vehicule
+from .distances import CacheMatrices, matrice_cachee, matrice_distances
+from .exports import accepte_gzip
+from .geo import RAYON_TERRE_METRES, haversine_m
+from .identifiants import Allocateur
+from .listes import commandes_rapides
+from .models import Commande, CompteurIdentifiant, Notification, PositionLivreur, TrajetCompresse, ZoneVague
+from .parsers import PositionBinaireParser, encoder_positions
+from .serializers import CommandeSerializer
+from .spatial import GrilleLivreurs
+from .views import CommandeViewSet
+
+User = get_user_model()
+
+
+def setUpModule():
+    # Table live des positions dans un fichier temporaire, pas à côté de la base
+    dossier = tempfile.TemporaryDirectory()
+    unittest.addModuleCleanup(dossier.cleanup)
+    reglage = override_settings(LIVE_POSITIONS_PATH=os.path.join(dossier.name, 'live_positions'))
+    reglage.enable()
+    unittest.addModuleCleanup(reglage.disable)
+
+
+def vider_positions_live():
+    # La table live survit au rollback des tests : chaque test qui la lit part d'une table vide
+    get_store().slots.fill(0)
+
+
+@override_settings(QUERY_BUDGET_ACTIF=True, QUERY_BUDGET_STRICT=True)
+class BudgetRequetesTests(TestCase):
+    """ Les listes sérialisées ne doivent pas faire une requête par ligne (N+1) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreurs = [
+            User.objects.create_user(f'livreur{i}', password='x', role='LIVREUR', first_name=f'Livreur {i}')
+            for i in range(3)
+        ]
+        cls.commandes = Commande.objects.bulk_create([
+            Commande(client_name=f'Client {i}', client_phone='0600000000', montant=100,
+                     livreur=cls.livreurs[i % 3], statut='Assignée')
+            for i in range(30)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=cls.livreurs[0], title='Nouvelle commande', message='...', commande=commande)
+            for commande in cls.commandes
+        ])
+
+    def nb_requetes(self, url, utilisateur):
+        client = APIClient()
+        client.force_authenticate(utilisateur)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return int(response['X-Query-Count'])
+
+    def assertConstant(self, url, utilisateur, a_supprimer):
+        """ Même nombre de requêtes avant et après avoir retiré des lignes """
+        avant = self.nb_requetes(url, utilisateur)
+        a_supprimer.delete()
+        self.assertEqual(self.nb_requetes(url, utilisateur), avant)
+
+    def test_liste_commandes(self):
+        self.assertConstant('/api/commandes/', self.admin, Commande.objects.filter(pk__in=[c.pk for c in self.commandes[:25]]))
+
+    def test_liste_commandes_livreur(self):
+        mes_commandes = Commande.objects.filter(livreur=self.livreurs[0])
+        self.assertConstant('/api/commandes/', self.livreurs[0], mes_commandes.exclude(pk=mes_commandes.first().pk))
+
+    def test_liste_admin_commandes(self):
+        self.assertConstant('/api/admin/commandes/', self.admin, Commande.objects.filter(pk__in=[c.pk for c in self.commandes[:25]]))
+
+    def test_notifications(self):
+        self.assertConstant('/notifications/', self.livreurs[0], Notification.objects.filter(commande__in=self.commandes[:25]))
+
+    def test_detail_commande(self):
+        self.nb_requetes(f'/api/admin/commandes/{self.commandes[0].pk}/', self.admin)
+
+    def test_depassement_du_budget(self):
+        with mock.patch.object(CommandeViewSet, 'query_budget', 0):
+            client = APIClient()
+            client.force_authenticate(self.admin)
+            with self.assertRaises(BudgetRequetesDepasse):
+                client.get('/api/commandes/')
+
+    def test_budget_requetes(self):
+        with budget_requetes(1) as compteur:
+            list(Commande.objects.select_related('livreur'))
+        self.assertEqual(len(compteur), 1)
+        with self.assertRaises(BudgetRequetesDepasse):
+            with budget_requetes(1):
+                [commande.livreur for commande in Commande.objects.all()[:2]]
+
+
+class PositionsLiveTests(TestCase):
+    """ Table live des positions et recopie en base (write-behind) """
+
+    def setUp(self):
+        vider_positions_live()
+
+    def test_flush(self):
+        livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+        store = get_store()
+        version = store.write(livreur.pk, 34.0, -6.8, 1.0)
+        self.assertEqual(store.flush(force=True), 1)
+        livreur.refresh_from_db()
+        self.assertEqual((float(livreur.current_lat), float(livreur.current_long)), (34.0, -6.8))
+        self.assertEqual(int(store.slots['flushed'][livreur.pk]), version)
+        # Le marquage passe par le seqlock : compteur pair, position intacte
+        self.assertEqual(store.slots['seq'][livreur.pk] % 2, 0)
+        self.assertEqual(store.read(livreur.pk).version, version)
+        self.assertEqual(store.flush(force=True), 0)
+        store.write(livreur.pk, 34.1, -6.8, 2.0)
+        self.assertEqual(store.flush(force=True), 1)
+
+    def test_flush_en_arriere_plan(self):
+        store = get_store()
+        with override_settings(LIVE_POSITIONS_FLUSH_SECONDS=3600):
+            self.assertIsNone(store.flush_in_background())
+        with override_settings(LIVE_POSITIONS_FLUSH_SECONDS=0), mock.patch.object(store, 'flush') as flush:
+            thread = store.flush_in_background()
+            thread.join()
+        flush.assert_called_once_with()
+
+
+class CompactionTests(TestCase):
+    """ Compaction d'une journée de points GPS (logistics/trajets.py) """
+
+    def test_point_arrive_pendant_la_compaction(self):
+        livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+        jour = date(2026, 2, 10)
+        debut = timezone.make_aware(datetime(2026, 2, 10, 8))
+
+        def point(i):
+            return PositionLivreur(livreur=livreur, jour=jour, timestamp=debut + timedelta(seconds=5 * i),
+                                   latitude=34 + i * 1e-4, longitude=-6.8)
+
+        PositionLivreur.objects.bulk_create([point(i) for i in range(10)])
+        encoder = trajets.encoder
+
+        def encoder_puis_inserer(*args):
+            # Un point de la même journée arrive entre la lecture et la suppression
+            point(10).save()
+            return encoder(*args)
+
+        with mock.patch.object(trajets, 'encoder', side_effect=encoder_puis_inserer):
+            bruts, _, _ = trajets.compacter_journee(livreur.pk, jour)
+        self.assertEqual(bruts, 10)
+        self.assertEqual(PositionLivreur.objects.filter(livreur=livreur).count(), 1)
+        # Il est fusionné à la compaction suivante
+        bruts, _, _ = trajets.compacter_journee(livreur.pk, jour)
+        self.assertEqual(bruts, 11)
+        self.assertFalse(PositionLivreur.objects.filter(livreur=livreur).exists())
+        self.assertEqual(TrajetCompresse.objects.get(livreur=livreur).nb_points_bruts, 11)
+
+
+class SuiviPublicTests(TestCase):
+    """ ETag, If-None-Match et long-poll de /api/track/<tracking_id>/ """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.commande = Commande.objects.create(client_name='Client', client_phone='0600000000', montant=100)
+        cls.url = f'/api/track/{cls.commande.tracking_id}/'
+
+    def setUp(self):
+        cache.clear()   # compteurs du throttle
+
+    def test_etag(self):
+        client = APIClient()
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        for entete in (etag, f'W/{etag}', f'"autre", {etag}', '*'):
+            self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=entete).status_code, 304, entete)
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH='"autre"').status_code, 200)
+
+    def test_etag_suit_le_statut(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+        Commande.objects.filter(pk=self.commande.pk).update(statut='Annulé')
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['statut'], 'Annulé')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_long_poll_desactive(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+        with mock.patch('logistics.views.time.sleep') as sleep:
+            response = client.get(self.url, {'wait': 30}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        sleep.assert_not_called()
+
+    @override_settings(TRACKING_LONG_POLL_ACTIF=True)
+    def test_long_poll(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+
+        def livrer(secondes):
+            Commande.objects.filter(pk=self.commande.pk).update(statut='Livré')
+
+        with mock.patch('logistics.views.time.sleep', side_effect=livrer) as sleep:
+            response = client.get(self.url, {'wait': 30}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['statut'], 'Livré')
+        sleep.assert_called_once()
+
+    @override_settings(TRACKING_LONG_POLL_ACTIF=True, TRACKING_LONG_POLL_DEBIT='2/min')
+    def test_long_poll_limite(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+        for _ in range(2):
+            self.assertEqual(client.get(self.url, {'wait': 0.01}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(client.get(self.url, {'wait': 0.01}, HTTP_IF_NONE_MATCH=etag).status_code, 429)
+        # Sans ?wait=, pas de limite
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@override_settings(DISPATCH_ARRIERE_PLAN=False, DISPATCH_COMMANDES_MAX=3)
+class DispatchTests(TestCase):
+    """ /api/admin/commandes/dispatch/ : lancé hors de la requête (202), borné, un seul à la fois """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR', is_available=True,
+                                               current_lat=33.95, current_long=-6.85)
+        cls.commandes = [
+            Commande.objects.create(client_name=f'Client {i}', client_phone='0600000000', montant=100,
+                                    latitude=33.95 + i * 1e-3, longitude=-6.85)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_dispatch(self):
+        self.assertEqual(self.client.get('/api/admin/commandes/dispatch/').json(), {'etat': 'aucun'})
+        response = self.client.post('/api/admin/commandes/dispatch/', {}, format='json')
+        self.assertEqual(response.status_code, 202)
+        etat = self.client.get('/api/admin/commandes/dispatch/').json()
+        self.assertEqual(etat['etat'], 'terminé')
+        # Les 3 plus anciennes seulement
+        self.assertEqual(sorted(ligne['commande_id'] for ligne in etat['plan']),
+                         [commande.pk for commande in self.commandes[:3]])
+        self.assertEqual(Commande.objects.filter(livreur=self.livreur).count(), 3)
+
+    def test_dry_run(self):
+        response = self.client.post('/api/admin/commandes/dispatch/', {'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['assignees'], 3)
+        self.assertFalse(Commande.objects.filter(livreur__isnull=False).exists())
+
+    def test_un_seul_a_la_fois(self):
+        cache.add(dispatch.CLE_VERROU, True)
+        response = self.client.post('/api/admin/commandes/dispatch/', {}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Commande.objects.filter(livreur__isnull=False).exists())
+
+
+class ProfilVehiculeTests(SimpleTestCase):
+    """ Profil de véhicule déduit de vehicle_info (logistics/capacite.py) """
+
+    def test_mots_entiers(self):
+        self.assertEqual(profil_vehicule('Motorbike Honda').nom, 'moto')
+        self.assertEqual(profil_vehicule('Vélo cargo').nom, 'velo')
+        self.assertEqual(profil_vehicule('Dacia Dokker').nom, 'utilitaire')
+        self.assertEqual(profil_vehicule('Renault Clio, avant-garde').nom, 'voiture')
+        self.assertEqual(profil_vehicule(None), PROFIL_DEFAUT)
+
+    def test_profils_des_reglages(self):
+        self.assertEqual(profil_vehicule('tuk-tuk'), PROFIL_DEFAUT)
+        tuktuk = ProfilVehicule('tuktuk', 80, 300)
+        with override_settings(VEHICULE_PROFILS=[(('tuk',), tuktuk)]):
+            self.assertEqual(profil_vehicule('tuk-tuk'), tuktuk)
+        self.assertEqual(profil_vehicule('tuk-tuk'), PROFIL_DEFAUT)
+
+
+class IdentifiantsTests(TestCase):
+    """ Réservation du compteur des tracking_id (logistics/identifiants.py) """
+
+    def valeur(self):
+        return CompteurIdentifiant.objects.get(nom='tracking').valeur
+
+    def test_transaction_de_l_appelant(self):
+        # Réservation annulable avec la transaction : une valeur, pas de bloc
+        with transaction.atomic():
+            Allocateur(b'cle', 10).suivant()
+        self.assertEqual(self.valeur(), 1)
+
+    @override_settings(TRACKING_ID_BASE='default')
+    def test_base_dediee(self):
+        # Réservation validée sur sa propre connexion : bloc gardé même en transaction
+        allocateur = Allocateur(b'cle', 10)
+        with transaction.atomic():
+            premier = allocateur.suivant()
+            self.assertNotEqual(allocateur.suivant(), premier)
+        self.assertEqual(self.valeur(), 10)
+
+
+class PaginationCurseurTests(TestCase):
+    """ Pagination par curseur de /api/admin/commandes/ (logistics/pagination.py) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        Commande.objects.bulk_create([
+            Commande(client_name=f'Client {i}', client_phone='0600000000', montant=100) for i in range(23)
+        ])
+        # Dates en double : l'id départage
+        debut = timezone.make_aware(datetime(2026, 3, 1, 12))
+        for i, pk in enumerate(Commande.objects.order_by('id').values_list('id', flat=True)):
+            Commande.objects.filter(pk=pk).update(date_creation=debut + timedelta(minutes=i // 4))
+        cls.ordre = list(Commande.objects.order_by('-date_creation', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def parcourir(self, url, lien):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([commande['id'] for commande in response.json()['results']])
+            url = response.json()[lien]
+        return pages
+
+    def test_parcours_avant(self):
+        pages = self.parcourir('/api/admin/commandes/?limit=5', 'next')
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), self.ordre)
+
+    def test_parcours_arriere(self):
+        dernier = self.client.get('/api/admin/commandes/?limit=20').json()['next']
+        derniere_page = self.client.get(dernier).json()
+        self.assertIsNone(derniere_page['next'])
+        pages = self.parcourir(derniere_page['previous'], 'previous')
+        self.assertEqual(sum(reversed(pages), []), self.ordre[:20])
+
+    def test_curseur_invalide(self):
+        json_invalide = base64.urlsafe_b64encode(b'["n",[1]]').decode()
+        for curseur in ('abc', '!!!', json_invalide):
+            response = self.client.get('/api/admin/commandes/', {'cursor': curseur})
+            self.assertEqual(response.status_code, 404, curseur)
+
+    def test_total(self):
+        self.assertNotIn('count', self.client.get('/api/admin/commandes/?limit=5').json())
+        self.assertEqual(self.client.get('/api/admin/commandes/?limit=5&count=1').json()['count'], 23)
+
+    def test_sans_pagination(self):
+        # Sans ?limit ni ?cursor (PAGINATION_PAR_DEFAUT faux) : liste complète non enveloppée
+        self.assertEqual([commande['id'] for commande in self.client.get('/api/admin/commandes/').json()], self.ordre)
+
+
+class ListeRapideTests(TestCase):
+    """ Le chemin rapide des listes (logistics/listes.py) produit le JSON du serializer """
+
+    @classmethod
+    def setUpTestData(cls):
+        livreurs = [
+            User.objects.create_user('ahmed', password='x', role='LIVREUR', first_name='Ahmed', last_name='Alaoui'),
+            User.objects.create_user('sara', password='x', role='LIVREUR', first_name=' ', last_name=''),
+            User.objects.create_user('omar', password='x', role='LIVREUR', last_name='Benali'),
+        ]
+        for i, livreur in enumerate([*livreurs, None]):
+            Commande.objects.create(
+                client_name=f'Client é{i}', client_phone='0600000000', montant='149.90', livreur=livreur,
+                adresse_text=f'{i} rue de Rabat', latitude=33.95 + i / 100, longitude=-6.85,
+                est_fragile=bool(i % 2), date_livraison=date(2026, 3, i + 1) if i else None,
+            )
+
+    def assertMemeJson(self, champs=None):
+        queryset = Commande.objects.select_related('livreur').order_by('-date_creation', '-id')
+        attendu = CommandeSerializer(queryset, many=True, champs=champs).data
+        obtenu = commandes_rapides.serialiser(commandes_rapides.lignes(queryset, champs), champs)
+        self.assertEqual(JSONRenderer().render(obtenu), JSONRenderer().render(attendu))
+
+    def test_tous_les_champs(self):
+        self.assertMemeJson()
+
+    def test_projection(self):
+        self.assertMemeJson(['id', 'livreur_name', 'montant', 'date_creation'])
+        self.assertMemeJson(['estFragile', 'latitude', 'statut'])
+
+    def test_projection_par_l_api(self):
+        admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get('/api/admin/commandes/', {'fields': 'id,livreur_name,montant', 'limit': 10})
+        champs = ['id', 'livreur_name', 'montant']
+        attendu = CommandeSerializer(
+            Commande.objects.select_related('livreur').order_by('-date_creation', '-id'), many=True, champs=champs
+        ).data
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(attendu)))
+
+
+class ProjectionTests(TestCase):
+    """ ?fields= / ?exclude= (logistics/projection.py) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        livreur = User.objects.create_user('livreur', password='x', role='LIVREUR', first_name='Ahmed')
+        cls.commande = Commande.objects.create(client_name='Client', client_phone='0600000000', montant=100,
+                                               adresse_text='1 rue de Rabat', livreur=livreur)
+        cls.url = f'/api/admin/commandes/{cls.commande.pk}/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        sql = [requete['sql'] for requete in requetes if 'FROM "logistics_commande"' in requete['sql']]
+        self.assertEqual(len(sql), 1)
+        return response.json(), sql[0]
+
+    def test_champ_inconnu(self):
+        response = self.client.get(self.url, {'fields': 'id,inconnu'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+        response = self.client.get('/api/admin/commandes/', {'exclude': 'inconnu'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exclude', response.json())
+
+    def test_colonnes_lues(self):
+        data, sql = self.get({'fields': 'id,client_name'})
+        self.assertEqual(data, {'id': self.commande.pk, 'client_name': 'Client'})
+        self.assertIn('"client_name"', sql)
+        self.assertNotIn('"adresse_text"', sql)
+        data, sql = self.get({'exclude': 'adresse_text'})
+        self.assertNotIn('adresse_text', data)
+        self.assertNotIn('"adresse_text"', sql)
+
+    def test_jointure_livreur(self):
+        # Sans champ du livreur, plus de jointure ; avec, seules ses colonnes utiles sont lues
+        _, sql = self.get({'fields': 'id,statut'})
+        self.assertNotIn('JOIN', sql)
+        data, sql = self.get({'fields': 'id,livreur_name'})
+        self.assertEqual(data['livreur_name'], 'Ahmed')
+        self.assertIn('JOIN "authentication_user"', sql)
+        self.assertIn('"authentication_user"."first_name"', sql)
+        self.assertNotIn('"authentication_user"."password"', sql)
+
+
+class ExportTests(TestCase):
+    """ Compression de /api/admin/commandes/export/ selon Accept-Encoding """
+
+    def test_accepte_gzip(self):
+        for entete in ('gzip', 'deflate, gzip;q=0.5', 'GZIP', 'x-gzip', '*', 'br;q=1, *;q=0.1'):
+            self.assertTrue(accepte_gzip(entete), entete)
+        for entete in (None, '', 'identity', 'br', 'gzip;q=0', 'gzip; q=0.0, deflate', '*, gzip;q=0', 'gzipx'):
+            self.assertFalse(accepte_gzip(entete), entete)
+
+    def test_export(self):
+        Commande.objects.create(client_name='Client', client_phone='0600000000', montant=100)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', password='x', role='ADMIN'))
+        response = client.get('/api/admin/commandes/export/', HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Client', b''.join(response.streaming_content).decode())
+        response = client.get('/api/admin/commandes/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Client', gzip.decompress(b''.join(response.streaming_content)).decode())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Index FTS5 propre à SQLite')
+class RechercheTests(TestCase):
+    """ Index plein texte des commandes (logistics/recherche.py) tenu à jour par triggers """
+
+    def setUp(self):
+        if not recherche.index_disponible():
+            self.skipTest('SQLite sans FTS5 trigram')
+
+    def trouve(self, texte):
+        return set(recherche.filtrer(Commande.objects.all(), texte).values_list('client_name', flat=True))
+
+    def test_synchronisation(self):
+        commande = Commande.objects.create(client_name='Zineb Alaoui', client_phone='0612345678', montant=100)
+        self.assertEqual(self.trouve('zineb'), {'Zineb Alaoui'})
+        self.assertEqual(self.trouve(commande.tracking_id[4:]), {'Zineb Alaoui'})
+
+        commande.client_name = 'Zineb Bennani'
+        commande.save()
+        self.assertEqual(self.trouve('alaoui'), set())
+        self.assertEqual(self.trouve('bennani'), {'Zineb Bennani'})
+
+        Commande.objects.filter(pk=commande.pk).update(adresse_text='12 avenue Hassan II')
+        self.assertEqual(self.trouve('zineb hassan'), {'Zineb Bennani'})
+
+        Commande.objects.bulk_create([
+            Commande(client_name=f'Youssef {i}', client_phone='0600000000', montant=100) for i in range(3)
+        ])
+        self.assertEqual(self.trouve('youssef'), {'Youssef 0', 'Youssef 1', 'Youssef 2'})
+
+        commande.delete()
+        Commande.objects.filter(client_name='Youssef 1').delete()
+        self.assertEqual(self.trouve('zineb'), set())
+        self.assertEqual(self.trouve('youssef'), {'Youssef 0', 'Youssef 2'})
+
+    def test_triggers_recrees_apres_migrate(self):
+        # Ce que fait une reconstruction de table par une migration SQLite
+        with connection.cursor() as curseur:
+            for nom in recherche.TRIGGERS:
+                curseur.execute(f'DROP TRIGGER {nom}')
+        self.assertEqual(recherche.triggers_manquants(), list(recherche.TRIGGERS))
+        Commande.objects.create(client_name='Karim Idrissi', client_phone='0600000000', montant=100)
+        self.assertEqual(self.trouve('karim'), set())
+
+        config = django_apps.get_app_config('logistics')
+        post_migrate.send(sender=config, app_config=config, verbosity=0, interactive=False,
+                          using='default', apps=django_apps, plan=[])
+        self.assertEqual(recherche.triggers_manquants(), [])
+        self.assertEqual(self.trouve('karim'), {'Karim Idrissi'})
+        Commande.objects.create(client_name='Karim Tazi', client_phone='0600000000', montant=100)
+        self.assertEqual(self.trouve('karim'), {'Karim Idrissi', 'Karim Tazi'})
+
+    def test_presence_relue_apres_migrate(self):
+        self.addCleanup(recherche.index_disponible.cache_clear)
+        config = django_apps.get_app_config('logistics')
+
+        def migrer():
+            post_migrate.send(sender=config, app_config=config, verbosity=0, interactive=False,
+                              using='default', apps=django_apps, plan=[])
+
+        # Retour arrière avant la migration de l'index : la table a disparu
+        self.assertTrue(recherche.index_disponible())
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+            self.assertTrue(recherche.index_disponible())
+            migrer()
+            self.assertFalse(recherche.index_disponible())
+            self.assertEqual(self.trouve('karim'), set())
+        # Puis de nouveau migrate : l'index est revenu
+        migrer()
+        self.assertTrue(recherche.index_disponible())
+
+
+class TrajectoireTests(TestCase):
+    """ Paramètres de /api/admin/livreurs/<id>/trajectoire/ """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+
+    def get(self, params):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.get(f'/api/admin/livreurs/{self.livreur.pk}/trajectoire/', params)
+
+    def test_fenetre(self):
+        self.assertEqual(self.get({}).status_code, 200)
+        self.assertEqual(self.get({'debut': '2026-02-10T08:00:00Z', 'fin': '2026-02-10T12:00:00Z'}).status_code, 200)
+
+    def test_date_impossible(self):
+        self.assertEqual(self.get({'debut': '2026-02-30T08:00:00Z'}).status_code, 400)
+
+    @override_settings(TRAJET_FENETRE_MAX_HEURES=24)
+    def test_fenetre_trop_longue(self):
+        self.assertEqual(self.get({'debut': '2026-02-10T08:00:00Z', 'fin': '2026-02-12T08:00:00Z'}).status_code, 400)
+
+
+class PositionsLotTests(TestCase):
+    """ /api/driver/location/batch/ : lot de points GPS bufferisés par le téléphone """
+    url = '/api/driver/location/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+
+    def setUp(self):
+        vider_positions_live()
+        self.client = APIClient()
+        self.client.force_authenticate(self.livreur)
+
+    def fixes(self, n=5):
+        maintenant = timezone.now()
+        return [
+            {'lat': 33.95 + i * 1e-3, 'lng': -6.85, 'timestamp': (maintenant - timedelta(seconds=5 * (n - i))).isoformat()}
+            for i in range(n)
+        ]
+
+    def test_une_seule_ecriture(self):
+        fixes = self.fixes()
+        # Dans le désordre : le plus récent devient quand même la position courante
+        fixes.reverse()
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.post(self.url, {'fixes': fixes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received'], 5)
+        inserts = [r['sql'] for r in requetes if r['sql'].startswith('INSERT INTO "logistics_positionlivreur"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(PositionLivreur.objects.filter(livreur=self.livreur).count(), 5)
+        position = get_store().read(self.livreur.pk)
+        self.assertAlmostEqual(position.lat, 33.954)
+        self.assertAlmostEqual(position.lng, -6.85)
+
+    def test_point_invalide(self):
+        fixes = self.fixes()
+        fixes[2]['lat'] = 123
+        response = self.client.post(self.url, {'fixes': fixes}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PositionLivreur.objects.exists())
+        self.assertEqual(self.client.post(self.url, {'fixes': []}, format='json').status_code, 400)
+
+    def test_reserve_aux_livreurs(self):
+        gestionnaire = User.objects.create_user('gestionnaire', password='x', role='GESTIONNAIRE')
+        self.client.force_authenticate(gestionnaire)
+        self.assertEqual(self.client.post(self.url, {'fixes': self.fixes()}, format='json').status_code, 403)
+        self.assertEqual(APIClient().post(self.url, {'fixes': self.fixes()}, format='json').status_code, 401)
+        self.assertFalse(PositionLivreur.objects.exists())
+
+
+class LectureSeqlockTests(TestCase):
+    """ Lectures de la table live pendant une écriture (seqlock) """
+
+    def setUp(self):
+        vider_positions_live()
+
+    def test_ecriture_en_cours(self):
+        livreur = User.objects.create_user('livreur', password='x', role='LIVREUR',
+                                           current_lat=34.0, current_long=-6.8)
+        store = get_store()
+        store.write(livreur.pk, 33.9, -6.9, time.time())
+        offset = store._offset(livreur.pk)
+        seq = SEQ.unpack_from(store.mm, offset)[0]
+        # Writer arrêté au milieu de son écriture : compteur impair
+        SEQ.pack_into(store.mm, offset, seq + 1)
+        try:
+            self.assertIsNone(store.read(livreur.pk))
+            # position_livreur se rabat sur la base
+            self.assertEqual(position_livreur(livreur), (34.0, -6.8))
+        finally:
+            SEQ.pack_into(store.mm, offset, seq)
+        self.assertEqual(store.read(livreur.pk).lat, 33.9)
+
+    def test_writer_concurrent(self):
+        livreur_id = 4242
+        store = get_store()
+        store.write(livreur_id, 0.0, 0.0, time.time())
+        debut = time.time()
+        fin = threading.Event()
+
+        def ecrire():
+            i = 0
+            while not fin.is_set():
+                i += 1
+                store.write(livreur_id, float(i), -float(i), debut + i)
+
+        writer = threading.Thread(target=ecrire)
+        writer.start()
+        try:
+            for _ in range(20000):
+                position = store.read(livreur_id)
+                if position is not None and position.lat:
+                    # Jamais un mélange de deux écritures
+                    self.assertEqual(position.lng, -position.lat)
+                    self.assertEqual(position.timestamp, debut + position.lat)
+        finally:
+            fin.set()
+            writer.join()
+
+
+class GrilleLivreursTests(TestCase):
+    """ Index spatial des livreurs disponibles (logistics/spatial.py) """
+    bbox = (33.85, -7.00, 34.10, -6.70)
+
+    def setUp(self):
+        # Petites cellules : beaucoup de livreurs tombent près d'un bord de cellule
+        self.grille = GrilleLivreurs(self.bbox, 300)
+        self.points = {}
+        aleatoire = random.Random(5)
+        for livreur_id in range(1, 401):
+            lat = aleatoire.uniform(33.84, 34.11)
+            lng = aleatoire.uniform(-7.01, -6.69)
+            self.points[livreur_id] = (lat, lng)
+            self.grille.mettre_a_jour(livreur_id, lat, lng)
+
+    def force_brute(self, lat, lng):
+        return sorted((haversine_m(lat, lng, *point), livreur_id) for livreur_id, point in self.points.items())
+
+    def test_proches_comme_force_brute(self):
+        aleatoire = random.Random(6)
+        for _ in range(50):
+            lat, lng = aleatoire.uniform(33.84, 34.11), aleatoire.uniform(-7.01, -6.69)
+            attendu = self.force_brute(lat, lng)[:5]
+            obtenu = self.grille.proches(lat, lng, k=5)
+            self.assertEqual([livreur_id for livreur_id, _ in obtenu], [livreur_id for _, livreur_id in attendu])
+            for (_, distance), (reference, _) in zip(obtenu, attendu):
+                self.assertAlmostEqual(distance, reference, delta=0.01)
+
+    def test_dans_rayon_comme_force_brute(self):
+        aleatoire = random.Random(7)
+        for _ in range(50):
+            lat, lng = aleatoire.uniform(33.84, 34.11), aleatoire.uniform(-7.01, -6.69)
+            rayon = aleatoire.uniform(100, 3000)
+            attendu = [livreur_id for distance, livreur_id in self.force_brute(lat, lng) if distance <= rayon]
+            self.assertEqual([livreur_id for livreur_id, _ in self.grille.dans_rayon(lat, lng, rayon)], attendu)
+
+    def test_rayon_max(self):
+        lat, lng = 33.95, -6.85
+        attendu = [livreur_id for distance, livreur_id in self.force_brute(lat, lng)[:10] if distance <= 1500]
+        obtenu = self.grille.proches(lat, lng, k=10, rayon_max=1500)
+        self.assertEqual([livreur_id for livreur_id, _ in obtenu], attendu)
+        self.assertTrue(all(distance <= 1500 for _, distance in obtenu))
+        # Personne dans le rayon : liste vide, pas le plus proche quand même
+        grille = GrilleLivreurs(self.bbox, 300)
+        grille.mettre_a_jour(1, 34.05, -6.75)
+        self.assertEqual(grille.proches(lat, lng, k=3, rayon_max=1000), [])
+        self.assertEqual([livreur_id for livreur_id, _ in grille.proches(lat, lng, k=3)], [1])
+
+    def test_deplacement_et_retrait(self):
+        self.grille.mettre_a_jour(1, 33.95, -6.85)
+        self.grille.mettre_a_jour(1, 33.90, -6.95)
+        self.assertNotIn(1, [livreur_id for livreur_id, _ in self.grille.dans_rayon(33.95, -6.85, 50)])
+        self.assertEqual(self.grille.proches(33.90, -6.95, k=1)[0][0], 1)
+        self.grille.retirer(1)
+        self.assertNotIn(1, self.grille.positions)
+        self.assertFalse(any(1 in membres for membres in self.grille.cellules.values()))
+
+    def test_signaler_livreur_indisponible(self):
+        livreur = User.objects.create_user('livreur', password='x', role='LIVREUR', is_available=True)
+        with mock.patch.object(spatial, '_grille', self.grille):
+            spatial.signaler_livreur(livreur, 33.95, -6.85)
+            self.assertEqual(self.grille.proches(33.95, -6.85, k=1)[0][0], livreur.pk)
+            livreur.is_available = False
+            spatial.signaler_livreur(livreur)
+        self.assertNotIn(livreur.pk, self.grille.positions)
+        self.assertNotIn(livreur.pk, [livreur_id for livreur_id, _ in self.grille.proches(33.95, -6.85, k=5)])
+
+
+class FluxPositionsTests(TestCase):
+    """ Flux SSE des positions pour la carte admin (logistics/views_stream.py) """
+    url = '/api/admin/livreurs/flux/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreurs = [
+            User.objects.create_user(f'livreur{i}', password='x', role='LIVREUR') for i in range(2)
+        ]
+
+    def setUp(self):
+        vider_positions_live()
+
+    @staticmethod
+    def jeton(user):
+        return str(RefreshToken.for_user(user).access_token)
+
+    def test_authentification(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url, {'token': 'pas-un-jeton'}).status_code, 401)
+        self.assertEqual(self.client.get(self.url, {'token': self.jeton(self.livreurs[0])}).status_code, 401)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {self.jeton(self.admin)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+    def test_bbox_invalide(self):
+        jeton = self.jeton(self.admin)
+        for bbox in ('abc', '33.9,-6.9,34.0', '33.9,-6.9,34.0,-6.8,1'):
+            self.assertEqual(self.client.get(self.url, {'token': jeton, 'bbox': bbox}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'token': jeton, 'intervalle': 'vite'}).status_code, 400)
+
+    def test_instantane_puis_deltas(self):
+        store = get_store()
+        premier, second = (livreur.pk for livreur in self.livreurs)
+        debut = time.time()
+        store.write(premier, 33.95, -6.85, debut)
+        store.write(second, 33.96, -6.86, debut)
+
+        async def derouler():
+            flux = views_stream._evenements(None, 0.01)
+            evenements = [await flux.__anext__(), await flux.__anext__()]
+            store.write(second, 33.97, -6.87, debut + 1)
+            evenements.append(await flux.__anext__())
+            await flux.aclose()
+            return evenements
+
+        retry, instantane, delta = async_to_sync(derouler)()
+        self.assertEqual(retry, 'retry: 20\n\n')
+
+        def positions(evenement):
+            entete, data = evenement.rstrip('\n').split('\n')
+            self.assertEqual(entete, 'event: positions')
+            return json.loads(data.removeprefix('data: '))['positions']
+
+        self.assertEqual(sorted(positions(instantane)), [[premier, 33.95, -6.85, debut], [second, 33.96, -6.86, debut]])
+        self.assertEqual(positions(delta), [[second, 33.97, -6.87, debut + 1]])
+
+    def test_bbox_filtre(self):
+        store = get_store()
+        premier, second = (livreur.pk for livreur in self.livreurs)
+        store.write(premier, 33.95, -6.85, time.time())
+        store.write(second, 34.50, -6.85, time.time())
+
+        async def derouler():
+            flux = views_stream._evenements((33.90, -6.90, 34.00, -6.80), 0.01)
+            await flux.__anext__()
+            evenement = await flux.__anext__()
+            await flux.aclose()
+            return evenement
+
+        data = async_to_sync(derouler)().rstrip('\n').split('\n')[1]
+        self.assertEqual([ligne[0] for ligne in json.loads(data.removeprefix('data: '))['positions']], [premier])
+
+
+class PositionsBinairesTests(TestCase):
+    """ Format binaire des points GPS (logistics/parsers.py) et envoi aux deux endpoints """
+    content_type = 'application/x-livreur-positions'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+
+    def setUp(self):
+        vider_positions_live()
+        self.client = APIClient()
+        self.client.force_authenticate(self.livreur)
+
+    def fixes(self):
+        # Au dixième de seconde près ; un trou de 2 h puis un point arrivé dans le désordre
+        maintenant = timezone.now().replace(microsecond=0) - timedelta(seconds=30)
+        instants = [-7230, -7200.5, -7195, 0, -10]
+        return [
+            {'lat': 33.95 + i * 1e-3, 'lng': -6.85 - i * 1e-3, 'timestamp': maintenant + timedelta(seconds=s),
+             'precision': 5 + i, 'vitesse': 20 + i}
+            for i, s in enumerate(instants)
+        ]
+
+    def parse(self, corps):
+        return PositionBinaireParser().parse(io.BytesIO(corps))['fixes']
+
+    def test_aller_retour(self):
+        fixes = self.fixes()
+        for precision, vitesse in ((False, False), (True, False), (False, True), (True, True)):
+            corps = encoder_positions(fixes, precision=precision, vitesse=vitesse)
+            self.assertEqual(len(corps), parsers.HEADER.size + len(fixes) * (12 + precision + vitesse))
+            decodes = self.parse(corps)
+            self.assertEqual(len(decodes), len(fixes))
+            for fix, decode in zip(fixes, decodes):
+                self.assertAlmostEqual(decode['lat'], fix['lat'], places=6)
+                self.assertAlmostEqual(decode['lng'], fix['lng'], places=6)
+                self.assertEqual(decode['timestamp'], fix['timestamp'])
+                self.assertEqual(decode.get('precision'), fix['precision'] if precision else None)
+                self.assertEqual(decode.get('vitesse'), fix['vitesse'] if vitesse else None)
+
+    def test_payload_invalide(self):
+        corps = encoder_positions(self.fixes(), precision=True)
+        for tronque in (corps[:-1], corps[:parsers.HEADER.size - 1], b''):
+            with self.assertRaises(ParseError):
+                self.parse(tronque)
+        with self.assertRaises(ParseError):
+            self.parse(bytes([1]) + corps[1:])
+        # Deltas cumulés au-delà de l'an 9999
+        enorme = parsers.HEADER.pack(parsers.VERSION, 0, 0) + parsers.POINT.pack(0, 0, 2 ** 31 - 1) * 1300
+        with self.assertRaises(ParseError):
+            self.parse(enorme)
+
+    def test_encodeur_hors_bornes(self):
+        fixes = self.fixes()
+        fixes[1]['lat'] = 3000
+        with self.assertRaises(ValueError):
+            encoder_positions(fixes)
+        fixes = self.fixes()
+        fixes[0]['timestamp'] = datetime(1960, 1, 1, tzinfo=dt_timezone.utc)
+        with self.assertRaises(ValueError):
+            encoder_positions(fixes)
+
+    def test_envoi_simple(self):
+        fix = self.fixes()[3]
+        response = self.client.post('/api/driver/location/', encoder_positions([fix]), content_type=self.content_type)
+        self.assertEqual(response.status_code, 200)
+        position = get_store().read(self.livreur.pk)
+        self.assertAlmostEqual(position.lat, fix['lat'])
+        self.assertEqual(PositionLivreur.objects.get(livreur=self.livreur).timestamp, fix['timestamp'])
+
+    def test_envoi_par_lot(self):
+        fixes = self.fixes()
+        response = self.client.post('/api/driver/location/batch/', encoder_positions(fixes, precision=True, vitesse=True),
+                                    content_type=self.content_type)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received'], len(fixes))
+        self.assertEqual(sorted(PositionLivreur.objects.filter(livreur=self.livreur).values_list('timestamp', flat=True)),
+                         sorted(fix['timestamp'] for fix in fixes))
+        # Le point arrivé en dernier n'est pas le plus récent
+        self.assertAlmostEqual(get_store().read(self.livreur.pk).lat, fixes[3]['lat'])
+        tronque = encoder_positions(fixes)[:-3]
+        self.assertEqual(self.client.post('/api/driver/location/batch/', tronque, content_type=self.content_type).status_code, 400)
+        self.assertEqual(self.client.post('/api/driver/location/', tronque, content_type=self.content_type).status_code, 400)
+
+
+@override_settings(GEOFENCE_RAYON_METRES=75)
+class GeofenceTests(TestCase):
+    """ Détection d'arrivée par geofence (logistics/geofence.py) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+        cls.autre = User.objects.create_user('autre', password='x', role='LIVREUR')
+        cls.commande = Commande.objects.create(client_name='Client', client_phone='0600000000', montant=100,
+                                               latitude=33.95, longitude=-6.85, livreur=cls.livreur,
+                                               statut=Commande.StatutChoices.ASSIGNEE)
+
+    def setUp(self):
+        geofence._arrets.clear()
+        self.debut = timezone.now() - timedelta(minutes=10)
+
+    def fix(self, metres_au_nord, secondes):
+        return {'lat': 33.95 + metres_au_nord / 111_195, 'lng': -6.85,
+                'timestamp': self.debut + timedelta(seconds=secondes)}
+
+    def test_entree_puis_sortie(self):
+        signal = mock.Mock()
+        geofence.livreur_arrive.connect(signal)
+        self.addCleanup(geofence.livreur_arrive.disconnect, signal)
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(500, 0), self.fix(100, 10)]), [])
+        self.commande.refresh_from_db()
+        self.assertIsNone(self.commande.date_arrivee)
+        # Points dans le désordre : l'arrivée retenue est le premier point dans le cercle
+        arrivees = geofence.verifier_arrivees(self.livreur.pk, [self.fix(0, 40), self.fix(200, 50), self.fix(50, 30)])
+        self.assertEqual(arrivees, [self.commande.pk])
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.date_arrivee, self.debut + timedelta(seconds=30))
+        signal.assert_called_once()
+        self.assertEqual(signal.call_args.kwargs['commande_id'], self.commande.pk)
+
+        # Sortie puis retour dans le cercle : l'arrivée n'est enregistrée qu'une fois
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(500, 60), self.fix(0, 70)]), [])
+        geofence.invalider(self.livreur.pk)
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(0, 80)]), [])
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.date_arrivee, self.debut + timedelta(seconds=30))
+        signal.assert_called_once()
+
+    def test_statut_inactif(self):
+        Commande.objects.filter(pk=self.commande.pk).update(statut=Commande.StatutChoices.LIVRE)
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(0, 0)]), [])
+
+    def test_reaffectation(self):
+        # Index du livreur chargé, puis commande confiée à un autre via save()
+        self.assertEqual(len(geofence.arrets_livreur(self.livreur.pk)), 1)
+        commande = Commande.objects.get(pk=self.commande.pk)
+        commande.livreur = self.autre
+        commande.save()
+        self.assertNotIn(self.livreur.pk, geofence._arrets)
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(0, 0)]), [])
+        self.assertEqual(geofence.verifier_arrivees(self.autre.pk, [self.fix(0, 5)]), [self.commande.pk])
+
+    def test_index_perime(self):
+        # Réaffectation par un autre worker : l'index local est en retard, la base fait foi
+        geofence.arrets_livreur(self.livreur.pk)
+        Commande.objects.filter(pk=self.commande.pk).update(livreur=self.autre)
+        self.assertEqual(geofence.verifier_arrivees(self.livreur.pk, [self.fix(0, 0)]), [])
+        self.assertIsNone(Commande.objects.get(pk=self.commande.pk).date_arrivee)
+
+
+class TourneesTests(TestCase):
+    """ Séquencement des tournées (logistics/tournees.py) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR',
+                                               current_lat=33.94, current_long=-6.85)
+        # Arrêts alignés vers le nord, créés dans le désordre
+        cls.commandes = {
+            rang: Commande.objects.create(client_name=f'Client {rang}', client_phone='0600000000', montant=100,
+                                          latitude=33.94 + rang * 0.01, longitude=-6.85, livreur=cls.livreur,
+                                          statut=Commande.StatutChoices.ASSIGNEE)
+            for rang in (3, 1, 4, 2)
+        }
+
+    def setUp(self):
+        vider_positions_live()
+
+    @staticmethod
+    def matrice(points):
+        points = np.asarray(points, dtype=np.float64)
+        return np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=-1))
+
+    def test_jamais_plus_long(self):
+        aleatoire = np.random.default_rng(11)
+        for _ in range(30):
+            n = int(aleatoire.integers(4, 12))
+            D = self.matrice(aleatoire.random((n, 2)))
+            route = [int(noeud) for noeud in aleatoire.permutation(np.arange(1, n))]
+            for methode in (tournees.deux_opt, tournees.or_opt):
+                nouvelle, ameliore = methode(D, route)
+                self.assertEqual(sorted(nouvelle), list(range(1, n)))
+                self.assertLessEqual(tournees.longueur(D, nouvelle), tournees.longueur(D, route) + 1e-9)
+                if not ameliore:
+                    self.assertEqual(nouvelle, route)
+            self.assertLessEqual(tournees.longueur(D, tournees.sequencer(D)),
+                                 tournees.longueur(D, tournees.plus_proche_voisin(D)) + 1e-9)
+
+    def test_cas_simples(self):
+        # Départ en 0, arrêts en 1, 2, 3, 4 sur une droite
+        D = self.matrice([(x, 0) for x in range(5)])
+        self.assertEqual(tournees.deux_opt(D, [3, 2, 1, 4]), ([1, 2, 3, 4], True))
+        self.assertEqual(tournees.or_opt(D, [2, 3, 4, 1]), ([1, 2, 3, 4], True))
+        self.assertEqual(tournees.deux_opt(D, [1, 2, 3, 4]), ([1, 2, 3, 4], False))
+
+    def test_insertion_sans_reconstruction(self):
+        # Arrêts 1..4 déjà séquencés ; le 5 tombe entre le 2 et le 3
+        D = self.matrice([(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (2.5, 0.1)])
+        with mock.patch.object(tournees, 'plus_proche_voisin', wraps=tournees.plus_proche_voisin) as construction:
+            self.assertEqual(tournees.sequencer(D, [1, 2, 3, 4]), [1, 2, 5, 3, 4])
+        construction.assert_not_called()
+        # Un nœud disparu de la matrice est ignoré
+        self.assertEqual(tournees.sequencer(D[:5, :5], [1, 2, 9, 3, 4]), [1, 2, 3, 4])
+
+    def test_un_seul_bulk_update(self):
+        attendu = [self.commandes[rang].pk for rang in (1, 2, 3, 4)]
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(tournees.optimiser_tournees([self.livreur.pk]), {self.livreur.pk: attendu})
+        updates = [r['sql'] for r in requetes if r['sql'].startswith('UPDATE "logistics_commande"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(dict(Commande.objects.values_list('pk', 'ordre_tournee')),
+                         {pk: rang for rang, pk in enumerate(attendu, start=1)})
+        # Rangs inchangés : aucune écriture
+        with CaptureQueriesContext(connection) as requetes:
+            tournees.optimiser_tournees([self.livreur.pk])
+        self.assertFalse([r for r in requetes if r['sql'].startswith('UPDATE')])
+
+    def test_action_tournee(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = f'/api/admin/livreurs/{self.livreur.pk}/tournee/'
+        attendu = [self.commandes[rang].pk for rang in (1, 2, 3, 4)]
+        response = client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([commande['id'] for commande in response.json()], attendu)
+        self.assertEqual([commande['id'] for commande in client.get(url).json()], attendu)
+        client.force_authenticate(self.livreur)
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class DistancesTests(SimpleTestCase):
+    """ Matrices haversine par blocs et cache LRU (logistics/distances.py) """
+
+    def setUp(self):
+        aleatoire = np.random.default_rng(12)
+        self.lat = aleatoire.uniform(33.85, 34.10, 257)
+        self.lng = aleatoire.uniform(-7.00, -6.70, 257)
+        self.lat2 = aleatoire.uniform(33.85, 34.10, 131)
+        self.lng2 = aleatoire.uniform(-7.00, -6.70, 131)
+
+    @staticmethod
+    def reference(lat1, lng1, lat2, lng2):
+        """ Haversine float64 sans centrage ni blocs """
+        phi1, phi2 = np.radians(lat1)[:, None], np.radians(lat2)[None, :]
+        dlam = np.radians(lng2)[None, :] - np.radians(lng1)[:, None]
+        a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+        return 2 * RAYON_TERRE_METRES * np.arcsin(np.sqrt(a))
+
+    def test_precision_float32(self):
+        matrice = matrice_distances(self.lat, self.lng, self.lat2, self.lng2)
+        self.assertEqual(matrice.dtype, np.float32)
+        self.assertEqual(matrice.shape, (257, 131))
+        # Au centimètre près à l'échelle de la ville
+        ecart = np.abs(matrice.astype(np.float64) - self.reference(self.lat, self.lng, self.lat2, self.lng2))
+        self.assertLess(ecart.max(), 0.02)
+        carree = matrice_distances(self.lat, self.lng)
+        self.assertLess(np.abs(carree - self.reference(self.lat, self.lng, self.lat, self.lng)).max(), 0.02)
+        self.assertTrue(np.all(np.diag(carree) == 0))
+
+    def test_independant_de_la_taille_des_blocs(self):
+        attendu = matrice_distances(self.lat, self.lng, self.lat2, self.lng2)
+        for taille_bloc in (1, 7, 64, 256, 257, 1000):
+            np.testing.assert_array_equal(
+                matrice_distances(self.lat, self.lng, self.lat2, self.lng2, taille_bloc=taille_bloc), attendu
+            )
+        # Tampon de quelques lignes seulement
+        with override_settings(DISTANCES_BLOC_OCTETS=3 * 2 * 131 * 4):
+            np.testing.assert_array_equal(matrice_distances(self.lat, self.lng, self.lat2, self.lng2), attendu)
+        self.assertEqual(matrice_distances([], [], self.lat2, self.lng2).shape, (0, 131))
+
+    def test_lru(self):
+        matrices = {nom: np.full((10, 10), i, dtype=np.float32) for i, nom in enumerate('abcd')}
+        taille = matrices['a'].nbytes
+        cache = CacheMatrices(2 * taille)
+        cache.put('a', matrices['a'])
+        cache.put('b', matrices['b'])
+        self.assertIs(cache.get('a'), matrices['a'])
+        # 'b' est la moins récemment utilisée
+        cache.put('c', matrices['c'])
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual((len(cache), cache.octets), (2, 2 * taille))
+        # Remplacer une entrée ne la compte pas deux fois
+        cache.put('c', matrices['c'])
+        self.assertEqual((len(cache), cache.octets), (2, 2 * taille))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertFalse(matrices['a'].flags.writeable)
+        # Trop grosse pour le cache : ignorée, sans évincer les autres
+        cache.put('e', np.zeros((30, 30), dtype=np.float32))
+        self.assertIsNone(cache.get('e'))
+        self.assertEqual(len(cache), 2)
+
+    def test_matrice_cachee(self):
+        cache = CacheMatrices(1024 * 1024)
+        with mock.patch.object(distances, '_cache', cache):
+            premiere = matrice_cachee(self.lat2, self.lng2)
+            self.assertIs(matrice_cachee(self.lat2.copy(), self.lng2.copy()), premiere)
+            # Autres coordonnées ou autre dtype : autre entrée
+            self.assertIsNot(matrice_cachee(self.lat2[:-1], self.lng2[:-1]), premiere)
+            self.assertEqual(matrice_cachee(self.lat2, self.lng2, dtype=np.float64).dtype, np.float64)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 3))
+
+
+@override_settings(ETA_ZONE_METRES=5000, ETA_LISSAGE_SECONDES=600, ETA_VITESSE_DEFAUT=5.5,
+                   ETA_FACTEUR_DETOUR=1.3, ETA_ARRET_SECONDES=180)
+class EtaTests(TestCase):
+    """ Profils de vitesse et ETA le long de la tournée (logistics/eta.py) """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.livreur = User.objects.create_user('livreur', password='x', role='LIVREUR')
+        # Arrêts vers le nord, dans l'ordre de la tournée
+        cls.commandes = [
+            Commande.objects.create(client_name=f'Client {rang}', client_phone='0600000000', montant=100,
+                                    latitude=33.95 + rang * 0.01, longitude=-6.85, livreur=cls.livreur,
+                                    statut=Commande.StatutChoices.EN_COURS, ordre_tournee=rang)
+            for rang in (1, 2, 3)
+        ]
+
+    def setUp(self):
+        eta.invalider_profils()
+        self.addCleanup(eta.invalider_profils)
+        self.maintenant = datetime(2026, 2, 10, 10, 0, tzinfo=dt_timezone.utc)
+
+    def test_repli_des_profils(self):
+        zones = eta.get_zones()
+        # Sans historique : vitesse par défaut partout
+        vitesse, secondes = eta.calculer_profils(depuis=self.maintenant - timedelta(days=1))
+        np.testing.assert_allclose(vitesse, 5.5)
+        self.assertEqual(secondes.sum(), 0)
+
+        # 30 min d'allers-retours de 100 m toutes les 10 s, à 10 h, dans une seule zone
+        debut = self.maintenant - timedelta(hours=2)
+        nord = 33.95 + 100 / 111_195
+        PositionLivreur.objects.bulk_create([
+            PositionLivreur(livreur=self.livreur, jour=debut.date(), timestamp=debut + timedelta(seconds=10 * i),
+                            latitude=nord if i % 2 else 33.95, longitude=-6.85)
+            for i in range(181)
+        ])
+        distance, duree = 180 * haversine_m(33.95, -6.85, nord, -6.85), 1800
+        globale = (distance + 600 * 5.5) / (duree + 600)
+        par_heure = (distance + 600 * globale) / (duree + 600)
+        observee = (distance + 600 * par_heure) / (duree + 600)
+
+        vitesse, secondes = eta.calculer_profils(depuis=self.maintenant - timedelta(days=1))
+        zone = zones.zone(33.9502, -6.85)
+        self.assertEqual(secondes[8, zone], 1800)
+        self.assertAlmostEqual(vitesse[8, zone], observee)            # heure et zone observées
+        self.assertAlmostEqual(vitesse[8, zone + 1], par_heure)       # zone vide : moyenne de l'heure
+        self.assertAlmostEqual(vitesse[8, zones.nb], par_heure)       # hors zone
+        self.assertAlmostEqual(vitesse[15, zone], globale)            # heure vide : moyenne globale
+
+        eta.enregistrer_profils(vitesse, secondes)
+        self.assertAlmostEqual(eta.vitesse_attendue(33.9502, -6.85, debut), observee)
+        self.assertAlmostEqual(eta.vitesse_attendue(33.9502, -6.85, debut + timedelta(hours=7)), globale)
+        # Profils calculés avec un autre découpage : ignorés, vitesse par défaut
+        with override_settings(ETA_ZONE_METRES=1000):
+            eta.invalider_profils()
+            self.assertEqual(eta.vitesse_attendue(33.9502, -6.85, debut), 5.5)
+
+    def test_arrets_avant(self):
+        position = (33.95, -6.85)
+        etapes = [position] + [(commande.latitude, commande.longitude) for commande in self.commandes]
+        secondes = 0.0
+        for rang, commande in enumerate(self.commandes):
+            secondes += haversine_m(*etapes[rang], *etapes[rang + 1]) * 1.3 / 5.5
+            resultat = eta.eta_commande(commande, position, maintenant=self.maintenant)
+            self.assertEqual(resultat['arrets_avant'], rang)
+            self.assertEqual(resultat['secondes'], round(secondes + 180 * rang))
+            self.assertEqual(resultat['eta'], self.maintenant + timedelta(seconds=secondes + 180 * rang))
+
+        # Premier arrêt atteint : il ne compte plus devant les suivants, son ETA est immédiate
+        Commande.objects.filter(pk=self.commandes[0].pk).update(date_arrivee=self.maintenant)
+        self.commandes[0].refresh_from_db()
+        self.assertEqual(eta.eta_commande(self.commandes[2], position, maintenant=self.maintenant)['arrets_avant'], 1)
+        self.assertEqual(eta.eta_commande(self.commandes[0], position, maintenant=self.maintenant)['secondes'], 0)
+
+    def test_non_estimable(self):
+        commande = self.commandes[0]
+        self.assertIsNone(eta.eta_commande(commande, None))
+        self.assertIsNone(eta.eta_commande(commande, (None, None)))
+        commande.statut = Commande.StatutChoices.LIVRE
+        self.assertIsNone(eta.eta_commande(commande, (33.95, -6.85)))
+        attente = Commande(client_name='Client', client_phone='0600000000', montant=100, latitude=33.95, longitude=-6.85)
+        self.assertIsNone(eta.eta_commande(attente, (33.95, -6.85)))
+
+
+class AffectationsTests(TestCase):
+    """ /api/admin/commandes/assign_bulk/ : assignation et transfert en masse, tout ou rien """
+    url = '/api/admin/commandes/assign_bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.moto = User.objects.create_user('moto', password='x', role='LIVREUR', vehicle_info='Honda')
+        cls.velo = User.objects.create_user('velo', password='x', role='LIVREUR', vehicle_info='Vélo')
+
+        def commande(nom, poids=2, **champs):
+            return Commande.objects.create(client_name=nom, client_phone='0600000000', montant=100,
+                                           latitude=33.95, longitude=-6.85, poids=poids, **champs)
+
+        cls.premiere = commande('Premier')
+        cls.seconde = commande('Second')
+        cls.livree = commande('Livré', statut=Commande.StatutChoices.LIVRE)
+        cls.lourde = commande('Lourd', poids=25)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def etat(self):
+        return list(Commande.objects.order_by('pk').values_list('pk', 'livreur_id', 'statut', 'date_modification'))
+
+    def post(self, corps):
+        return self.client.post(self.url, corps, format='json')
+
+    def test_assignation(self):
+        response = self.post({'affectations': [
+            {'commande_id': self.premiere.pk, 'livreur_id': self.moto.pk},
+            {'commande_id': self.seconde.pk, 'livreur_id': self.velo.pk},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['commandes']), 2)
+        self.assertEqual(
+            list(Commande.objects.filter(pk__in=[self.premiere.pk, self.seconde.pk]).order_by('pk')
+                 .values_list('livreur_id', 'statut', 'ordre_tournee')),
+            [(self.moto.pk, 'Assignée', 1), (self.velo.pk, 'Assignée', 1)],
+        )
+        self.assertEqual(Notification.objects.filter(notification_type='order_assigned').count(), 2)
+
+    def test_tout_ou_rien(self):
+        avant = self.etat()
+        valide = {'commande_id': self.premiere.pk, 'livreur_id': self.moto.pk}
+        cas = [
+            ({'commande_id': self.seconde.pk, 'livreur_id': 999_999}, 'livreur_id', 999_999),
+            ({'commande_id': self.seconde.pk, 'livreur_id': self.admin.pk}, 'livreur_id', self.admin.pk),
+            ({'commande_id': self.livree.pk, 'livreur_id': self.moto.pk}, 'commande_id', self.livree.pk),
+            ({'commande_id': 999_999, 'livreur_id': self.moto.pk}, 'commande_id', 999_999),
+            # 25 kg sur un vélo de 10 kg
+            ({'commande_id': self.lourde.pk, 'livreur_id': self.velo.pk}, 'livreur_id', self.velo.pk),
+        ]
+        for ligne, cle, valeur in cas:
+            with self.subTest(ligne=ligne):
+                response = self.post({'affectations': [valide, ligne]})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual([detail[cle] for detail in response.json()['details']], [valeur])
+                self.assertEqual(self.etat(), avant)
+        self.assertFalse(Notification.objects.exists())
+        # La capacité peut être ignorée explicitement
+        response = self.post({'affectations': [{'commande_id': self.lourde.pk, 'livreur_id': self.velo.pk}],
+                              'forcer': True})
+        self.assertEqual(response.status_code, 200)
+
+    def test_doublons_refuses(self):
+        avant = self.etat()
+        for livreurs in ((self.moto.pk, self.velo.pk), (self.moto.pk, self.moto.pk)):
+            response = self.post({'affectations': [
+                {'commande_id': self.premiere.pk, 'livreur_id': livreurs[0]},
+                {'commande_id': self.seconde.pk, 'livreur_id': self.moto.pk},
+                {'commande_id': self.premiere.pk, 'livreur_id': livreurs[1]},
+            ]})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual([detail['commande_id'] for detail in response.json()['details']], [self.premiere.pk])
+        self.assertEqual(self.etat(), avant)
+        self.assertEqual(self.post({'affectations': [{'commande_id': self.premiere.pk}]}).status_code, 400)
+        self.assertEqual(self.post({'affectations': []}).status_code, 400)
+
+    def test_transfert(self):
+        assigner_commandes({self.premiere.pk: self.moto.pk, self.seconde.pk: self.moto.pk})
+        Commande.objects.filter(pk=self.seconde.pk).update(statut=Commande.StatutChoices.EN_COURS,
+                                                           date_arrivee=timezone.now())
+        response = self.post({'depuis_livreur': self.moto.pk, 'vers_livreur': self.velo.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['commandes']), 2)
+        self.assertFalse(Commande.objects.filter(livreur=self.moto).exists())
+        transferees = Commande.objects.filter(livreur=self.velo)
+        # Statut conservé, arrivée effacée, nouvelle tournée
+        self.assertEqual(sorted(transferees.values_list('statut', 'date_arrivee')), [('Assignée', None), ('En cours', None)])
+        self.assertEqual(sorted(transferees.values_list('ordre_tournee', flat=True)), [1, 2])
+
+    def test_transfert_refuse(self):
+        assigner_commandes({self.lourde.pk: self.moto.pk})
+        avant = self.etat()
+        response = self.post({'depuis_livreur': self.moto.pk, 'vers_livreur': self.velo.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['details'][0]['livreur_id'], self.velo.pk)
+        self.assertEqual(self.post({'depuis_livreur': self.moto.pk, 'vers_livreur': 999_999}).status_code, 400)
+        self.assertEqual(self.post({'depuis_livreur': self.moto.pk, 'vers_livreur': self.moto.pk}).status_code, 400)
+        self.assertEqual(self.etat(), avant)
+
+
+@override_settings(VAGUES_TAILLE_ZONE=5)
+class VaguesTests(TestCase):
+    """ Zones des commandes en attente, k-means à capacité (logistics/vagues.py) """
+    sites = [(33.90, -6.95), (33.95, -6.85), (34.05, -6.75)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.groupes = [[cls.commande(*site, i) for i in range(5)] for site in cls.sites]
+
+    @staticmethod
+    def commande(lat, lng, i):
+        return Commande.objects.create(client_name='Client', client_phone='0600000000', montant=100,
+                                       latitude=lat + (i % 3) * 1e-3, longitude=lng + (i // 3) * 1e-3).pk
+
+    @staticmethod
+    def zone_de(zonage):
+        return {commande_id: zone['numero'] for zone in zonage.as_dict()['zones'] for commande_id in zone['commandes']}
+
+    def test_capacite(self):
+        aleatoire = np.random.default_rng(16)
+        # Un amas de 30 points et 10 points épars, 8 zones de 5 places
+        xy = np.vstack([aleatoire.normal(0, 50, (30, 2)), aleatoire.uniform(-5000, 5000, (10, 2))])
+        centres = aleatoire.uniform(-5000, 5000, (8, 2))
+        self.assertLessEqual(np.bincount(vagues.affecter(xy, centres, 5)).max(), 5)
+        zones, centres = vagues.kmeans_capacitaire(xy, centres, 5, 30)
+        self.assertLessEqual(np.bincount(zones, minlength=8).max(), 5)
+        np.testing.assert_allclose(centres, vagues.recentrer(xy, zones, centres))
+        # Pas assez de zones pour la capacité : elle est relevée, personne n'est oublié
+        self.assertEqual(sorted(np.bincount(vagues.affecter(xy, centres[:4], 5))), [10, 10, 10, 10])
+
+    def test_reduire_completer(self):
+        xy = np.array([[0.0, 0], [1, 0], [2, 0], [100, 0], [200, 0], [201, 0]])
+        centres = np.array([[1.0, 0], [100, 0], [200, 0]])
+        # Le centre le moins peuplé disparaît, les autres gardent leur ordre
+        np.testing.assert_array_equal(vagues.reduire(xy, centres, 2), [[1, 0], [200, 0]])
+        complets = vagues.completer(xy, centres[:1], 3, np.random.default_rng(0))
+        self.assertEqual(complets.shape, (3, 2))
+        np.testing.assert_array_equal(complets[0], [1, 0])
+        self.assertTrue(all(any((point == xy).all(axis=1)) for point in complets[1:]))
+
+    def test_taille_et_numeros_stables(self):
+        premier = vagues.mettre_a_jour_zones(depuis_zero=True)
+        avant = self.zone_de(premier)
+        self.assertEqual(len(premier.centres), 3)
+        self.assertEqual(sorted(len(set(avant[pk] for pk in groupe)) for groupe in self.groupes), [1, 1, 1])
+
+        # Une commande de plus près du 2e site : une 4e zone, les autres gardent leur numéro
+        nouvelle = self.commande(*self.sites[1], 7)
+        apres = self.zone_de(vagues.mettre_a_jour_zones())
+        self.assertEqual(ZoneVague.objects.count(), 4)
+        self.assertLessEqual(max(zone.nb_commandes for zone in ZoneVague.objects.all()), 5)
+        for groupe in (self.groupes[0], self.groupes[2]):
+            self.assertEqual({apres[pk] for pk in groupe}, {avant[groupe[0]]})
+        self.assertIn(nouvelle, apres)
+
+        # Le 3e site est livré : on revient à 2 zones, toujours dans le même ordre
+        Commande.objects.filter(pk__in=self.groupes[2] + [nouvelle]).update(statut=Commande.StatutChoices.LIVRE)
+        fin = self.zone_de(vagues.mettre_a_jour_zones())
+        self.assertEqual(ZoneVague.objects.count(), 2)
+        self.assertEqual(len({fin[pk] for pk in self.groupes[0]}), 1)
+        self.assertEqual(len({fin[pk] for pk in self.groupes[1]}), 1)
+        self.assertEqual(fin[self.groupes[0][0]] < fin[self.groupes[1][0]],
+                         avant[self.groupes[0][0]] < avant[self.groupes[1][0]])
+
+    def test_action_zones(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = '/api/admin/commandes/zones/'
+        tous = sorted(pk for groupe in self.groupes for pk in groupe)
+        reponse = client.get(url).json()
+        self.assertEqual((reponse['nb_zones'], sorted(reponse['commandes_non_zonees'])), (0, tous))
+
+        reponse = client.post(url, {'depuis_zero': True}, format='json').json()
+        self.assertEqual(reponse['nb_zones'], 3)
+        self.assertEqual([zone['nb_commandes'] for zone in reponse['zones']], [5, 5, 5])
+        self.assertEqual(client.get(url).json()['zones'], reponse['zones'])
+
+        # GET ne modifie rien : une nouvelle commande rejoint une zone existante
+        nouvelle = self.commande(*self.sites[0], 9)
+        Commande.objects.filter(pk=self.groupes[0][0]).update(statut=Commande.StatutChoices.ANNULE)
+        zones = client.get(url).json()['zones']
+        self.assertIn(nouvelle, [pk for zone in zones for pk in zone['commandes']])
+        self.assertEqual(list(ZoneVague.objects.values_list('nb_commandes', flat=True)), [5, 5, 5])
+
+        client.force_authenticate(User.objects.create_user('livreur', password='x', role='LIVREUR'))
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class ImportCommandesTests(TestCase):
+    """ /api/admin/commandes/import/ : import CSV / NDJSON par lots (logistics/imports.py) """
+    url = '/api/admin/commandes/import/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def envoyer(self, nom, contenu, **champs):
+        fichier = SimpleUploadedFile(nom, contenu.encode(), content_type='text/csv')
+        return self.client.post(self.url, {'fichier': fichier, **champs}, format='multipart')
+
+    def test_separateur(self):
+        for separateur in (',', ';'):
+            texte = [f'client_name{separateur}montant{separateur}notes\n',
+                     f'Amine{separateur}12.50{separateur}"a, b; c"\n']
+            self.assertEqual(list(imports.lignes_csv(texte)),
+                             [(2, {'client_name': 'Amine', 'montant': '12.50', 'notes': 'a, b; c'}, None)])
+
+    def test_numeros_de_ligne(self):
+        texte = io.StringIO('client_name,notes\nA,"sur\ntrois\nlignes"\n\nB,\nC,x,en trop\n', newline='')
+        numeros = [(numero, erreur is None) for numero, _, erreur in imports.lignes_csv(texte)]
+        # La cellule sur trois lignes ne décale pas la suite ; la ligne vide est sautée
+        self.assertEqual(numeros, [(2, True), (6, True), (7, False)])
+
+    @override_settings(IMPORT_ERREURS_MAX=2)
+    def test_erreurs_par_ligne(self):
+        contenu = ('client_name;client_phone;montant\n'
+                   'A;0600000000;10\n'
+                   'B;0600000000;pas un nombre\n'
+                   'C;0600000000;10;en trop\n'
+                   ';0600000000;10\n'
+                   'E;0600000000;10\n')
+        rapport = self.envoyer('commandes.csv', contenu).json()
+        self.assertEqual((rapport['lignes'], rapport['importees'], rapport['rejetees']), (5, 2, 3))
+        self.assertEqual([erreur['ligne'] for erreur in rapport['erreurs']], [3, 4])
+        self.assertIn('montant', rapport['erreurs'][0]['erreurs'])
+        self.assertTrue(rapport['erreurs_tronquees'])
+        self.assertEqual(sorted(Commande.objects.values_list('client_name', flat=True)), ['A', 'E'])
+
+    def test_dry_run(self):
+        contenu = 'client_name,client_phone,montant\nA,0600000000,10\nB,0600000000,20\n'
+        response = self.envoyer('commandes.csv', contenu, dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['dry_run'], response.json()['importees']), (True, 2))
+        self.assertFalse(Commande.objects.exists())
+
+        response = self.envoyer('commandes.csv', contenu)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['importees'], 2)
+        commandes = Commande.objects.all()
+        self.assertEqual({(c.statut, c.livreur_id) for c in commandes}, {('En attente', None)})
+        self.assertEqual(len({c.tracking_id for c in commandes}), 2)
+
+    @override_settings(IMPORT_TAILLE_LOT=2)
+    def test_lots(self):
+        lignes = [json.dumps({'client_name': f'Client {i}', 'client_phone': '0600000000', 'montant': i})
+                  for i in range(1, 6)]
+        lignes.insert(3, '{pas du json')
+        with CaptureQueriesContext(connection) as requetes:
+            rapport = self.envoyer('commandes.ndjson', '\n'.join(lignes) + '\n').json()
+        self.assertEqual((rapport['importees'], rapport['rejetees']), (5, 1))
+        self.assertEqual(rapport['erreurs'][0]['ligne'], 4)
+        inserts = [r for r in requetes if r['sql'].startswith('INSERT INTO "logistics_commande"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Commande.objects.count(), 5)
+
+    def test_requete_invalide(self):
+        self.assertEqual(self.client.post(self.url, {}, format='multipart').status_code, 400)
+        self.assertEqual(self.envoyer('commandes.xlsx', 'x').status_code, 400)
+        self.assertEqual(self.envoyer('commandes.txt', 'x', format_fichier='xml').status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN : format propre à SQLite')
+class PlansRequetesTests(TestCase):
+    """
+    Les requêtes des endpoints de commandes et de notifications passent par
+    un index : aucun parcours complet de table, et pas de tri de toutes les
+    lignes pour servir une page. Les listes complètes non paginées (admin,
+    sans filtre) lisent toute la table par définition et ne sont pas testées.
+    """
+    TABLES = ('logistics_commande', 'logistics_notification')
+    NB_COMMANDES = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        cls.admin = User.objects.create_user('admin', password='x', role='ADMIN')
+        cls.livreurs = [
+            User.objects.create_user(f'livreur{i}', password='x', role='LIVREUR') for i in range(20)
+        ]
+        statuts = [choix for choix, _ in Commande.StatutChoices.choices]
+        cls.commandes = Commande.objects.bulk_create([
+            Commande(
+                client_name=f'Client {i}', client_phone='0600000000', montant=100,
+                statut=rng.choice(statuts),
+                livreur=rng.choice(cls.livreurs) if i % 5 else None,
+                date_livraison=date(2026, 1, 1) + timedelta(days=rng.randrange(180)),
+            )
+            for i in range(cls.NB_COMMANDES)
+        ], batch_size=500)
+        Notification.objects.bulk_create([
+            Notification(user=rng.choice(cls.livreurs[:3]), title='Nouvelle commande', message='...', commande=commande)
+            for commande in cls.commandes[:1000]
+        ])
+        # Statistiques pour le planificateur, comme sur une base en production
+        with connection.cursor() as curseur:
+            curseur.execute('ANALYZE')
+
+    def plans(self, url, utilisateur):
+        """ [(sql, étapes du plan)] des SELECT sur TABLES exécutés pour servir `url` """
+        requetes = []
+
+        def espion(execute, sql, params, many, context):
+            requetes.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        client.force_authenticate(utilisateur)
+        with connection.execute_wrapper(espion):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        plans = []
+        with connection.cursor() as curseur:
+            for sql, params in requetes:
+                if sql.startswith('SELECT') and any(f'"{table}"' in sql for table in self.TABLES):
+                    curseur.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plans.append((sql, [ligne[-1] for ligne in curseur.fetchall()]))
+        return response, plans
+
+    def assertIndexe(self, url, utilisateur=None):
+        response, plans = self.plans(url, utilisateur or self.admin)
+        self.assertTrue(plans, f'{url} : aucune requête sur {self.TABLES}')
+        for sql, etapes in plans:
+            for etape in etapes:
+                scan = re.match(r'SCAN (\w+)', etape)
+                if scan and scan.group(1) in self.TABLES and 'USING' not in etape:
+                    self.fail(f'{url} : parcours complet de {scan.group(1)}\n{sql}\n' + '\n'.join(etapes))
+                if ' LIMIT ' in sql and 'TEMP B-TREE FOR ORDER BY' in etape:
+                    self.fail(f'{url} : tri de toutes les lignes pour une page\n{sql}\n' + '\n'.join(etapes))
+        return response
+
+    def test_liste_commandes_paginee(self):
+        response = self.assertIndexe('/api/commandes/?limit=50')
+        # Page profonde : même plan que la première (pas d'OFFSET)
+        for _ in range(3):
+            response = self.assertIndexe(response.json()['next'])
+
+    def test_liste_commandes_filtree(self):
+        self.assertIndexe('/api/commandes/?statut=Livr%C3%A9&limit=50')
+        self.assertIndexe(f'/api/commandes/?livreur={self.livreurs[0].pk}&limit=50')
+        self.assertIndexe('/api/commandes/?date_livraison=2026-03-05')
+
+    def test_liste_commandes_livreur(self):
+        self.assertIndexe('/api/commandes/', self.livreurs[0])
+        response = self.assertIndexe('/api/commandes/?limit=20', self.livreurs[0])
+        self.assertIndexe(response.json()['next'], self.livreurs[0])
+
+    def test_tournee(self):
+        self.assertIndexe('/api/commandes/tournee/', self.livreurs[0])
+
+    def test_admin_commandes(self):
+        self.assertIndexe('/api/admin/commandes/?limit=50&statut=En%20attente')
+        self.assertIndexe(f'/api/admin/commandes/{self.commandes[10].pk}/')
+
+    def test_calendrier(self):
+        response = self.assertIndexe('/api/commandes/calendar/?month=3&year=2026')
+        total = sum(jour['total'] for jour in response.json()['data'])
+        self.assertEqual(total, Commande.objects.filter(date_livraison__year=2026, date_livraison__month=3).count())
+
+    def test_notifications(self):
+        self.assertIndexe('/notifications/?limit=20', self.livreurs[0])
+
+    def test_suivi_public(self):
+        self.assertIndexe(f'/api/track/{self.commandes[0].tracking_id}/', self.admin)
+
+    def test_recherche(self):
+        # Index plein texte : la table des commandes n'est lue que par clé primaire
+        response = self.assertIndexe('/api/admin/commandes/recherche/?q=client%201234')
+        self.assertIn('Client 1234', [commande['client_name'] for commande in response.json()])
+        for commande in response.json():
+            self.assertIn('1234', commande['client_name'] + commande['tracking_id'] + commande['client_phone'])
+        self.assertIndexe(f'/api/admin/commandes/recherche/?q={self.commandes[7].tracking_id[4:]}&statut=Livr%C3%A9')
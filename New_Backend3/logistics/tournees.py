@@ -0,0 +1,262 @@
+"""
+Séquencement des tournées : ordre de passage des commandes actives d'un livreur.
+
+Le trajet est un chemin ouvert qui part de la position du livreur (nœud 0 de
+la matrice) et visite chaque adresse une fois. Construction par plus proche
+voisin, puis amélioration locale 2-opt (inversion d'un segment) et Or-opt
+(déplacement d'un segment de 1 à 3 arrêts) jusqu'à convergence, sur une
+matrice NumPy des distances haversine.
+
+Le résultat est stocké dans Commande.ordre_tournee (1 = prochain arrêt).
+Une commande ajoutée ou retirée ne relance pas la construction : la séquence
+enregistrée sert de point de départ, le nouvel arrêt est inséré au moindre
+coût et seule l'amélioration locale tourne (quelques passes).
+"""
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.utils import timezone
+
+from .distances import matrice_cachee, matrice_distances
+from .live_positions import get_store
+from .models import Commande
+
+User = get_user_model()
+
+TAILLE_MAX_SEGMENT = 3
+
+
+def longueur(D, route):
+    """ Longueur du chemin 0 -> route[0] -> ... -> route[-1] """
+    chemin = np.concatenate(([0], route)).astype(np.int64)
+    return float(D[chemin[:-1], chemin[1:]].sum())
+
+
+def plus_proche_voisin(D):
+    """ Chemin glouton depuis le nœud 0 (renvoie les indices 1..n-1) """
+    n = len(D)
+    visite = np.zeros(n, dtype=bool)
+    visite[0] = True
+    route = []
+    courant = 0
+    for _ in range(n - 1):
+        distances = np.where(visite, np.inf, D[courant])
+        courant = int(np.argmin(distances))
+        visite[courant] = True
+        route.append(courant)
+    return route
+
+
+def inserer(D, route, noeud):
+    """ Insère `noeud` à la position de moindre surcoût (fin de chemin comprise) """
+    chemin = np.concatenate(([0], route)).astype(np.int64)
+    # Entre chemin[i] et chemin[i+1], ou après le dernier arrêt
+    surcouts = np.empty(len(chemin))
+    surcouts[:-1] = D[chemin[:-1], noeud] + D[noeud, chemin[1:]] - D[chemin[:-1], chemin[1:]]
+    surcouts[-1] = D[chemin[-1], noeud]
+    position = int(np.argmin(surcouts))
+    return route[:position] + [noeud] + route[position:]
+
+
+def deux_opt(D, route):
+    """ Inversions de segments tant qu'elles raccourcissent le chemin """
+    chemin = np.concatenate(([0], route)).astype(np.int64)
+    m = len(chemin) - 1
+    ameliore = False
+    progres = True
+    while progres:
+        progres = False
+        for i in range(1, m):
+            a, b = chemin[i - 1], chemin[i]
+            j = np.arange(i + 1, m + 1)
+            c = chemin[j]
+            # Arc (c, d) après le segment : absent si le segment termine le chemin
+            d = chemin[np.minimum(j + 1, m)]
+            apres = np.where(j < m, D[b, d] - D[c, d], 0.0)
+            gains = D[a, b] - D[a, c] - apres
+            k = int(np.argmax(gains))
+            if gains[k] > 1e-9:
+                fin = j[k]
+                chemin[i:fin + 1] = chemin[i:fin + 1][::-1].copy()
+                progres = ameliore = True
+    return chemin[1:].tolist(), ameliore
+
+
+def or_opt(D, route):
+    """ Déplacement de segments de 1 à TAILLE_MAX_SEGMENT arrêts (éventuellement inversés) """
+    route = list(route)
+    ameliore = False
+    progres = True
+    while progres:
+        progres = False
+        for taille in range(1, min(TAILLE_MAX_SEGMENT, len(route) - 1) + 1):
+            for i in range(len(route) - taille + 1):
+                segment = route[i:i + taille]
+                reste = route[:i] + route[i + taille:]
+                precedent = route[i - 1] if i > 0 else 0
+                suivant = route[i + taille] if i + taille < len(route) else None
+                gain_retrait = D[precedent, segment[0]]
+                if suivant is not None:
+                    gain_retrait += D[segment[-1], suivant] - D[precedent, suivant]
+
+                chemin = np.concatenate(([0], reste)).astype(np.int64)
+                a, b = chemin, np.append(chemin[1:], -1)
+                fin_de_chemin = b < 0
+                b = np.where(fin_de_chemin, 0, b)
+                arc = np.where(fin_de_chemin, 0.0, D[a, b])
+                premier, dernier = segment[0], segment[-1]
+                # Segment dans le sens d'origine, puis inversé
+                sens = D[a, premier] + np.where(fin_de_chemin, 0.0, D[dernier, b]) - arc
+                inverse = D[a, dernier] + np.where(fin_de_chemin, 0.0, D[premier, b]) - arc
+                # Réinsérer à la même place ne compte pas comme un déplacement
+                sens[i] = np.inf
+                if taille == 1:
+                    inverse[:] = np.inf
+                k_sens, k_inv = int(np.argmin(sens)), int(np.argmin(inverse))
+                if sens[k_sens] <= inverse[k_inv]:
+                    k, cout = k_sens, sens[k_sens]
+                else:
+                    k, cout, segment = k_inv, inverse[k_inv], segment[::-1]
+                if gain_retrait - cout > 1e-9:
+                    route = reste[:k] + segment + reste[k:]
+                    progres = ameliore = True
+                    break
+            if progres:
+                break
+    return route, ameliore
+
+
+def ameliorer(D, route):
+    """ Alterne 2-opt et Or-opt jusqu'à ce qu'aucun des deux ne progresse """
+    while True:
+        route, a = deux_opt(D, route)
+        route, b = or_opt(D, route)
+        if not (a or b):
+            return route
+
+
+def sequencer(D, route_initiale=None):
+    """
+    Ordre de visite des nœuds 1..n-1 de la matrice D (nœud 0 = départ).
+    Avec `route_initiale` (séquence existante, éventuellement incomplète),
+    les nœuds manquants y sont insérés au moindre coût au lieu de tout
+    reconstruire.
+    """
+    n = len(D)
+    if n <= 1:
+        return []
+    if route_initiale is None:
+        route = plus_proche_voisin(D)
+    else:
+        route = [noeud for noeud in route_initiale if 0 < noeud < n]
+        presents = set(route)
+        for noeud in range(1, n):
+            if noeud not in presents:
+                route = inserer(D, route, noeud)
+    if len(route) < 3:
+        return route
+    return ameliorer(D, route)
+
+
+def _positions_livreurs(livreur_ids):
+    """ {livreur_id: (lat, lng)} : table live, sinon base (une requête) """
+    store = get_store()
+    positions = {}
+    lignes = User.objects.filter(pk__in=livreur_ids).values_list('id', 'current_lat', 'current_long')
+    for livreur_id, lat, lng in lignes:
+        live = store.read(livreur_id)
+        if live is not None:
+            positions[livreur_id] = (live.lat, live.lng)
+        elif lat is not None and lng is not None:
+            positions[livreur_id] = (float(lat), float(lng))
+    return positions
+
+
+def _matrice(depart, lat, lng):
+    """
+    Matrice (n+1)x(n+1) avec le départ en nœud 0 ; départ inconnu = nœud à distance nulle.
+    Le bloc arrêts x arrêts ne change pas quand seul le livreur bouge : il vient du cache.
+    """
+    D = np.zeros((len(lat) + 1, len(lat) + 1))
+    D[1:, 1:] = matrice_cachee(lat, lng)
+    if depart is not None:
+        ligne = matrice_distances([depart[0]], [depart[1]], lat, lng)[0]
+        D[0, 1:] = ligne
+        D[1:, 0] = ligne
+    return D
+
+
+def optimiser_tournees(livreur_ids, depuis_zero=False):
+    """
+    (Re)séquence les tournées de plusieurs livreurs avec un nombre constant
+    de requêtes : arrêts, positions, puis un bulk_update des rangs modifiés.
+
+    Par défaut l'ordre enregistré sert de point de départ (réoptimisation
+    incrémentale) ; `depuis_zero=True` reconstruit par plus proche voisin.
+
+    Returns:
+        {livreur_id: [commande_id dans l'ordre de passage]}
+    """
+    livreur_ids = [livreur_id for livreur_id in set(livreur_ids) if livreur_id is not None]
+    if not livreur_ids:
+        return {}
+
+    arrets = {}
+    lignes = Commande.objects.filter(
+        livreur_id__in=livreur_ids,
+        statut__in=Commande.STATUTS_ACTIFS,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).order_by('id').values_list('id', 'livreur_id', 'latitude', 'longitude', 'ordre_tournee')
+    for ligne in lignes:
+        arrets.setdefault(ligne[1], []).append(ligne)
+    positions = _positions_livreurs(list(arrets))
+
+    tournees = {}
+    rangs = {}
+    for livreur_id, lignes_livreur in arrets.items():
+        ids = [ligne[0] for ligne in lignes_livreur]
+        lat = np.array([ligne[2] for ligne in lignes_livreur], dtype=np.float64)
+        lng = np.array([ligne[3] for ligne in lignes_livreur], dtype=np.float64)
+        D = _matrice(positions.get(livreur_id), lat, lng)
+
+        route_initiale = None
+        if not depuis_zero:
+            # Nœud i+1 = arrêt i ; les arrêts de rang 0 (nouveaux) seront insérés
+            classes = sorted((ligne[4], i + 1) for i, ligne in enumerate(lignes_livreur) if ligne[4] > 0)
+            route_initiale = [noeud for _, noeud in classes]
+        route = sequencer(D, route_initiale)
+
+        tournees[livreur_id] = [ids[noeud - 1] for noeud in route]
+        for rang, noeud in enumerate(route, start=1):
+            if lignes_livreur[noeud - 1][4] != rang:
+                rangs[ids[noeud - 1]] = rang
+
+    if rangs:
+        _enregistrer(rangs)
+    return tournees
+
+
+@transaction.atomic
+def _enregistrer(rangs):
+    maintenant = timezone.now()
+    commandes = [
+        Commande(pk=commande_id, ordre_tournee=rang, date_modification=maintenant)
+        for commande_id, rang in rangs.items()
+    ]
+    Commande.objects.bulk_update(commandes, ['ordre_tournee', 'date_modification'], batch_size=500)
+
+
+def mettre_a_jour_tournee(*livreur_ids):
+    """
+    A appeler après l'ajout ou le retrait d'une commande de la tournée d'un
+    livreur (assignation, réassignation, livraison, annulation).
+    """
+    return optimiser_tournees(livreur_ids)
+
+
+def commandes_tournee(livreur_id):
+    """ Commandes actives du livreur dans l'ordre de passage (non séquencées en dernier) """
+    return Commande.objects.filter(livreur_id=livreur_id, statut__in=Commande.STATUTS_ACTIFS).order_by(
+        models.Case(models.When(ordre_tournee=0, then=1), default=0), 'ordre_tournee', 'date_creation'
+    )
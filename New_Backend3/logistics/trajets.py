@@ -0,0 +1,234 @@
+"""
+Stockage compressé des trajets GPS : une journée de livreur terminée est
+compactée en un blob binaire au lieu de milliers de lignes PositionLivreur.
+
+Format du blob (version 1) :
+    en-tête  '<BIqii'  version, nombre de points, t0 (ms epoch), lat0, lng0 (micro-degrés)
+    corps    zlib( int32[n-1] deltas de temps (ms)
+                 | int32[n-1] deltas de latitude (micro-degrés)
+                 | int32[n-1] deltas de longitude (micro-degrés) )
+
+Les deltas d'un trajet à 5 s sont petits : zlib écrase les octets de poids
+fort, et le décodage se résume à decompress + np.cumsum.
+"""
+import struct
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PositionLivreur, TrajetCompresse
+
+VERSION = 1
+HEADER = struct.Struct('<BIqii')
+MICRO = 1_000_000
+METRES_PAR_DEGRE = 111_320.0
+# Un point brut en binaire non compressé : timestamp + lat + lng en float64
+OCTETS_POINT_BRUT = 24
+# Suppression des points compactés par lots d'ids (limite de paramètres SQL)
+TAILLE_LOT_SUPPRESSION = 500
+
+
+def douglas_peucker(lat, lng, tolerance_metres):
+    """
+    Simplification de Douglas-Peucker (version itérative).
+    Renvoie le masque booléen des points conservés ; le premier et le
+    dernier point sont toujours gardés.
+    """
+    n = len(lat)
+    garder = np.zeros(n, dtype=bool)
+    if n <= 2 or tolerance_metres <= 0:
+        garder[:] = True
+        return garder
+
+    # Projection équirectangulaire locale : suffisante à l'échelle d'une ville
+    cos_lat = np.cos(np.radians(np.mean(lat)))
+    x = np.asarray(lng, dtype=np.float64) * METRES_PAR_DEGRE * cos_lat
+    y = np.asarray(lat, dtype=np.float64) * METRES_PAR_DEGRE
+
+    garder[0] = garder[-1] = True
+    pile = [(0, n - 1)]
+    while pile:
+        debut, fin = pile.pop()
+        if fin - debut < 2:
+            continue
+        dx, dy = x[fin] - x[debut], y[fin] - y[debut]
+        px, py = x[debut + 1:fin] - x[debut], y[debut + 1:fin] - y[debut]
+        longueur = np.hypot(dx, dy)
+        if longueur == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / longueur
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance_metres:
+            milieu = debut + 1 + i
+            garder[milieu] = True
+            pile.append((debut, milieu))
+            pile.append((milieu, fin))
+    return garder
+
+
+def encoder(t_ms, lat, lng):
+    """ Encode des tableaux (ms epoch, lat, lng) triés par temps en blob """
+    t_ms = np.asarray(t_ms, dtype=np.int64)
+    lat_u = np.rint(np.asarray(lat, dtype=np.float64) * MICRO).astype(np.int64)
+    lng_u = np.rint(np.asarray(lng, dtype=np.float64) * MICRO).astype(np.int64)
+    n = len(t_ms)
+    if n == 0:
+        return HEADER.pack(VERSION, 0, 0, 0, 0)
+
+    header = HEADER.pack(VERSION, n, int(t_ms[0]), int(lat_u[0]), int(lng_u[0]))
+    deltas = np.concatenate([np.diff(t_ms), np.diff(lat_u), np.diff(lng_u)]).astype('<i4')
+    return header + zlib.compress(deltas.tobytes(), 6)
+
+
+def decoder(blob):
+    """ Décode un blob en tableaux (ms epoch int64, lat float64, lng float64) """
+    blob = bytes(blob)
+    version, n, t0, lat0, lng0 = HEADER.unpack_from(blob, 0)
+    if version != VERSION:
+        raise ValueError(f"Version de trajet compressé inconnue : {version}")
+    if n == 0:
+        vide = np.empty(0)
+        return vide.astype(np.int64), vide, vide
+
+    deltas = np.frombuffer(zlib.decompress(blob[HEADER.size:]), dtype='<i4').astype(np.int64)
+    deltas = deltas.reshape(3, n - 1)
+
+    def cumul(origine, d):
+        out = np.empty(n, dtype=np.int64)
+        out[0] = origine
+        np.cumsum(d, out=out[1:])
+        out[1:] += origine
+        return out
+
+    t_ms = cumul(t0, deltas[0])
+    lat = cumul(lat0, deltas[1]) / MICRO
+    lng = cumul(lng0, deltas[2]) / MICRO
+    return t_ms, lat, lng
+
+
+def _vers_ms(timestamps):
+    return np.array([round(ts.timestamp() * 1000) for ts in timestamps], dtype=np.int64)
+
+
+def _vers_datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+@transaction.atomic
+def compacter_journee(livreur_id, jour, tolerance_metres=None):
+    """
+    Compacte les points bruts d'un livreur pour une journée terminée.
+    Les points arrivés après une compaction précédente sont fusionnés
+    avec le blob existant. Les lignes brutes lues sont ensuite supprimées
+    (par clé primaire : un point arrivé entre-temps reste pour la prochaine fois).
+
+    Returns:
+        (nb_points_bruts de la journée, nb_points_conserves, taille_blob)
+    """
+    if tolerance_metres is None:
+        tolerance_metres = getattr(settings, 'TRAJET_TOLERANCE_METRES', 5.0)
+
+    lignes = list(
+        PositionLivreur.objects.filter(livreur_id=livreur_id, jour=jour)
+        .order_by('timestamp').values_list('pk', 'timestamp', 'latitude', 'longitude')
+    )
+    ids = [p[0] for p in lignes]
+    t_ms = _vers_ms(p[1] for p in lignes)
+    lat = np.array([p[2] for p in lignes], dtype=np.float64)
+    lng = np.array([p[3] for p in lignes], dtype=np.float64)
+    nb_bruts = len(lignes)
+
+    existant = TrajetCompresse.objects.filter(livreur_id=livreur_id, jour=jour).first()
+    if existant is not None:
+        t_old, lat_old, lng_old = decoder(existant.donnees)
+        nb_bruts += existant.nb_points_bruts
+        t_ms = np.concatenate([t_old, t_ms])
+        lat = np.concatenate([lat_old, lat])
+        lng = np.concatenate([lng_old, lng])
+        ordre = np.argsort(t_ms, kind='stable')
+        t_ms, lat, lng = t_ms[ordre], lat[ordre], lng[ordre]
+
+    garder = douglas_peucker(lat, lng, tolerance_metres)
+    t_ms, lat, lng = t_ms[garder], lat[garder], lng[garder]
+    blob = encoder(t_ms, lat, lng)
+
+    TrajetCompresse.objects.update_or_create(
+        livreur_id=livreur_id,
+        jour=jour,
+        defaults={
+            'debut': _vers_datetime(int(t_ms[0])),
+            'fin': _vers_datetime(int(t_ms[-1])),
+            'nb_points': len(t_ms),
+            'nb_points_bruts': nb_bruts,
+            'tolerance_metres': tolerance_metres,
+            'donnees': blob,
+        },
+    )
+    for i in range(0, len(ids), TAILLE_LOT_SUPPRESSION):
+        PositionLivreur.objects.filter(pk__in=ids[i:i + TAILLE_LOT_SUPPRESSION]).delete()
+    return nb_bruts, len(t_ms), len(blob)
+
+
+def compacter_trajets(avant=None, tolerance_metres=None):
+    """
+    Compacte toutes les journées terminées (jour < avant, par défaut aujourd'hui).
+    Renvoie un dict de statistiques (journées, points, octets).
+    """
+    avant = avant or timezone.localdate()
+    journees = (
+        PositionLivreur.objects.filter(jour__lt=avant)
+        .values_list('livreur_id', 'jour').distinct()
+    )
+    stats = {'journees': 0, 'points_bruts': 0, 'points_conserves': 0, 'octets': 0}
+    for livreur_id, jour in list(journees):
+        bruts, conserves, octets = compacter_journee(livreur_id, jour, tolerance_metres)
+        stats['journees'] += 1
+        stats['points_bruts'] += bruts
+        stats['points_conserves'] += conserves
+        stats['octets'] += octets
+    return stats
+
+
+def points_compresses(livreur_id, debut, fin):
+    """
+    Points des journées compactées qui recouvrent [debut, fin[.
+    Renvoie (t_ms, lat, lng) en tableaux numpy, triés par temps.
+    """
+    blobs = (
+        TrajetCompresse.objects
+        .filter(livreur_id=livreur_id, debut__lt=fin, fin__gte=debut)
+        .order_by('jour')
+        .values_list('donnees', flat=True)
+    )
+    debut_ms, fin_ms = debut.timestamp() * 1000, fin.timestamp() * 1000
+    morceaux = []
+    for blob in blobs:
+        t_ms, lat, lng = decoder(blob)
+        masque = (t_ms >= debut_ms) & (t_ms < fin_ms)
+        morceaux.append((t_ms[masque], lat[masque], lng[masque]))
+    if not morceaux:
+        vide = np.empty(0)
+        return vide.astype(np.int64), vide, vide
+    return tuple(np.concatenate(col) for col in zip(*morceaux))
+
+
+def fusionner(compresses, bruts):
+    """
+    Fusionne les points décodés et les lignes brutes (timestamp, lat, lng)
+    en une seule liste triée de tuples (datetime, lat, lng).
+    """
+    t_ms, lat, lng = compresses
+    points = [
+        (_vers_datetime(int(t)), float(a), float(b))
+        for t, a, b in zip(t_ms.tolist(), lat.tolist(), lng.tolist())
+    ]
+    if points and bruts:
+        points.extend(bruts)
+        points.sort(key=lambda p: p[0])
+        return points
+    return points or list(bruts)
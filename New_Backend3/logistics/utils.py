@@ -35,6 +35,24 @@ def notify_driver_assignment(driver, commande):
     )
 
 
+def notify_drivers_assignment_bulk(commandes):
+    """
+    Notify drivers of many new assignments at once (one INSERT).
+    `commandes` must have livreur_id set.
+    """
+    return Notification.objects.bulk_create([
+        Notification(
+            user_id=commande.livreur_id,
+            notification_type='order_assigned',
+            title='Nouvelle commande assignée',
+            message=f'Vous avez une nouvelle livraison: {commande.tracking_id} pour {commande.client_name}',
+            commande=commande,
+        )
+        for commande in commandes
+        if commande.livreur_id
+    ])
+
+
 def notify_client_status_change(commande):
     """Notify client when order status changes"""
     # You can add client user relationship later
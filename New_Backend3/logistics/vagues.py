@@ -0,0 +1,216 @@
+"""
+Zones de livraison des commandes en attente, pour planifier les vagues.
+
+Les commandes 'En attente' (une requête values_list) sont regroupées en
+zones équilibrées par un k-means à capacité : k = ceil(n / VAGUES_TAILLE_ZONE)
+et chaque zone reçoit au plus VAGUES_TAILLE_ZONE commandes. L'étape
+d'affectation est une affectation de coût minimal (distance au carré au
+centre) où chaque zone offre ses places comme colonnes identiques, même
+montage que logistics/dispatch.py ; l'étape de mise à jour recentre chaque
+zone sur ses commandes (np.bincount).
+
+Les centres sont gardés dans ZoneVague. Chaque mise à jour repart des
+centres précédents : quelques itérations absorbent les commandes arrivées
+ou parties depuis, et les numéros de zone restent stables d'une vague à
+l'autre. Seul `depuis_zero` relance une initialisation k-means++ complète.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy.optimize import linear_sum_assignment
+
+from .geo import METRES_PAR_DEGRE
+from .models import Commande, ZoneVague
+
+
+@dataclass
+class Zonage:
+    ids: np.ndarray       # commandes en attente
+    zones: np.ndarray     # indice de zone de chaque commande (-1 : pas encore de zones)
+    centres: np.ndarray   # (k, 2) latitude, longitude
+
+    def as_dict(self):
+        k = len(self.centres)
+        zonees = self.zones >= 0
+        ordre = np.argsort(self.zones[zonees], kind='stable')
+        membres = np.split(self.ids[zonees][ordre], np.cumsum(np.bincount(self.zones[zonees], minlength=k))[:-1])
+        return {
+            'nb_zones': k,
+            'zones': [
+                {
+                    'numero': z + 1,
+                    'latitude': float(self.centres[z, 0]),
+                    'longitude': float(self.centres[z, 1]),
+                    'nb_commandes': len(membres[z]),
+                    'commandes': membres[z].tolist(),
+                }
+                for z in range(k)
+            ],
+            'commandes_non_zonees': self.ids[~zonees].tolist(),
+        }
+
+
+def commandes_a_grouper():
+    """ (ids, lat, lng) des commandes en attente localisées, en une requête """
+    lignes = list(
+        Commande.objects.filter(
+            statut=Commande.StatutChoices.EN_ATTENTE,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).order_by('id').values_list('id', 'latitude', 'longitude')
+    )
+    if not lignes:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    ids, lat, lng = zip(*lignes)
+    return np.array(ids, dtype=np.int64), np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64)
+
+
+# --- Plan local en mètres (équirectangulaire autour de ZONE_BBOX) ---
+
+def _cos_lat():
+    lat_min, _, lat_max, _ = settings.ZONE_BBOX
+    return math.cos(math.radians((lat_min + lat_max) / 2))
+
+
+def _projeter(lat, lng):
+    return np.column_stack((np.asarray(lng) * _cos_lat(), np.asarray(lat))) * METRES_PAR_DEGRE
+
+
+def _deprojeter(xy):
+    return np.column_stack((xy[:, 1], xy[:, 0] / _cos_lat())) / METRES_PAR_DEGRE
+
+
+def _distances2(xy, centres):
+    """ Distances au carré (m²), forme (len(xy), len(centres)) """
+    return ((xy[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+
+
+# --- k-means à capacité ---
+
+def affecter(xy, centres, capacite):
+    """
+    Zone de chaque point minimisant la somme des distances au carré, avec au
+    plus `capacite` points par zone (relevée si les zones ne suffisent pas).
+    """
+    capacite = max(capacite, math.ceil(len(xy) / len(centres)))
+    # Une colonne par place : la colonne c appartient à la zone proprietaire[c]
+    proprietaire = np.repeat(np.arange(len(centres)), capacite)
+    lignes, colonnes = linear_sum_assignment(_distances2(xy, centres)[:, proprietaire])
+    zones = np.empty(len(xy), dtype=np.int64)
+    zones[lignes] = proprietaire[colonnes]
+    return zones
+
+
+def recentrer(xy, zones, centres):
+    """ Barycentre de chaque zone ; une zone vide garde son centre """
+    k = len(centres)
+    nb = np.bincount(zones, minlength=k)
+    sommes = np.column_stack([np.bincount(zones, weights=xy[:, d], minlength=k) for d in range(2)])
+    nouveaux = centres.copy()
+    occupees = nb > 0
+    nouveaux[occupees] = sommes[occupees] / nb[occupees, None]
+    return nouveaux
+
+
+def completer(xy, centres, k, rng):
+    """ Ajoute des centres tirés façon k-means++ jusqu'à en avoir k """
+    centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+    if len(centres) == 0:
+        centres = xy[[rng.integers(len(xy))]]
+    d2 = _distances2(xy, centres).min(axis=1)
+    nouveaux = [centres]
+    for _ in range(k - len(centres)):
+        total = d2.sum()
+        i = rng.choice(len(xy), p=d2 / total) if total > 0 else rng.integers(len(xy))
+        nouveaux.append(xy[[i]])
+        d2 = np.minimum(d2, ((xy - xy[i]) ** 2).sum(axis=1))
+    return np.vstack(nouveaux)
+
+
+def reduire(xy, centres, k):
+    """ Garde les k centres les plus peuplés (numérotation conservée) """
+    nb = np.bincount(_distances2(xy, centres).argmin(axis=1), minlength=len(centres))
+    return centres[np.sort(np.argsort(-nb, kind='stable')[:k])]
+
+
+def kmeans_capacitaire(xy, centres, capacite, iterations):
+    """
+    Itérations de Lloyd à capacité à partir de `centres`, jusqu'à ce que
+    plus aucun point ne change de zone.
+
+    Returns:
+        (zones, centres) : les centres sont les barycentres des zones renvoyées
+    """
+    zones = None
+    for _ in range(max(1, iterations)):
+        precedentes, zones = zones, affecter(xy, centres, capacite)
+        centres = recentrer(xy, zones, centres)
+        if precedentes is not None and np.array_equal(zones, precedentes):
+            break
+    return zones, centres
+
+
+# --- Zones enregistrées ---
+
+def centres_enregistres():
+    """ Centres (k, 2) en latitude, longitude, dans l'ordre des numéros """
+    lignes = list(ZoneVague.objects.order_by('numero').values_list('latitude', 'longitude'))
+    return np.array(lignes, dtype=np.float64).reshape(-1, 2)
+
+
+@transaction.atomic
+def enregistrer_zones(centres, effectifs):
+    ZoneVague.objects.all().delete()
+    ZoneVague.objects.bulk_create([
+        ZoneVague(numero=z + 1, latitude=float(lat), longitude=float(lng), nb_commandes=int(effectifs[z]))
+        for z, (lat, lng) in enumerate(centres)
+    ])
+
+
+def mettre_a_jour_zones(depuis_zero=False):
+    """
+    Recalcule les zones des commandes en attente et enregistre leurs centres.
+
+    Par défaut, part des zones enregistrées (ajoutées ou retirées selon le
+    nombre de commandes) pour VAGUES_ITERATIONS_INCREMENTALES itérations au
+    plus ; `depuis_zero` réinitialise par k-means++ pour VAGUES_ITERATIONS.
+    """
+    ids, lat, lng = commandes_a_grouper()
+    if len(ids) == 0:
+        enregistrer_zones([], [])
+        return Zonage(ids, np.empty(0, dtype=np.int64), np.empty((0, 2)))
+
+    taille = getattr(settings, 'VAGUES_TAILLE_ZONE', 25)
+    k = math.ceil(len(ids) / taille)
+    xy = _projeter(lat, lng)
+    rng = np.random.default_rng(0)
+    anciens = np.empty((0, 2)) if depuis_zero else centres_enregistres()
+    if len(anciens) == 0:
+        centres = completer(xy, anciens, k, rng)
+        iterations = getattr(settings, 'VAGUES_ITERATIONS', 30)
+    else:
+        centres = _projeter(anciens[:, 0], anciens[:, 1])
+        centres = reduire(xy, centres, k) if len(centres) > k else completer(xy, centres, k, rng)
+        iterations = getattr(settings, 'VAGUES_ITERATIONS_INCREMENTALES', 3)
+
+    zones, centres = kmeans_capacitaire(xy, centres, taille, iterations)
+    centres = _deprojeter(centres)
+    enregistrer_zones(centres, np.bincount(zones, minlength=k))
+    return Zonage(ids, zones, centres)
+
+
+def zonage_courant():
+    """
+    Zones enregistrées et appartenance des commandes en attente actuelles
+    (les nouvelles rejoignent la zone la moins coûteuse), sans rien modifier.
+    """
+    ids, lat, lng = commandes_a_grouper()
+    centres = centres_enregistres()
+    if len(centres) == 0 or len(ids) == 0:
+        return Zonage(ids, np.full(len(ids), -1, dtype=np.int64), centres)
+    xy = _projeter(lat, lng)
+    zones = affecter(xy, _projeter(centres[:, 0], centres[:, 1]), getattr(settings, 'VAGUES_TAILLE_ZONE', 25))
+    return Zonage(ids, zones, centres)
@@ -1,14 +1,33 @@
+import hashlib
+import threading
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags
 from rest_framework import viewsets, exceptions, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import SimpleRateThrottle
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import Count
 from django.db.models.functions import TruncDate
 from collections import defaultdict
 from .models import Commande
-from .serializers import CommandeSerializer
-from logistic.permissions import IsGestionnaireOrAdmin # Import depuis ton fichier image_1d83dc.png
+from .serializers import CommandeSerializer, PositionSerializer, PositionBatchSerializer
+from .positions import enregistrer_positions, position_livreur
+from .eta import eta_commande
+from .live_positions import get_store
+from .listes import ListeRapideMixin
+from .projection import champs_demandes, projeter
+from .pagination import PaginationCurseur
+from .parsers import PositionBinaireParser
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from .spatial import signaler_livreur
+from .tournees import commandes_tournee, mettre_a_jour_tournee
+from logistic.permissions import IsGestionnaireOrAdmin, IsLivreur # Import depuis ton fichier image_1d83dc.png
 from django_filters import rest_framework as filters
 from rest_framework import status
 from rest_framework import status as http_status
@@ -16,8 +35,12 @@ from rest_framework import status as http_status
 from rest_framework.decorators import api_view
 
 
-class CommandeViewSet(viewsets.ModelViewSet):
+class CommandeViewSet(ListeRapideMixin, viewsets.ModelViewSet):
     serializer_class = CommandeSerializer
+    # Requêtes SQL max par appel (QueryBudgetMiddleware) : liste et détail en jointure
+    query_budget = 10
+    # ?limit= / ?cursor= : pages triées sur (date_creation, id)
+    pagination_class = PaginationCurseur
 
     def get_permissions(self):
         # Seuls les Admins/Gestionnaires peuvent créer ou modifier (PUT/PATCH) la commande entière
@@ -30,9 +53,9 @@ class CommandeViewSet(viewsets.ModelViewSet):
         user = self.request.user
         # Le livreur ne voit QUE ses commandes assignées
         if getattr(user, 'role', '') == 'LIVREUR':
-            return Commande.objects.filter(livreur=user).order_by('-date_creation')
+            return Commande.objects.filter(livreur=user).select_related('livreur').order_by('-date_creation')
         # L'admin/Gestionnaire voit tout
-        return Commande.objects.all().order_by('-date_creation')
+        return Commande.objects.select_related('livreur').order_by('-date_creation')
 
     @action(detail=True, methods=['patch'])
     def update_statut(self, request, pk=None):
@@ -50,9 +73,21 @@ class CommandeViewSet(viewsets.ModelViewSet):
         if nouveau_statut in ['En cours', 'Livré', 'Annulé']:
             commande.statut = nouveau_statut
             commande.save()
+            mettre_a_jour_tournee(commande.livreur_id)
             return Response({'status': f'Statut mis à jour : {nouveau_statut}'})
         
         return Response({'error': 'Statut invalide'}, status=400)
+
+    @action(detail=False, methods=['get'])
+    def tournee(self, request):
+        """
+        FONCTIONNALITÉ LIVREUR :
+        Commandes actives du livreur dans l'ordre de passage (ordre_tournee).
+        """
+        if getattr(request.user, 'role', '') != 'LIVREUR':
+            raise exceptions.PermissionDenied("Réservé aux livreurs.")
+        serializer = self.get_serializer(commandes_tournee(request.user.pk).select_related('livreur'), many=True)
+        return Response(serializer.data)
     
     def history(self, request):
         """
@@ -70,7 +105,7 @@ class CommandeViewSet(viewsets.ModelViewSet):
         history = Commande.objects.filter(
             livreur=user,
             statut='Livré'
-        ).order_by('-date_livraison')
+        ).select_related('livreur').order_by('-date_livraison')
         
         serializer = self.get_serializer(history, many=True)
         
@@ -86,29 +121,44 @@ class CommandeViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.DjangoFilterBackend]
     filterset_fields = ['statut', 'date_livraison', 'livreur']
 
-class PublicTrackingView(APIView):
-    """ Pour le client final : Tracking sans login via tracking_id """
-    permission_classes = [permissions.AllowAny]
-
-    def get(self, request, tracking_id):
-        cmd = get_object_or_404(Commande, tracking_id=tracking_id)
-        return Response({
-            'tracking_id': cmd.tracking_id,
-            'statut': cmd.statut,
-            # On ne renvoie que la position GPS, pas les données privées
-            'livreur_lat': cmd.livreur.current_lat if cmd.livreur else None,
-            'livreur_long': cmd.livreur.current_long if cmd.livreur else None,
-        })
-
 class DriverLocationView(APIView):
     """ Flutter met à jour le GPS du livreur ici toutes les 5s """
     permission_classes = [permissions.IsAuthenticated]
+    # JSON pour les anciennes versions de l'app, binaire compact pour les nouvelles
+    parser_classes = [JSONParser, FormParser, MultiPartParser, PositionBinaireParser]
 
     def post(self, request):
-        request.user.current_lat = request.data.get('lat')
-        request.user.current_long = request.data.get('lng')
-        request.user.save()
+        if 'fixes' in request.data:
+            # Le format binaire transporte toujours une liste de points
+            serializer = PositionBatchSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            fixes = serializer.validated_data['fixes']
+        else:
+            serializer = PositionSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            fixes = [serializer.validated_data]
+        enregistrer_positions(request.user, fixes)
         return Response({'status': 'GPS Updated'})
+
+
+class DriverLocationBatchView(APIView):
+    """
+    Variante par lot de DriverLocationView : le téléphone bufferise 30 à 60 s
+    de points et les envoie en un seul appel (une seule écriture côté serveur).
+    """
+    permission_classes = [IsLivreur]
+    parser_classes = [JSONParser, PositionBinaireParser]
+
+    def post(self, request):
+        serializer = PositionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fixes = serializer.validated_data['fixes']
+        dernier = enregistrer_positions(request.user, fixes)
+        return Response({
+            'status': 'GPS Updated',
+            'received': len(fixes),
+            'timestamp': dernier['timestamp'],
+        })
     
 from rest_framework import status  # ← Add this import at the top
 
@@ -135,6 +185,7 @@ class DriverAvailabilityView(APIView):
         
         user.is_available = is_available
         user.save()
+        signaler_livreur(user)
         
         return Response({
             'message': 'Disponibilité mise à jour',
@@ -196,13 +247,19 @@ class CalendarView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Filter commandes by month and year
+        try:
+            debut = date(int(year), int(month), 1)
+        except ValueError:
+            return Response({'error': 'month et year invalides'}, status=status.HTTP_400_BAD_REQUEST)
+        fin = date(debut.year + debut.month // 12, debut.month % 12 + 1, 1)
+
+        # Plage de dates (et non __month / __year) : lue sur l'index (date_livraison, statut)
         commandes = Commande.objects.filter(
-            date_livraison__month=month,
-            date_livraison__year=year
+            date_livraison__gte=debut,
+            date_livraison__lt=fin
         ).values('date_livraison', 'statut').annotate(
             count=Count('id')
-        )
+        ).order_by()
         
         # Group by date
         calendar_data = defaultdict(lambda: {
@@ -229,43 +286,161 @@ class CalendarView(APIView):
             'data': list(calendar_data.values())
         })
     
+class LongPollThrottle(SimpleRateThrottle):
+    """ Débit des attentes ?wait= du suivi public, par adresse IP (TRACKING_LONG_POLL_DEBIT) """
+    scope = 'suivi_long_poll'
+
+    def get_rate(self):
+        return getattr(settings, 'TRACKING_LONG_POLL_DEBIT', '30/min')
+
+    def get_cache_key(self, request, view):
+        if not view.long_poll_demande(request):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+# Attentes en cours dans ce worker : au-delà, la réponse part sans attendre
+_long_polls = threading.BoundedSemaphore(getattr(settings, 'TRACKING_LONG_POLL_SIMULTANES', 4))
+
+
 class PublicTrackingView(APIView):
+    """
+    Tracking public, interrogé en boucle par les clients.
+
+    Chaque réponse porte un ETag fort calculé sur le corps servi (statut,
+    position, ETA...) : un client qui renvoie If-None-Match reçoit un 304
+    tant que rien de ce qu'il a reçu n'a changé.
+    Avec TRACKING_LONG_POLL_ACTIF et ?wait=30, la requête reste en attente
+    jusqu'à ce que le statut ou la position change (long-poll), puis renvoie
+    200, ou 304 à l'expiration. Sous WSGI chaque attente occupe un worker :
+    désactivé par défaut, limité par IP et en nombre d'attentes simultanées.
+    """
     permission_classes = [permissions.AllowAny]
-
-    def get(self, request, tracking_id):
-        # Validate tracking ID format
-        if not tracking_id or len(tracking_id) < 5:
-            return Response(
-                {'error': 'Numéro de suivi invalide'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        try:
-            cmd = Commande.objects.get(tracking_id=tracking_id)
-        except Commande.DoesNotExist:
-            return Response(
-                {'error': 'Numéro de suivi introuvable'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
+    throttle_classes = [LongPollThrottle]
+
+    def long_poll_demande(self, request):
+        return getattr(settings, 'TRACKING_LONG_POLL_ACTIF', False) and bool(request.query_params.get('wait'))
+
+    def etat(self, tracking_id):
+        """ Version courante du suivi : une lecture indexée, sans jointure livreur """
+        etat = Commande.objects.filter(tracking_id=tracking_id).values(
+            'id', 'statut', 'livreur_id', 'date_modification'
+        ).first()
+        if etat is None:
+            return None
+        modifie = etat['date_modification']
+        version = 0
+        if etat['livreur_id'] and etat['statut'] == 'En cours':
+            position = get_store().read(etat['livreur_id'])
+            if position is not None:
+                version = position.version
+                modifie = max(modifie, datetime.fromtimestamp(position.timestamp, tz=dt_timezone.utc))
+        # Change avec le statut, la commande ou la position : sert à détecter un changement en long-poll
+        etat['version'] = (etat['statut'], etat['date_modification'], etat['livreur_id'], version)
+        etat['last_modified'] = modifie
+        return etat
+
+    def corps(self, etat):
+        cmd = Commande.objects.select_related('livreur').get(pk=etat['id'])
         response_data = {
             'tracking_id': cmd.tracking_id,
             'statut': cmd.statut,
             'client_name': cmd.client_name,
             'adresse_text': cmd.adresse_text,
             'date_creation': cmd.date_creation,
+            'date_arrivee': cmd.date_arrivee,
         }
         
         # Only include driver location if delivery is in progress
         if cmd.livreur and cmd.statut == 'En cours':
+            livreur_lat, livreur_long = position_livreur(cmd.livreur)
             response_data.update({
                 'livreur_name': cmd.livreur.username,
                 'livreur_phone': cmd.livreur.phone,
-                'livreur_lat': cmd.livreur.current_lat,
-                'livreur_long': cmd.livreur.current_long,
+                'livreur_lat': livreur_lat,
+                'livreur_long': livreur_long,
             })
+            # ETA estimée à la minute : sans nouvelle position, le corps (et l'ETag)
+            # change au plus une fois par minute
+            minute = timezone.now().replace(second=0, microsecond=0)
+            eta = eta_commande(cmd, (livreur_lat, livreur_long), maintenant=minute)
+            if eta is not None:
+                response_data.update({
+                    'eta': eta['eta'],
+                    'eta_secondes': eta['secondes'],
+                    'distance_restante_m': eta['distance_m'],
+                    'arrets_avant': eta['arrets_avant'],
+                })
+        return response_data
+
+    def etag(self, response_data):
+        """ Empreinte du corps tel qu'il est rendu en JSON """
+        return '"{}"'.format(hashlib.blake2b(JSONRenderer().render(response_data), digest_size=16).hexdigest())
+
+    def non_modifie(self, request, etag):
+        """ If-None-Match : liste d'ETags, '*', comparaison faible (W/ ignoré), comme Django """
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return '*' in etags or etag in [tag.removeprefix('W/') for tag in etags]
+
+    def get(self, request, tracking_id):
+        # Validate tracking ID format
+        if not tracking_id or len(tracking_id) < 5:
+            return Response(
+                {'error': 'Numéro de suivi invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response(response_data)
+        etat = self.etat(tracking_id)
+        if etat is None:
+            return Response(
+                {'error': 'Numéro de suivi introuvable'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        response_data = self.corps(etat)
+        etag = self.etag(response_data)
+        if self.non_modifie(request, etag) and self.long_poll_demande(request):
+            etat = self.attendre_changement(tracking_id, etat, request.query_params.get('wait'))
+            if etat is None:
+                return Response(
+                    {'error': 'Numéro de suivi introuvable'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            response_data = self.corps(etat)
+            etag = self.etag(response_data)
+        if self.non_modifie(request, etag):
+            return self.avec_validateurs(Response(status=status.HTTP_304_NOT_MODIFIED), etat, etag)
+        return self.avec_validateurs(Response(response_data), etat, etag)
+
+    def attendre_changement(self, tracking_id, etat, wait):
+        """
+        Long-poll : relit la version toutes les TRACKING_LONG_POLL_PAS secondes
+        (position en mémoire, statut par une lecture indexée) jusqu'au changement
+        ou à l'expiration de ?wait= (plafonné par TRACKING_LONG_POLL_MAX).
+        Sans place libre parmi TRACKING_LONG_POLL_SIMULTANES, pas d'attente.
+        """
+        try:
+            wait = min(float(wait or 0), getattr(settings, 'TRACKING_LONG_POLL_MAX', 30))
+        except ValueError:
+            wait = 0
+        if wait <= 0 or not _long_polls.acquire(blocking=False):
+            return etat
+        try:
+            pas = getattr(settings, 'TRACKING_LONG_POLL_PAS', 1.0)
+            fin = time.monotonic() + wait
+            version = etat['version']
+            while etat is not None and etat['version'] == version and time.monotonic() < fin:
+                time.sleep(min(pas, max(0, fin - time.monotonic())))
+                etat = self.etat(tracking_id)
+            return etat
+        finally:
+            _long_polls.release()
+
+    def avec_validateurs(self, response, etat, etag):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(etat['last_modified'].timestamp())
+        response['Cache-Control'] = 'no-cache'
+        return response
 
 
 
@@ -285,10 +460,19 @@ class NotificationListView(APIView):
     GET: List all notifications for the authenticated user
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
+    ordre_pagination = ('-created_at', '-id')
     
     def get(self, request):
-        notifications = Notification.objects.filter(user=request.user)
-        serializer = NotificationSerializer(notifications, many=True)
+        notifications = Notification.objects.filter(user=request.user).select_related('commande')
+        # ?fields= / ?exclude= : seules les colonnes des champs demandés sont lues
+        champs = champs_demandes(request, NotificationSerializer)
+        if champs is not None:
+            notifications = projeter(notifications, NotificationSerializer(champs=champs), toujours=('created_at', 'id'))
+        # ?limit= / ?cursor= : pages triées sur (created_at, id), liens next / previous
+        paginator = PaginationCurseur()
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = NotificationSerializer(notifications if page is None else page, many=True, champs=champs)
         
         # Count unread notifications
         unread_count = notifications.filter(is_read=False).count()
@@ -296,6 +480,7 @@ class NotificationListView(APIView):
         return Response({
             'notifications': serializer.data,
             'unread_count': unread_count,
+            **(paginator.get_pagination_data() if page is not None else {}),
         }, status=status.HTTP_200_OK)
 
 
@@ -307,7 +492,7 @@ class NotificationMarkAsReadView(APIView):
     
     def patch(self, request, notification_id):
         try:
-            notification = Notification.objects.get(
+            notification = Notification.objects.select_related('commande').get(
                 id=notification_id,
                 user=request.user
             )
@@ -427,7 +612,7 @@ class UpdateCommandeStatusView(APIView):
     
     def patch(self, request, commande_id):
         try:
-            commande = Commande.objects.get(id=commande_id)
+            commande = Commande.objects.select_related('livreur').get(id=commande_id)
             
             # Check if user is the assigned driver
             if not hasattr(request.user, 'livreur') or commande.livreur != request.user.livreur:
@@ -472,12 +657,14 @@ class UpdateCommandeStatusView(APIView):
 @api_view(['GET'])
 def track_commande(request, tracking_id):
     try:
-        commande = Commande.objects.get(tracking_id=tracking_id)
+        commande = Commande.objects.select_related('livreur').get(tracking_id=tracking_id)
         
         # ✅ CHANGE THIS LINE:
         # OLD: livreur_name = commande.livreur.username if commande.livreur else None
         # NEW:
         livreur_name = commande.livreur.get_display_name() if commande.livreur else None
+        position = position_livreur(commande.livreur)
+        eta = eta_commande(commande, position)
         
         data = {
             'tracking_id': commande.tracking_id,
@@ -486,14 +673,16 @@ def track_commande(request, tracking_id):
             'adresse_text': commande.adresse,
             'livreur_name': livreur_name,  # ✅ Now shows full name
             'livreur_phone': commande.livreur.phone if commande.livreur else None,
-            'livreur_lat': commande.livreur.current_lat if commande.livreur else None,
-            'livreur_long': commande.livreur.current_long if commande.livreur else None,
+            'livreur_lat': position[0],
+            'livreur_long': position[1],
             'destination_lat': getattr(commande, 'destination_lat', None),
             'destination_long': getattr(commande, 'destination_long', None),
             'date_creation': commande.date_creation,
             'date_en_cours': getattr(commande, 'date_en_cours', None),
             'date_livraison': commande.date_livraison,
             'montant': float(commande.montant) if commande.montant else None,
+            'eta': eta['eta'] if eta else None,
+            'eta_secondes': eta['secondes'] if eta else None,
         }
         
         return Response(data)
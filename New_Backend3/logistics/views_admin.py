@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from datetime import timedelta
 from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django_filters import rest_framework as filters
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -9,6 +17,19 @@ from rest_framework.views import APIView
 from authentication.serializers import UserSerializer
 from .serializers import CommandeSerializer
 from .models import Commande
+from .affectations import AffectationInvalide, assigner_commandes, transferer_commandes
+from .capacite import surcharges
+from .dispatch import dispatcher, etat_dispatch, lancer_dispatch
+from .exports import FORMATS as FORMATS_EXPORT, accepte_gzip, exporter_commandes, format_export
+from .imports import FormatInvalide, format_du_fichier, importer_commandes
+from .listes import ListeRapideMixin, commandes_rapides
+from .pagination import PaginationCurseur
+from .projection import ProjectionMixin
+from .recherche import CHAMPS_RESULTAT, rechercher
+from .tournees import commandes_tournee, mettre_a_jour_tournee, optimiser_tournees
+from .vagues import mettre_a_jour_zones, zonage_courant
+from .positions import position_livreur, trajectoire
+from .spatial import get_grille
 
 User = get_user_model()
 
@@ -50,10 +71,13 @@ class AdminDashboardStatsView(APIView):
         })
 
 # --- 3. GESTION DES UTILISATEURS (CRUD COMPLET) ---
-class AdminUserViewSet(viewsets.ModelViewSet):
+class AdminUserViewSet(ProjectionMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminOrManager]
+    # ?limit= / ?cursor= : pages triées sur (date_joined, id)
+    pagination_class = PaginationCurseur
+    ordre_pagination = ('-date_joined', '-id')
 
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
@@ -65,7 +89,7 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         return Response({"status": f"Utilisateur {status_text}"})
 
 # --- 4. GESTION DES LIVREURS ---
-class AdminLivreurViewSet(viewsets.ModelViewSet):
+class AdminLivreurViewSet(ProjectionMixin, viewsets.ModelViewSet):
     queryset = User.objects.filter(role="LIVREUR")
     serializer_class = UserSerializer
     permission_classes = [IsAdminOrManager]
@@ -73,18 +97,74 @@ class AdminLivreurViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def location(self, request, pk=None):
         livreur = self.get_object() # C'est déjà un objet User
+        lat, long = position_livreur(livreur)
         return Response({
             "livreur": livreur.username, # Pas de .user ici
-            "lat": livreur.current_lat,
-            "long": livreur.current_long,
+            "lat": lat,
+            "long": long,
             "dispo": livreur.is_available
         })
 
+    @action(detail=True, methods=['get', 'post'])
+    def tournee(self, request, pk=None):
+        """
+        Ordre de passage des commandes actives du livreur.
+        POST : recalcule la tournée depuis zéro (plus proche voisin + 2-opt/Or-opt).
+        """
+        livreur = self.get_object()
+        if request.method == 'POST':
+            optimiser_tournees([livreur.pk], depuis_zero=True)
+        commandes = commandes_tournee(livreur.pk).select_related('livreur')
+        return Response(CommandeSerializer(commandes, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def trajectoire(self, request, pk=None):
+        """
+        Trajet GPS d'un livreur sur une fenêtre de temps.
+        Query params: ?debut=2026-02-10T08:00:00Z&fin=2026-02-10T12:00:00Z
+        (par défaut : les dernières 24h)
+        """
+        livreur = self.get_object()
+        try:
+            # parse_datetime lève ValueError sur une date bien formée mais impossible (2026-02-30)
+            fin = parse_datetime(request.query_params.get('fin', '')) or timezone.now()
+            debut = parse_datetime(request.query_params.get('debut', '')) or fin - timedelta(hours=24)
+        except ValueError:
+            return Response({"error": "Date invalide"}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(debut):
+            debut = timezone.make_aware(debut)
+        if timezone.is_naive(fin):
+            fin = timezone.make_aware(fin)
+        if debut >= fin:
+            return Response({"error": "debut doit précéder fin"}, status=status.HTTP_400_BAD_REQUEST)
+        fenetre_max = getattr(settings, 'TRAJET_FENETRE_MAX_HEURES', 7 * 24)
+        if fin - debut > timedelta(hours=fenetre_max):
+            return Response(
+                {"error": f"Fenêtre limitée à {fenetre_max} h"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        points = trajectoire(livreur.pk, debut, fin)
+        return Response({
+            "livreur": livreur.username,
+            "debut": debut,
+            "fin": fin,
+            "count": len(points),
+            "points": [[ts, lat, lng] for ts, lat, lng in points],
+        })
+
 # --- 5. SUPERVISION DES COMMANDES ---
-class AdminCommandeViewSet(viewsets.ModelViewSet):
-    queryset = Commande.objects.all().order_by('-date_creation')
+class AdminCommandeViewSet(ListeRapideMixin, viewsets.ModelViewSet):
+    queryset = Commande.objects.select_related('livreur').order_by('-date_creation')
     serializer_class = CommandeSerializer
     permission_classes = [IsAdminOrManager]
+    # Requêtes SQL max par appel (QueryBudgetMiddleware), sauf actions en masse
+    query_budget = 10
+    # ?limit= / ?cursor= : pages triées sur (date_creation, id)
+    pagination_class = PaginationCurseur
+    # Mêmes filtres que /api/commandes/, pour la liste et l'export
+    filter_backends = [filters.DjangoFilterBackend]
+    filterset_fields = ['statut', 'date_livraison', 'livreur']
+    actions_projetees = ('list', 'retrieve', 'export_commandes', 'recherche')
 
     def perform_create(self, serializer):
         # L'admin peut créer une commande manuellement
@@ -94,10 +174,12 @@ class AdminCommandeViewSet(viewsets.ModelViewSet):
     def assign_livreur(self, request, pk=None):
         """
         L'admin assigne manuellement une commande à un livreur spécifique.
-        Body JSON attendu: { "livreur_id": 12 }
+        Body JSON attendu: { "livreur_id": 12, "forcer": false }
+        ("forcer" ignore la capacité du véhicule)
         """
         commande = self.get_object()
         livreur_id = request.data.get('livreur_id')
+        forcer = str(request.data.get('forcer', '')).lower() in ('1', 'true')
         
         if not livreur_id:
             return Response({"error": "ID Livreur manquant"}, status=status.HTTP_400_BAD_REQUEST)
@@ -111,14 +193,200 @@ class AdminCommandeViewSet(viewsets.ModelViewSet):
         except User.DoesNotExist:
             return Response({"error": "Livreur introuvable"}, status=404)
 
+        # Vérifier que le colis rentre dans le véhicule
+        if not forcer and commande.livreur_id != livreur_user.pk:
+            erreurs = surcharges(
+                {livreur_user.pk: livreur_user.vehicle_info}, {livreur_user.pk: [commande]}, exclure=[commande.pk]
+            )
+            if erreurs:
+                return Response({"error": "Capacité du véhicule dépassée", "details": erreurs}, status=400)
+
         # Assigner
+        ancien_livreur_id = commande.livreur_id
         commande.livreur = livreur_user
         commande.statut = "En cours" # Passe automatiquement en cours
         commande.save()
+        mettre_a_jour_tournee(ancien_livreur_id, livreur_user.pk)
         
         return Response({
             "status": "Commande assignée avec succès",
             "livreur": livreur_user.username,
             "commande": commande.tracking_id
         })
+
+    @action(detail=False, methods=['post'], query_budget=20)
+    def assign_bulk(self, request):
+        """
+        Assignation / réassignation en masse, tout ou rien.
+        Body JSON attendu:
+            { "affectations": [{ "commande_id": 1, "livreur_id": 12 }, ...] }
+        ou, pour transférer toutes les commandes ouvertes d'un livreur :
+            { "depuis_livreur": 7, "vers_livreur": 12 }
+        "forcer": true ignore la capacité des véhicules.
+        """
+        forcer = str(request.data.get('forcer', '')).lower() in ('1', 'true')
+        try:
+            if 'affectations' in request.data:
+                livreur_de = {}
+                doublons = []
+                for ligne in request.data['affectations']:
+                    commande_id = int(ligne['commande_id'])
+                    if commande_id in livreur_de:
+                        # Deux lignes pour la même commande : ambigu, on refuse tout le lot
+                        doublons.append({'commande_id': commande_id, 'error': 'Commande présente plusieurs fois'})
+                    livreur_de[commande_id] = int(ligne['livreur_id'])
+                if not livreur_de:
+                    return Response({"error": "Aucune affectation"}, status=status.HTTP_400_BAD_REQUEST)
+                if doublons:
+                    raise AffectationInvalide(doublons)
+                commandes = assigner_commandes(livreur_de, forcer=forcer)
+            elif 'depuis_livreur' in request.data and 'vers_livreur' in request.data:
+                depuis = int(request.data['depuis_livreur'])
+                vers = int(request.data['vers_livreur'])
+                if depuis == vers:
+                    return Response({"error": "Livreurs source et cible identiques"}, status=status.HTTP_400_BAD_REQUEST)
+                commandes = transferer_commandes(depuis, vers, forcer=forcer)
+            else:
+                return Response(
+                    {"error": "affectations ou depuis_livreur/vers_livreur requis"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "Format d'affectation invalide"}, status=status.HTTP_400_BAD_REQUEST)
+        except AffectationInvalide as e:
+            return Response({"error": "Affectations refusées", "details": e.erreurs}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "status": f"{len(commandes)} commande(s) assignée(s)",
+            "commandes": [
+                {"id": c.pk, "tracking_id": c.tracking_id, "livreur_id": c.livreur_id, "statut": c.statut}
+                for c in commandes
+            ],
+        })
+
+    @action(detail=True, methods=['get'])
+    def livreurs_proches(self, request, pk=None):
+        """
+        Livreurs disponibles les plus proches de l'adresse de la commande.
+        Query params: ?k=5 (nombre de livreurs) &rayon=3000 (mètres, optionnel)
+        """
+        commande = self.get_object()
+        if commande.latitude is None or commande.longitude is None:
+            return Response({"error": "Commande sans coordonnées GPS"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = min(int(request.query_params.get('k', 5)), 50)
+            rayon = request.query_params.get('rayon')
+            rayon = float(rayon) if rayon else None
+        except ValueError:
+            return Response({"error": "Paramètres k/rayon invalides"}, status=status.HTTP_400_BAD_REQUEST)
+
+        grille = get_grille()
+        resultats = grille.proches(commande.latitude, commande.longitude, k=k, rayon_max=rayon)
+        noms = User.objects.in_bulk([livreur_id for livreur_id, _ in resultats])
+        return Response([
+            {
+                "id": livreur_id,
+                "livreur": noms[livreur_id].username if livreur_id in noms else None,
+                "distance_m": round(distance),
+                "lat": grille.positions[livreur_id][0] if livreur_id in grille.positions else None,
+                "long": grille.positions[livreur_id][1] if livreur_id in grille.positions else None,
+            }
+            for livreur_id, distance in resultats
+        ])
+
+    @action(detail=False, methods=['get', 'post'], url_path='dispatch', query_budget=20)
+    def dispatch_auto(self, request):
+        """
+        POST : répartit les commandes en attente (les DISPATCH_COMMANDES_MAX
+        plus anciennes) sur les livreurs disponibles (coût total minimal).
+        Le dispatch réel tourne hors de la requête : 202, puis GET pour l'état
+        et le résultat du dernier dispatch. dry_run calcule le plan sur place.
+        Body JSON optionnel: { "dry_run": true, "critere": "distance" | "duree" }
+        """
+        if request.method == 'GET':
+            return Response(etat_dispatch() or {"etat": "aucun"})
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        critere = request.data.get('critere')
+        if critere not in (None, 'distance', 'duree'):
+            return Response({"error": "critere doit valoir 'distance' ou 'duree'"}, status=status.HTTP_400_BAD_REQUEST)
+        if dry_run:
+            plan = dispatcher(
+                appliquer=False, critere=critere, limite=getattr(settings, 'DISPATCH_COMMANDES_MAX', 1000)
+            )
+            return Response({"dry_run": True, **plan.as_dict()})
+        if not lancer_dispatch(critere):
+            return Response({"error": "Un dispatch est déjà en cours"}, status=status.HTTP_409_CONFLICT)
+        return Response({"dry_run": False, **etat_dispatch()}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser], query_budget=None)
+    def import_commandes(self, request):
+        """
+        Import en masse depuis un fichier CSV ou NDJSON (multipart).
+        Champs: fichier, format_fichier ("csv" | "ndjson", sinon d'après
+        l'extension), dry_run (valider sans rien enregistrer).
+        Renvoie le rapport : lignes importées, erreurs par ligne, débit.
+        """
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return Response({"error": "Fichier manquant (champ 'fichier')"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            format_fichier = format_du_fichier(fichier.name, request.data.get('format_fichier'))
+        except FormatInvalide as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        rapport = importer_commandes(fichier, format_fichier, dry_run=dry_run)
+        return Response(rapport.as_dict(), status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_commandes(self, request):
+        """
+        Export en flux de toutes les commandes filtrées (filtres de la liste,
+        ?fields= / ?exclude=), sans pagination ni chargement en mémoire.
+        Query params: ?sortie=csv|ndjson (défaut csv) ; compressé en gzip
+        si le client l'accepte (Accept-Encoding).
+        """
+        try:
+            sortie = format_export(request.query_params.get('sortie', 'csv'))
+        except FormatInvalide as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        gzip = accepte_gzip(request.META.get('HTTP_ACCEPT_ENCODING'))
+        corps = exporter_commandes(self.filter_queryset(self.get_queryset()), sortie, self.champs_demandes(), gzip)
+        response = StreamingHttpResponse(corps, content_type=FORMATS_EXPORT[sortie])
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = f'attachment; filename="commandes-{timezone.now():%Y%m%d-%H%M}.{sortie}"'
+        response['X-Accel-Buffering'] = 'no'  # nginx : ne pas bufferiser le flux
+        return response
+
+    @action(detail=False, methods=['get'])
+    def recherche(self, request):
+        """
+        Autocomplétion : commandes les plus récentes dont le tracking_id, le
+        client, le téléphone ou l'adresse contiennent tous les termes de ?q=
+        (3 caractères au moins par terme). Index plein texte, voir logistics/recherche.py.
+        Query params: ?q=ahmed 0612&limit=20 (max 100), filtres de la liste, ?fields=
+        """
+        try:
+            limite = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            limite = 20
+        champs = self.champs_demandes() or CHAMPS_RESULTAT
+        commandes = rechercher(self.filter_queryset(self.get_queryset()), request.query_params.get('q', ''), limite)
+        lignes = commandes_rapides.lignes(commandes, champs)[:limite]
+        return Response(commandes_rapides.serialiser(lignes, champs))
+
+    @action(detail=False, methods=['get', 'post'], query_budget=10)
+    def zones(self, request):
+        """
+        Zones de livraison des commandes en attente (centres et commandes).
+        POST : met à jour les zones à partir des précédentes.
+        Body JSON optionnel: { "depuis_zero": true } pour tout recalculer.
+        """
+        if request.method == 'POST':
+            depuis_zero = str(request.data.get('depuis_zero', '')).lower() in ('1', 'true')
+            zonage = mettre_a_jour_zones(depuis_zero=depuis_zero)
+        else:
+            zonage = zonage_courant()
+        return Response(zonage.as_dict())
     
@@ -0,0 +1,122 @@
+"""
+Flux temps réel des positions des livreurs pour la carte admin (SSE).
+
+Une seule connexion EventSource remplace le polling de
+/api/admin/livreurs/<id>/location/ pour chaque livreur. Le flux lit la table
+live partagée (live_positions) et n'envoie, à intervalle borné, que les
+livreurs dont la position a changé depuis le dernier envoi (deltas coalescés).
+
+A servir via ASGI (logistic.asgi) : sous WSGI la réponse reste correcte mais
+occupe un thread par connexion.
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .live_positions import get_store
+
+User = get_user_model()
+
+
+def _authentifier(request):
+    """
+    EventSource ne sait pas envoyer d'en-tête Authorization :
+    le token JWT est accepté en en-tête ou en ?token=.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else request.GET.get('token')
+    if not raw:
+        return None
+    try:
+        user = auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, TokenError):
+        return None
+    if getattr(user, 'role', '') not in ['ADMIN', 'GESTIONNAIRE']:
+        return None
+    return user
+
+
+def _parse_bbox(valeur):
+    """ ?bbox=lat_min,lng_min,lat_max,lng_max (viewport de la carte) """
+    if not valeur:
+        return None
+    lat_min, lng_min, lat_max, lng_max = (float(v) for v in valeur.split(','))
+    return lat_min, lng_min, lat_max, lng_max
+
+
+def _ids_livreurs():
+    return np.array(list(User.objects.filter(role='LIVREUR').values_list('id', flat=True)), dtype=np.int64)
+
+
+async def _evenements(bbox, intervalle):
+    store = get_store()
+    capacite = store.capacity
+    ids = await sync_to_async(_ids_livreurs)()
+    ids = ids[ids < capacite]
+    ids_date = time.monotonic()
+    vues = np.zeros(capacite, dtype=np.uint32)  # versions déjà envoyées
+    dernier_envoi = time.monotonic()
+
+    yield f"retry: {int(intervalle * 2000)}\n\n"
+    while True:
+        # La liste des livreurs change rarement : on la relit toutes les minutes
+        if time.monotonic() - ids_date > 60:
+            ids = await sync_to_async(_ids_livreurs)()
+            ids = ids[ids < capacite]
+            ids_date = time.monotonic()
+
+        versions = store.slots['version'][ids]
+        changes = ids[versions != vues[ids]]
+        positions = []
+        for livreur_id in changes.tolist():
+            position = store.read(livreur_id)
+            if position is None:
+                continue
+            vues[livreur_id] = position.version
+            if bbox and not (bbox[0] <= position.lat <= bbox[2] and bbox[1] <= position.lng <= bbox[3]):
+                continue
+            positions.append([livreur_id, round(position.lat, 6), round(position.lng, 6), position.timestamp])
+
+        if positions:
+            data = json.dumps({'t': time.time(), 'positions': positions}, separators=(',', ':'))
+            yield f"event: positions\ndata: {data}\n\n"
+            dernier_envoi = time.monotonic()
+        elif time.monotonic() - dernier_envoi > 15:
+            # Commentaire SSE : garde la connexion ouverte à travers les proxys
+            yield ": ping\n\n"
+            dernier_envoi = time.monotonic()
+
+        await asyncio.sleep(intervalle)
+
+
+async def flux_positions_livreurs(request):
+    """
+    GET /api/admin/livreurs/flux/?token=<access>&bbox=33.95,-6.90,34.05,-6.80&intervalle=1
+
+    Le premier événement contient toutes les positions connues (du viewport),
+    les suivants uniquement celles qui ont changé. Chaque événement `positions`
+    porte une liste de [livreur_id, lat, lng, timestamp].
+    """
+    user = await sync_to_async(_authentifier)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentification admin requise'}, status=401)
+    try:
+        bbox = _parse_bbox(request.GET.get('bbox'))
+        minimum = getattr(settings, 'LIVE_STREAM_INTERVALLE_MIN', 0.5)
+        intervalle = max(minimum, float(request.GET.get('intervalle', getattr(settings, 'LIVE_STREAM_INTERVALLE', 1.0))))
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres bbox/intervalle invalides'}, status=400)
+
+    response = StreamingHttpResponse(_evenements(bbox, intervalle), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx : ne pas bufferiser le flux
+    return response